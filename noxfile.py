@@ -152,7 +152,9 @@ def mypy(session: Session) -> None:
     """Type-check using mypy."""
     args = session.posargs or ["src", "tests", "docs/conf.py"]
     session.install(".")
-    session.install("mypy", "pytest", "types-PyYAML", "types-setuptools")
+    session.install(
+        "mypy", "pytest", "types-PyYAML", "types-openpyxl", "types-setuptools"
+    )
     # NOTE mypy --install-types fails on Github automated tests.
     # Instead, manually add type packages to session.install line above,
     # or if they don't exist for a module, add stanza to ignore this module
@@ -5,6 +5,7 @@ import importlib.resources as pkg_resources
 import os
 import sqlite3
 import sys
+import uuid
 from typing import Any
 from typing import Optional
 
@@ -16,8 +17,13 @@ from yarm.helpers import abort
 from yarm.helpers import msg_with_data
 from yarm.helpers import success
 from yarm.helpers import warn
+from yarm.manifest import save_manifest
+from yarm.manifest import start_manifest
 from yarm.queries import run_queries
+from yarm.rerun import save_run_state
 from yarm.settings import Settings
+from yarm.sql_functions import register_sql_functions
+from yarm.stats import export_query_stats
 from yarm.tables import create_tables
 from yarm.validate import validate_config
 
@@ -64,6 +70,25 @@ For more options:
     show_default=True,
     help="If output files exist, force overwrites without asking.",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    show_default=True,
+    help="Run up to this many independent queries at once.",
+)
+@click.option(
+    "--query-stats/--no-query-stats",
+    default=False,
+    show_default=True,
+    help="Save time, rows and query plan for each query, and flag slow queries.",
+)
+@click.option(
+    "--explain-rerun/--no-explain-rerun",
+    default=False,
+    show_default=True,
+    help="Show why each query runs again, or reuses its results from the last run.",
+)
 @click.option(
     "-v", "--verbose", "verbose", count=True, default=0, help="Verbosity level."
 )
@@ -80,6 +105,9 @@ def run(
     verbose: Optional[int],
     database: Optional[bool],
     force: Optional[bool],
+    jobs: int,
+    query_stats: bool,
+    explain_rerun: bool,
 ) -> None:
     """Run the report."""
     s = Settings()
@@ -94,18 +122,34 @@ def run(
             abort(s.MSG_MAX_VERBOSE_ERROR, data=max_verbose)
         else:
             msg_with_data("Verbosity level", str(verbose))
+    if jobs < 1:
+        abort(s.MSG_JOBS_ERROR, data=str(jobs))
 
     config: Nob = Nob(validate_config(config_path).data)
+    if explain_rerun and s.KEY_CACHE__DIR not in config:
+        warn(s.MSG_RERUN_NO_CACHE)
 
-    # Create a temporary sqlite database
+    # Create a temporary sqlite database.
+    # It lives in memory, but it has a name, so that worker threads can
+    # open their own connections to it. See yarm.queries.run_queries_parallel()
+    database_uri: str = s.DATABASE_URI.format(uuid.uuid4().hex)
+    if ctx is not None:  # pragma: no branch
+        ctx.meta[s.META_DATABASE_URI] = database_uri
     try:
-        conn = sqlite3.connect(":memory:")
+        conn = sqlite3.connect(database_uri, uri=True)
+        register_sql_functions(conn, config)
+        start_manifest(config)
 
         create_tables(conn, config)
 
         run_queries(conn, config)
 
+        export_query_stats(config)
+
         export_database(conn, config)
+        save_manifest(config)
+
+        save_run_state(config)
     except sqlite3.Error as error:
         abort(
             s.MSG_SQLITE_ERROR, error=str(error), suggest_verbose=3
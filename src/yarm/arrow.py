@@ -0,0 +1,321 @@
+"""Write Parquet and Feather files through Arrow, with :data:`output: arrow`."""
+import os
+from contextlib import contextmanager
+from contextlib import suppress
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from nob.nob import Nob
+from pandas.core.frame import DataFrame
+
+from yarm.helpers import abort
+from yarm.manifest import output_file
+from yarm.settings import Settings
+
+
+def import_pyarrow() -> Any:
+    """Import pyarrow, which is only needed to export Parquet or Feather.
+
+    Returns:
+        The pyarrow module, with :mod:`pyarrow.parquet` and :mod:`pyarrow.ipc`
+        imported too
+    """
+    s = Settings()
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        abort(s.MSG_PYARROW_MISSING, ps=s.MSG_PYARROW_MISSING_PS)
+    return pyarrow
+
+
+def get_arrow_option(config: Nob, key: str, ext: str) -> Any:
+    """Return an option for Parquet and Feather output.
+
+    Args:
+        config: Report configuration
+        key: Option under :data:`output: arrow`, e.g. :data:`"compression"`
+        ext: Export format, one of :data:`ARROW_EXPORT_FORMATS`
+
+    Returns:
+        Value of the option, or its default for this format
+    """
+    s = Settings()
+    path: str = f"{s.KEY_OUTPUT__ARROW}/{key}"
+    if path in config:
+        return config[path][:]
+    return s.ARROW_DEFAULTS[ext][key]
+
+
+def open_arrow_file(
+    pa: Any, config: Nob, filename: str, ext: str, schema: Any
+) -> Any:
+    """Open a Parquet or Feather file for writing.
+
+    Args:
+        pa: The pyarrow module (see :func:`import_pyarrow`)
+        config: Report configuration
+        filename: Path to output file
+        ext: Export format, one of :data:`ARROW_EXPORT_FORMATS`
+        schema: Arrow schema for every batch written
+
+    Returns:
+        Arrow writer
+    """
+    compression: Optional[str] = get_arrow_option(config, "compression", ext)
+    if compression == "none":
+        compression = None
+    if ext == "parquet":
+        return pa.parquet.ParquetWriter(
+            filename,
+            schema,
+            compression=compression or "none",
+            use_dictionary=bool(get_arrow_option(config, "dictionary", ext)),
+        )
+    # Feather (version 2) is the Arrow IPC file format.
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    return pa.ipc.new_file(filename, schema, options=options)
+
+
+@contextmanager
+def open_arrow(
+    config: Nob, filename: str, ext: str, name: str
+) -> Iterator[Callable[[Any], None]]:
+    """Open a Parquet or Feather file, and write data to it one chunk at a time.
+
+    Each column's type is taken from the chunks, but a chunk with no values in
+    a column says nothing about its type. So chunks are held back until every
+    column has had a value, or until :data:`ARROW_SCHEMA_ROWS` rows are held.
+    Then the file is created with the types from those chunks (see
+    :func:`merge_arrow_schemas`), and each later chunk is converted to them.
+
+    Usage::
+
+        with open_arrow(config, filename, "parquet", name) as write:
+            for df in chunks:
+                write(df)
+
+    Args:
+        config: Report configuration
+        filename: Path to output file
+        ext: Export format, one of :data:`ARROW_EXPORT_FORMATS`
+        name: Name of table or query, for error messages
+
+    Yields:
+        Function that writes one chunk (see :func:`to_arrow_table`)
+
+    Note:
+        If an error stops the export, the incomplete file is removed.
+    """
+    s = Settings()
+    pa: Any = import_pyarrow()
+    row_group_size: int = int(get_arrow_option(config, "row_group_size", ext))
+    writer: Any = None
+    schema: Any = None
+    pending: List[Any] = []
+
+    with output_file(config, filename) as path:
+
+        def open_file():
+            nonlocal writer, schema
+            schema = nulls_as_text(pa, schema)
+            writer = open_arrow_file(pa, config, path, ext, schema)
+            for table in pending:
+                table = cast_arrow_table(pa, table, schema, name)
+                write_arrow_table(writer, table, ext, row_group_size)
+            pending.clear()
+
+        def write(df: Any):
+            nonlocal schema
+            table: Any = to_arrow_table(pa, df, name)
+            if writer is None:
+                pending.append(table)
+                schema = merge_arrow_schemas(pa, schema, table.schema)
+                rows: int = sum(len(table) for table in pending)
+                if rows >= s.ARROW_SCHEMA_ROWS or not has_null_fields(pa, schema):
+                    open_file()
+            else:
+                table = cast_arrow_table(pa, table, schema, name)
+                write_arrow_table(writer, table, ext, row_group_size)
+
+        try:
+            yield write
+            if pending:
+                open_file()
+        except BaseException:
+            discard_arrow_file(writer, path)
+            raise
+        if writer is not None:
+            writer.close()
+
+
+def discard_arrow_file(writer: Any, path: str):
+    """Close and remove an incomplete Parquet or Feather file, ignoring errors.
+
+    Args:
+        writer: Arrow writer, or :data:`None` if the file was never created
+        path: Path to output file
+    """
+    if writer is not None:
+        with suppress(Exception):
+            writer.close()
+    with suppress(OSError):
+        os.remove(path)
+
+
+def write_arrow_table(writer: Any, table: Any, ext: str, row_group_size: int):
+    """Write one chunk to a Parquet or Feather file.
+
+    Args:
+        writer: Arrow writer (see :func:`open_arrow_file`)
+        table: Chunk of data, with the file's column types
+        ext: Export format, one of :data:`ARROW_EXPORT_FORMATS`
+        row_group_size: Value of :data:`output: arrow: row_group_size`
+    """
+    if ext == "parquet":
+        writer.write_table(table, row_group_size=row_group_size)
+    else:
+        writer.write_table(table, max_chunksize=row_group_size)
+
+
+def to_arrow_table(pa: Any, df: Any, name: str) -> Any:
+    """Convert a chunk of data to an Arrow table.
+
+    Args:
+        pa: The pyarrow module (see :func:`import_pyarrow`)
+        df: Chunk of data, as a dataframe or as a tuple of
+            :data:`(column names, list of rows)`
+        name: Name of table or query, for error messages
+
+    Returns:
+        Arrow table, with the column types of this chunk alone
+    """
+    s = Settings()
+    try:
+        if isinstance(df, DataFrame):
+            return pa.Table.from_pandas(df, preserve_index=False)
+        columns, rows = df
+        arrays: List[Any] = [
+            pa.array([row[i] for row in rows]) for i in range(len(columns))
+        ]
+        return pa.Table.from_arrays(arrays, names=columns)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        abort(
+            s.MSG_ARROW_EXPORT_ERROR,
+            data=name,
+            error=str(e),
+            ps=s.MSG_ARROW_EXPORT_PS,
+        )
+
+
+def merge_arrow_schemas(pa: Any, schema: Any, new: Any) -> Any:
+    """Combine the column types of the chunks held so far with another chunk.
+
+    A column with no values (type null) takes the other chunk's type, and a
+    column of integers becomes floating point if the other chunk has floats.
+    Otherwise the types so far are kept.
+
+    Args:
+        pa: The pyarrow module (see :func:`import_pyarrow`)
+        schema: Column types so far, or :data:`None` for the first chunk
+        new: Column types of the next chunk
+
+    Returns:
+        Column types for every chunk so far
+    """
+    if schema is None:
+        return new
+    fields: List[Any] = []
+    for i, field in enumerate(schema):
+        new_type: Any = new.field(i).type
+        if pa.types.is_null(field.type) or (
+            pa.types.is_integer(field.type) and pa.types.is_floating(new_type)
+        ):
+            field = field.with_type(new_type)
+        fields.append(field)
+    if all(field.equals(schema.field(i)) for i, field in enumerate(fields)):
+        return schema
+    # pandas metadata would still describe the old types.
+    return pa.schema(fields)
+
+
+def has_null_fields(pa: Any, schema: Any) -> bool:
+    """Return whether any column has had no values so far.
+
+    Args:
+        pa: The pyarrow module (see :func:`import_pyarrow`)
+        schema: Column types so far
+
+    Returns:
+        True if any column has type null
+    """
+    return any(pa.types.is_null(field.type) for field in schema)
+
+
+def nulls_as_text(pa: Any, schema: Any) -> Any:
+    """Give type string to every column that has had no values.
+
+    Args:
+        pa: The pyarrow module (see :func:`import_pyarrow`)
+        schema: Column types so far
+
+    Returns:
+        Column types for the file
+    """
+    if not has_null_fields(pa, schema):
+        return schema
+    fields: List[Any] = [
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    ]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def cast_arrow_table(pa: Any, table: Any, schema: Any, name: str) -> Any:
+    """Convert a chunk to the column types of the file.
+
+    A column with no values, or integers in a column of floats, are converted.
+    Any other difference stops the report, rather than, e.g., quietly saving
+    numbers as text.
+
+    Args:
+        pa: The pyarrow module (see :func:`import_pyarrow`)
+        table: Chunk of data, from :func:`to_arrow_table`
+        schema: Column types of the file
+        name: Name of table or query, for error messages
+
+    Returns:
+        Arrow table, with the same column types as the file
+    """
+    s = Settings()
+    if table.schema.equals(schema, check_metadata=False):
+        return table
+    for i, field in enumerate(table.schema):
+        expected: Any = schema.field(i)
+        if not (
+            field.type.equals(expected.type)
+            or pa.types.is_null(field.type)
+            or (
+                pa.types.is_integer(field.type)
+                and pa.types.is_floating(expected.type)
+            )
+        ):
+            abort(
+                s.MSG_ARROW_EXPORT_ERROR,
+                data=name,
+                error=f"{field.name}: {field.type}, not {expected.type}",
+                ps=s.MSG_ARROW_EXPORT_PS,
+            )
+    try:
+        return table.cast(schema)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        abort(
+            s.MSG_ARROW_EXPORT_ERROR,
+            data=name,
+            error=str(e),
+            ps=s.MSG_ARROW_EXPORT_PS,
+        )
@@ -0,0 +1,342 @@
+"""Cache query results on disk, between runs of a report."""
+import glob
+import hashlib
+import json
+import os
+import pickle  # noqa: S403
+import re
+import threading
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import pandas as pd
+from click import get_current_context
+from nob.nob import Nob
+from nob.nob import NobView
+from pandas.core.frame import DataFrame
+
+from yarm.engines import get_engine
+from yarm.helpers import get_table_references
+from yarm.helpers import msg_with_data
+from yarm.helpers import warn
+from yarm.rerun import record_query_state
+from yarm.settings import Settings
+
+
+def cache_enabled(config: Nob) -> bool:
+    """Return :data:`True` if the query cache is configured.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        True if :data:`cache:` is set
+    """
+    s = Settings()
+    return s.KEY_CACHE__DIR in config
+
+
+def hash_df(df: DataFrame) -> str:
+    """Return a fingerprint for the contents of a DataFrame.
+
+    Args:
+        df: Data to fingerprint
+
+    Returns:
+        Hex digest that changes if any column name, type, or value changes
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(json.dumps([str(dtype) for dtype in df.dtypes]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def hash_files(paths: List[str]) -> str:
+    """Return a fingerprint for the contents of several files.
+
+    Args:
+        paths: Files to fingerprint, in order
+
+    Returns:
+        Hex digest that changes if any file changes
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def get_fingerprints() -> Dict[str, str]:
+    """Return the fingerprints of every table and query so far in this run.
+
+    Returns:
+        Dictionary of :data:`{name: fingerprint}`
+
+    See Also:
+        - :func:`save_fingerprint`
+    """
+    s = Settings()
+    ctx = get_current_context()
+    return ctx.meta.setdefault(s.META_FINGERPRINTS, {})  # type: ignore
+
+
+def save_fingerprint(name: str, fingerprint: str):
+    """Record the fingerprint of a table or query in the database.
+
+    Note:
+        For a table, the fingerprint is a hash of its data (see :func:`hash_df`).
+        For a query, it is the query's cache key, which already covers everything
+        that could change its results (see :func:`get_query_cache_key`).
+
+    Args:
+        name: Table or query name
+        fingerprint: Fingerprint for its contents
+    """
+    get_fingerprints()[name] = fingerprint
+
+
+def save_table_fingerprint(config: Nob, table_name: str, df: DataFrame):
+    """Record the fingerprint of a table, if the query cache is configured.
+
+    Args:
+        config: Report configuration
+        table_name: Table name
+        df: Table data, as it will be saved to the database
+    """
+    if cache_enabled(config):
+        save_fingerprint(table_name, hash_df(df))
+
+
+def save_temp_table_fingerprint(config: Nob, name: str, sql: str):
+    """Record the fingerprint of a temp table, if the query cache is configured.
+
+    A temp table's fingerprint covers its SQL and the fingerprints of the
+    tables it reads, so it changes whenever its contents could.
+
+    Args:
+        config: Report configuration
+        name: Temp table name
+        sql: SQL statement for this temp table
+    """
+    s = Settings()
+    if not cache_enabled(config):
+        return
+    fingerprints: Dict[str, str] = get_fingerprints()
+    names: List[str] = list(config[s.KEY_TABLES_CONFIG].keys())
+    names += [n for n in get_temp_table_names(config) if n in fingerprints]
+    references: List[str] = get_table_references(sql, names)
+    if all(ref in fingerprints for ref in references):
+        parts: list = [
+            normalize_sql(sql),
+            [[ref, fingerprints[ref]] for ref in references],
+        ]
+        save_fingerprint(name, hashlib.sha256(json.dumps(parts).encode()).hexdigest())
+
+
+def get_temp_table_names(config: Nob) -> List[str]:
+    """Return the names of the temp tables, in config order.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Names in :data:`temp_tables:`, or an empty list
+    """
+    s = Settings()
+    if s.KEY_TEMP_TABLES not in config or config[s.KEY_TEMP_TABLES][:] is None:
+        return []
+    return list(config[s.KEY_TEMP_TABLES].keys())
+
+
+def normalize_sql(sql: str) -> str:
+    """Normalize whitespace in SQL, so that cosmetic edits keep the same key.
+
+    Args:
+        sql: SQL statement
+
+    Returns:
+        SQL with runs of spaces and blank lines collapsed, and no final semicolon
+    """
+    sql = re.sub(r"[ \t]+", " ", sql)
+    sql = re.sub(r"\s*\n\s*", "\n", sql)
+    return sql.strip().rstrip(";").strip()
+
+
+def get_query_cache_key(
+    config: Nob, query: NobView, sql: str, name: str
+) -> Optional[str]:
+    """Build the cache key for a query.
+
+    The key covers everything that could change the query's results:
+
+    - The SQL, with whitespace normalized (see :func:`normalize_sql`)
+    - The :data:`engine:` that runs it
+    - The :data:`params:` bound to the SQL, if any
+    - The :data:`map:` settings, and the contents of each mapping file
+    - The :data:`replace:` rules, in order
+    - The :data:`postprocess:` function name
+    - The source of every module in :data:`import:`
+    - The fingerprints of the tables and queries that the SQL refers to
+
+    Args:
+        config: Report configuration
+        query: Configuration for this query
+        sql: SQL statement for this query
+        name: Name for this query
+
+    Returns:
+        Cache key, or :data:`None` if the cache is off, or if the query refers
+        to a table with no fingerprint (e.g. a table that was empty)
+    """
+    s = Settings()
+    if not cache_enabled(config):
+        return None
+
+    fingerprints: Dict[str, str] = get_fingerprints()
+    names: List[str] = list(config[s.KEY_TABLES_CONFIG].keys())
+    names += get_temp_table_names(config)
+    queries = config[s.KEY_QUERIES]
+    names += [queries[i][s.KEY_QUERY__NAME][:] for i, _val in enumerate(queries)]
+    references: List[str] = [
+        ref for ref in get_table_references(sql, names) if ref != name
+    ]
+    missing: List[str] = [ref for ref in references if ref not in fingerprints]
+    if missing:
+        msg_with_data(
+            s.MSG_CACHE_UNCACHEABLE, data=", ".join(missing), indent=1, verbose=1
+        )
+        return None
+
+    imports: List[str] = []
+    if s.KEY_IMPORT in config:
+        modules = config[s.KEY_IMPORT]
+        imports = [modules[i][s.KEY_MODULE__PATH][:] for i, _val in enumerate(modules)]
+
+    parts: dict = {
+        "sql": normalize_sql(sql),
+        "engine": get_engine(config),
+        "params": None,
+        "map": None,
+        "replace": None,
+        "postprocess": None,
+        "imports": hash_files(imports),
+        "tables": [[ref, fingerprints[ref]] for ref in references],
+    }
+    if s.KEY_QUERY__PARAMS in query:
+        parts["params"] = query[s.KEY_QUERY__PARAMS][:]
+    if s.KEY_MAP in query:
+        maps: list = query[s.KEY_MAP][:]
+        parts["map"] = [maps, hash_files([mapping["path"] for mapping in maps])]
+    if s.KEY_QUERY__REPLACE in query:
+        parts["replace"] = query[s.KEY_QUERY__REPLACE][:]
+    if s.KEY_QUERY__POSTPROCESS in query:
+        parts["postprocess"] = query[s.KEY_QUERY__POSTPROCESS][:]
+
+    record_query_state(name, parts)
+
+    # NOTE Do not sort keys: the order of replace: rules matters.
+    key_json: str = json.dumps(parts, default=str)
+    return hashlib.sha256(key_json.encode()).hexdigest()
+
+
+def get_cache_path(config: Nob, key: str) -> str:
+    """Return path to the cache file for a key.
+
+    Args:
+        config: Report configuration
+        key: Cache key
+
+    Returns:
+        Path to cache file
+    """
+    s = Settings()
+    cache_dir: str = os.fspath(config[s.KEY_CACHE__DIR][:])
+    return os.path.join(cache_dir, f"{key}{s.CACHE_FILE_EXT}")
+
+
+def load_cached_query(config: Nob, key: str, name: str) -> Optional[DataFrame]:
+    """Load query results from the cache.
+
+    Args:
+        config: Report configuration
+        key: Cache key (see :func:`get_query_cache_key`)
+        name: Name for this query
+
+    Returns:
+        Cached results, or :data:`None` on a cache miss
+    """
+    s = Settings()
+    path: str = get_cache_path(config, key)
+    if not os.path.isfile(path):
+        msg_with_data(s.MSG_CACHE_MISS, data=name, indent=1, verbose=1)
+        return None
+    try:
+        # NOTE We only unpickle files that we wrote to the user's own cache dir.
+        df: DataFrame = pd.read_pickle(path)  # noqa: S301
+        # Mark as recently used, for evict_cache().
+        os.utime(path)
+    except (OSError, EOFError, pickle.UnpicklingError) as error:
+        warn(s.MSG_CACHE_READ_ERROR, data=name, error=str(error), indent=1)
+        return None
+    msg_with_data(s.MSG_CACHE_HIT, data=name, indent=1, verbose=1)
+    return df
+
+
+def save_cached_query(config: Nob, key: str, name: str, df: DataFrame):
+    """Save query results to the cache, then evict old results if needed.
+
+    Args:
+        config: Report configuration
+        key: Cache key (see :func:`get_query_cache_key`)
+        name: Name for this query
+        df: Query data after all processing
+    """
+    s = Settings()
+    path: str = get_cache_path(config, key)
+    # Write to a temporary file first, so that a cache file is never incomplete.
+    tmp_path: str = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as error:
+        warn(s.MSG_CACHE_WRITE_ERROR, data=name, error=str(error), indent=1)
+        return
+    evict_cache(config)
+
+
+def evict_cache(config: Nob):
+    """Remove the least recently used results until the cache fits in max_size.
+
+    Args:
+        config: Report configuration
+    """
+    s = Settings()
+    max_size: int = s.CACHE_MAX_SIZE
+    if s.KEY_CACHE__MAX_SIZE in config:
+        max_size = config[s.KEY_CACHE__MAX_SIZE][:]
+    max_bytes: int = max_size * 1024 * 1024
+
+    cache_dir: str = os.fspath(config[s.KEY_CACHE__DIR][:])
+    entries: list = []
+    for path in glob.glob(os.path.join(cache_dir, f"*{s.CACHE_FILE_EXT}")):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:  # pragma: no cover
+            # Another thread has already removed it.
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total: int = sum(size for _mtime, size, _path in entries)
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            msg_with_data(s.MSG_CACHE_EVICTED, data=path, indent=1, verbose=2)
+        except FileNotFoundError:  # pragma: no cover
+            pass
+        total -= size
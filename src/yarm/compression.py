@@ -0,0 +1,205 @@
+"""Compress CSV output, with :data:`output: compression`."""
+import gzip
+import lzma
+import queue
+import threading
+from contextlib import contextmanager
+from typing import IO
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import cast
+
+from nob.nob import Nob
+
+from yarm.helpers import abort
+from yarm.manifest import output_file
+from yarm.settings import Settings
+
+
+def get_compression(config: Nob) -> Optional[str]:
+    """Return the compression for CSV output.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`output: compression`, or :data:`None` if not set
+    """
+    s = Settings()
+    if s.KEY_OUTPUT__COMPRESSION in config:
+        return str(config[s.KEY_OUTPUT__COMPRESSION][:])
+    return None
+
+
+def get_compression_level(config: Nob, compression: str) -> int:
+    """Return the compression level for CSV output.
+
+    Args:
+        config: Report configuration
+        compression: One of :data:`COMPRESSION_EXTS`
+
+    Returns:
+        Value of :data:`output: compression_level`, or the default for
+        :data:`compression`
+    """
+    s = Settings()
+    if s.KEY_OUTPUT__COMPRESSION_LEVEL in config:
+        return int(config[s.KEY_OUTPUT__COMPRESSION_LEVEL][:])
+    return s.COMPRESSION_LEVELS[compression][2]
+
+
+def get_compression_ext(config: Nob) -> str:
+    """Return the extension added after ``.csv`` for compressed output.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Extension such as ``.gz``; empty if CSV output is not compressed
+    """
+    s = Settings()
+    compression: Optional[str] = get_compression(config)
+    return s.COMPRESSION_EXTS[compression] if compression else ""
+
+
+def import_zstandard() -> Any:
+    """Import zstandard, which is only needed for :data:`compression: zstd`.
+
+    Returns:
+        The zstandard module
+    """
+    s = Settings()
+    try:
+        import zstandard
+    except ImportError:
+        abort(s.MSG_ZSTANDARD_MISSING, ps=s.MSG_ZSTANDARD_MISSING_PS)
+    return zstandard
+
+
+def open_compressed(filename: str, compression: str, level: int) -> IO[bytes]:
+    """Open a file for writing, compressing everything written to it.
+
+    Args:
+        filename: Path to compressed file
+        compression: One of :data:`COMPRESSION_EXTS`
+        level: Compression level
+
+    Returns:
+        Binary file object; closing it also closes the file
+    """
+    # NOTE GzipFile and LZMAFile are binary files, but not typed as IO[bytes].
+    if compression == "gzip":
+        # With no timestamp, the same CSV always compresses to the same bytes.
+        gz = gzip.GzipFile(filename, "wb", compresslevel=level, mtime=0)
+        return cast(IO[bytes], gz)
+    if compression == "xz":
+        return cast(IO[bytes], lzma.open(filename, "wb", preset=level))
+    zstandard: Any = import_zstandard()
+    compressor = zstandard.ZstdCompressor(level=level)
+    return compressor.stream_writer(open(filename, "wb"))
+
+
+@contextmanager
+def open_csv(config: Nob, filename: str) -> Iterator[Callable[[str], Any]]:
+    """Open a CSV for writing, compressed if :data:`output: compression` is set.
+
+    Compression runs in a background thread, so that the next rows can be
+    formatted while the last ones are compressed and written.
+    At most :data:`CSV_COMPRESSION_QUEUE` blocks of text wait to be compressed.
+
+    Usage::
+
+        with open_csv(config, filename) as write:
+            write(df.to_csv(index=False))
+
+    Args:
+        config: Report configuration
+        filename: Path to CSV, including any compression extension
+
+    Yields:
+        Function that writes a block of CSV text
+
+    See Also:
+        - :func:`yarm.manifest.output_file`
+    """
+    compression: Optional[str] = get_compression(config)
+    with output_file(config, filename) as path:
+        if compression is None:
+            # NOTE Same newline handling as DataFrame.to_csv() with a path.
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                yield f.write
+            return
+
+        stream: IO[bytes] = open_compressed(
+            path, compression, get_compression_level(config, compression)
+        )
+        with compress_in_background(stream, filename) as write:
+            yield write
+
+
+@contextmanager
+def compress_in_background(
+    stream: IO[bytes], filename: str
+) -> Iterator[Callable[[str], None]]:
+    """Write text to a compressed stream from a background thread.
+
+    Args:
+        stream: Open compressed file (see :func:`open_compressed`)
+        filename: Path to compressed file, for error messages
+
+    Yields:
+        Function that queues a block of text for compression
+    """
+    s = Settings()
+    pending: queue.Queue = queue.Queue(maxsize=s.CSV_COMPRESSION_QUEUE)
+    errors: List[BaseException] = []
+
+    def write(text: str):
+        if errors:
+            raise errors[0]
+        pending.put(text.encode("utf-8"))
+
+    thread = threading.Thread(
+        target=compress_blocks, args=(stream, pending, errors), daemon=True
+    )
+    thread.start()
+    try:
+        yield write
+    finally:
+        pending.put(None)
+        thread.join()
+        try:
+            stream.close()
+        except Exception as error:
+            errors.append(error)
+    if errors:
+        abort(s.MSG_CSV_COMPRESSION_ERROR, error=str(errors[0]), file_path=filename)
+
+
+def compress_blocks(
+    stream: IO[bytes], pending: queue.Queue, errors: List[BaseException]
+):
+    """Write each queued block to a compressed stream, until :data:`None` arrives.
+
+    Important:
+        Intended to run in a background thread (see :func:`compress_in_background`).
+
+    Args:
+        stream: Open compressed file
+        pending: Queue of blocks to write
+        errors: Any error while writing is added here
+    """
+    while True:
+        block: Optional[bytes] = pending.get()
+        if block is None:
+            break
+        if errors:
+            # Keep emptying the queue, so the writer never waits forever.
+            continue
+        try:
+            stream.write(block)
+        except BaseException as error:  # noqa: B902
+            errors.append(error)
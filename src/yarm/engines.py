@@ -0,0 +1,187 @@
+"""Run queries in DuckDB instead of SQLite, with :data:`engine: duckdb`."""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Union
+
+from click import get_current_context
+from nob.nob import Nob
+from pandas.core.frame import DataFrame
+
+from yarm.helpers import abort
+from yarm.helpers import msg_with_data
+from yarm.settings import Settings
+from yarm.stats import time_query_step
+
+
+def get_engine(config: Nob) -> str:
+    """Return the engine that runs :data:`queries:`.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`engine:`, or :data:`ENGINE_SQLITE` if not set
+    """
+    s = Settings()
+    if s.KEY_ENGINE in config:
+        return str(config[s.KEY_ENGINE][:])
+    return s.ENGINE_SQLITE
+
+
+def duckdb_enabled(config: Nob) -> bool:
+    """Return :data:`True` if queries run in DuckDB.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        True if :data:`engine:` is :data:`duckdb`
+    """
+    s = Settings()
+    return get_engine(config) == s.ENGINE_DUCKDB
+
+
+def import_duckdb() -> Any:
+    """Import duckdb, which is only needed for :data:`engine: duckdb`.
+
+    Returns:
+        The duckdb module
+    """
+    s = Settings()
+    try:
+        import duckdb
+    except ImportError:
+        abort(s.MSG_DUCKDB_MISSING, ps=s.MSG_DUCKDB_MISSING_PS)
+    return duckdb
+
+
+def keep_engine_table(config: Nob, table_name: str, df: DataFrame):
+    """Keep a table's data, to load into DuckDB once all tables are created.
+
+    Args:
+        config: Report configuration
+        table_name: Table name
+        df: Table data, as it is saved to the SQLite database
+    """
+    s = Settings()
+    if duckdb_enabled(config):
+        ctx = get_current_context()
+        ctx.meta.setdefault(s.META_ENGINE_TABLES, {})[table_name] = df
+
+
+@contextmanager
+def query_engine(config: Nob) -> Iterator[None]:
+    """Open DuckDB with every table loaded, if :data:`engine: duckdb`.
+
+    Each table is registered as a view of its DataFrame, so DuckDB reads
+    the columns in place rather than copying them. While DuckDB is open,
+    :func:`get_duckdb` returns its connection.
+
+    Note:
+        Tables and queries are still saved to the SQLite database as well,
+        for :data:`export_tables:` and :data:`--database`.
+
+    Args:
+        config: Report configuration
+
+    Yields:
+        Nothing
+    """
+    s = Settings()
+    if not duckdb_enabled(config):
+        yield
+        return
+
+    duckdb: Any = import_duckdb()
+    ctx = get_current_context()
+    tables: Dict[str, DataFrame] = ctx.meta.pop(s.META_ENGINE_TABLES, {})
+    msg_with_data(s.MSG_DUCKDB_LOADING, data=str(len(tables)), verbose=1)
+    duck: Any = duckdb.connect(":memory:")
+    try:
+        for table_name, df in tables.items():
+            duck.register(table_name, df)
+        ctx.meta[s.META_DUCKDB] = duck
+        yield
+    finally:
+        ctx.meta.pop(s.META_DUCKDB, None)
+        duck.close()
+
+
+def get_duckdb() -> Optional[Any]:
+    """Return the DuckDB connection opened by :func:`query_engine`.
+
+    Returns:
+        DuckDB connection, or :data:`None` if queries run in SQLite
+    """
+    s = Settings()
+    ctx = get_current_context()
+    return ctx.meta.get(s.META_DUCKDB)
+
+
+def register_duckdb_query(duck: Any, name: str, df: DataFrame):
+    """Make a query's results available to later queries in DuckDB.
+
+    Note:
+        Save the query to the SQLite database first, with
+        :func:`yarm.queries.save_query_to_database`, which catches duplicate names.
+
+    Args:
+        duck: DuckDB connection
+        name: Name for this query
+        df: Query data after all processing
+    """
+    duck.register(name, df)
+
+
+def read_duckdb_query(
+    duck: Any,
+    sql: str,
+    name: str,
+    params: Optional[Union[dict, list]] = None,
+    timeout: Optional[float] = None,
+) -> DataFrame:
+    """Run a query in DuckDB, and fetch the results as a DataFrame.
+
+    DuckDB builds the DataFrame a column at a time, straight from its own
+    columns, with no Python object for each row.
+
+    Args:
+        duck: DuckDB connection
+        sql: SQL statement for this query
+        name: Name for this query
+        params: Parameters to bind to the SQL
+        timeout: Interrupt the query after this many seconds. If None, never.
+
+    Returns:
+        Initial query results
+    """
+    s = Settings()
+    duckdb: Any = import_duckdb()
+    start: float = time.monotonic()
+    timer: Optional[threading.Timer] = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, duck.interrupt)
+        timer.start()
+    try:
+        with time_query_step(name, "duckdb"):
+            return duck.execute(sql, params or None).df()
+    except duckdb.Error as error:
+        if timer is not None and not timer.is_alive():
+            abort(
+                s.MSG_QUERY_RUN_ERROR,
+                data=name,
+                error=(
+                    f"{s.MSG_QUERY_TIMED_OUT}: {time.monotonic() - start:.1f}"
+                    f" (timeout: {timeout:g})"
+                ),
+            )
+        abort(s.MSG_QUERY_RUN_ERROR, data=name, error=str(error))
+    finally:
+        if timer is not None:
+            timer.cancel()
+    return DataFrame()  # pragma: no cover
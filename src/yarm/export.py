@@ -1,29 +1,64 @@
 """Export data."""
+import csv
+import io
 import os
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextlib import suppress
 from sqlite3 import Connection
 
 # from datetime import date
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
 from typing import Tuple
 
 import pandas as pd
 from click import get_current_context
 from nob.nob import Nob
+from openpyxl import Workbook
+from openpyxl.cell import Cell
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 from pandas.core.frame import DataFrame
 
+from yarm.arrow import open_arrow
+from yarm.compression import get_compression_ext
+from yarm.compression import open_csv
 from yarm.helpers import abort
 from yarm.helpers import msg_with_data
 from yarm.helpers import overwrite_file
+from yarm.helpers import quote_identifier
+from yarm.helpers import run_in_worker
+from yarm.helpers import worker_result
+from yarm.manifest import output_file
+from yarm.manifest import set_output_rows
 from yarm.settings import Settings
+from yarm.styles import get_column_width
+from yarm.styles import get_column_widths
+from yarm.styles import merge_column_widths
+from yarm.styles import set_column_widths
 
 
 def export_database(conn: Connection, config: Nob):
     """Export database to sqlite3 database file.
 
+    The database is copied page by page with the SQLite backup API, so the
+    file holds exactly the same tables and rows as the database in memory.
+
     Args:
         conn: Temporary database in memory
         config: Report configuration
+
+    Note:
+        With :data:`output: database_page_size` or :data:`output: database_vacuum`,
+        the file is then rebuilt with ``VACUUM``, which packs each table's rows
+        together in order, so the file is smaller and compresses better.
     """
     s = Settings()
     ctx = get_current_context()
@@ -35,18 +70,61 @@ def export_database(conn: Connection, config: Nob):
 
         msg_with_data(s.MSG_CREATING_DATABASE, data=export_db, verbose=2)
 
-        try:
-            export_conn = sqlite3.connect(export_db)
-            for line in conn.iterdump():
-                export_conn.execute(line)
-        except sqlite3.Error as error:  # pragma: no cover
-            abort(s.MSG_EXPORT_DATABASE_ERROR, error=str(error))  # pragma: no cover
-        finally:
-            export_conn.close()
+        with output_file(config, export_db) as path:
+            copy_database(conn, config, path)
 
         msg_with_data(s.MSG_DATABASE_EXPORTED, data=export_db)
 
 
+def copy_database(conn: Connection, config: Nob, path: str):
+    """Copy the database to a file, with the SQLite backup API.
+
+    Args:
+        conn: Temporary database in memory
+        config: Report configuration
+        path: Path to database file (see :func:`export_database`)
+    """
+    s = Settings()
+
+    def show_progress(status: int, remaining: int, total: int):
+        msg_with_data(
+            s.MSG_DATABASE_BACKUP_PROGRESS,
+            data=f"{total - remaining}/{total}",
+            indent=1,
+            verbose=3,
+        )
+
+    export_conn = sqlite3.connect(path)
+    try:
+        conn.backup(export_conn, pages=s.DATABASE_BACKUP_PAGES, progress=show_progress)
+        page_size: int = 0
+        if s.KEY_OUTPUT__DATABASE_PAGE_SIZE in config:
+            page_size = int(config[s.KEY_OUTPUT__DATABASE_PAGE_SIZE][:])
+            export_conn.execute(f"PRAGMA page_size = {page_size}")
+        if page_size or get_database_vacuum(config):
+            msg_with_data(s.MSG_DATABASE_VACUUM, data=path, verbose=2)
+            export_conn.execute("VACUUM")
+    except sqlite3.Error as error:  # pragma: no cover
+        abort(s.MSG_EXPORT_DATABASE_ERROR, error=str(error))  # pragma: no cover
+    finally:
+        export_conn.close()
+
+
+def get_database_vacuum(config: Nob) -> bool:
+    """Return :data:`True` if the exported database should be rebuilt with VACUUM.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`output: database_vacuum`, or :data:`False` if not set
+    """
+    s = Settings()
+    if s.KEY_OUTPUT__DATABASE_VACUUM in config:
+        return bool(config[s.KEY_OUTPUT__DATABASE_VACUUM][:])
+    return False
+
+
 def get_output_dir_path(config: Nob, filename: str) -> str:
     """Get full path to filename in output dir.
 
@@ -145,6 +223,9 @@ def export_database_tables(
         defined in :data:`tables_config` *or* a **query** defined in :data:`queries:`.
         Both are saved as type :data:`table` in the database.
 
+        With :data:`output: export_workers` greater than 1, CSV files are written
+        several at once (see :func:`export_tables_csv_parallel`).
+
     Args:
         config: Report configuration
         conn: Temporary database in memory (**see note**)
@@ -156,42 +237,185 @@ def export_database_tables(
         verbose: Minimum verbosity required to show the message
     """
     s = Settings()
-    if ext in s.SCHEMA_EXPORT_FORMATS:
-        df_list = []
-        # TODO This approach queries the database, rather than our config,
-        # for the list of tables. Will this still work after we export queries
-        # to the db? Or should queries be saved as Views rather than Tables?
-        query: str = "SELECT name from sqlite_master WHERE type ='table'"
-        for table in conn.execute(query).fetchall():
-            table_name = table[0]
-            # NOTE You cannot use placeholders for table names.
-            # flake8 flags possible SQL injection here (S608), but we are iterating
-            # through table names we just pulled from the database.
-            query = "SELECT * from " + table_name  # noqa: S608
-            df = pd.read_sql(query, conn, params={"table_name": table_name})
-            df_list.append((table_name, df))
-
-        # Export depending on format.
-        if ext == "csv":
-            for table in df_list:
-                table_name = table[0]
-                df = table[1]
-                export_df_csv(
-                    config, df, table_name, msg_table_exported_csv, indent, verbose
+    if ext not in s.SCHEMA_EXPORT_FORMATS:  # pragma: no cover
+        # This path should never execute.
+        abort(s.MSG_EXPORT_FORMAT_UNRECOGNIZED, data=ext)  # pragma: no cover
+    if ext == "csv" and get_export_workers(config) > 1:
+        export_tables_csv_parallel(
+            config, conn, msg_table_exported_csv, indent, verbose
+        )
+    elif ext == "xlsx":
+        filename: str = get_output_dir_path(config, f"{export_basename}.{ext}")
+        with open_xlsx(config, filename) as writer:
+            sheets: Dict[str, int] = {}
+            for table_name in get_database_table_names(conn):
+                columns, batches = fetch_table_rows(conn, table_name)
+                sheets[table_name] = export_rows_sheet(
+                    writer,
+                    columns,
+                    batches,
+                    table_name,
+                    msg_table_exported_sheet,
+                    indent,
+                    verbose,
+                    get_column_width(config),
                 )
-        elif ext == "xlsx":  # pragma: no branch
-            export_df_list_xlsx(
-                config,
-                df_list,
-                export_basename,
-                msg_table_exported_sheet,
-                indent,
-                verbose,
+            set_output_rows(filename, sheets)
+        msg_with_data(
+            s.MSG_SHEETS_EXPORTED, data=filename, indent=indent, verbose=verbose
+        )
+    else:
+        for table_name in get_database_table_names(conn):
+            export_table(
+                config, conn, table_name, ext, msg_table_exported_csv, indent, verbose
             )
 
-    else:  # pragma: no cover
-        # This path should never execute.
-        abort(s.MSG_EXPORT_FORMAT_UNRECOGNIZED, data=ext)  # pragma: no cover
+
+def get_database_table_names(conn: Connection) -> List[str]:
+    """Return the name of each table in the database.
+
+    Args:
+        conn: Temporary database in memory
+
+    Returns:
+        Table names
+    """
+    # NOTE This approach queries the database, rather than our config,
+    # for the list of tables. Queries are saved as tables, not views
+    # (see yarm.queries.create_query_table), so that each query runs only once
+    # however often later queries read it. Tables are exported before any
+    # queries exist, so only tables from tables_config are listed here.
+    query: str = "SELECT name from sqlite_master WHERE type ='table'"
+    return [table[0] for table in conn.execute(query).fetchall()]
+
+
+def fetch_table_rows(
+    conn: Connection, name: str
+) -> Tuple[List[str], Iterator[List[tuple]]]:
+    """Read a database table straight from a cursor, a batch of rows at a time.
+
+    Args:
+        conn: Temporary database in memory
+        name: Table name, from :func:`get_database_table_names`
+
+    Returns:
+        Column names, and an iterator over batches of at most
+        :data:`EXPORT_FETCH_ROWS` rows. There is always at least one batch,
+        even if it is empty, so an empty table is still exported.
+    """
+    s = Settings()
+    # NOTE You cannot use placeholders for table names.
+    # flake8 flags possible SQL injection here (S608), but we are iterating
+    # through table names we just pulled from the database.
+    query: str = "SELECT * from " + quote_identifier(name)  # noqa: S608
+    cursor = conn.execute(query)
+    columns: List[str] = [column[0] for column in cursor.description]
+
+    def fetch_batches() -> Iterator[List[tuple]]:
+        try:
+            rows: List[tuple] = cursor.fetchmany(s.EXPORT_FETCH_ROWS)
+            yield rows
+            while rows:
+                rows = cursor.fetchmany(s.EXPORT_FETCH_ROWS)
+                if rows:
+                    yield rows
+        finally:
+            cursor.close()
+
+    return columns, fetch_batches()
+
+
+def export_table(
+    config: Nob,
+    conn: Connection,
+    name: str,
+    ext: str,
+    msg_export: str,
+    indent: int = 1,
+    verbose: int = 1,
+    overwrite: bool = True,
+):
+    """Export one database table to its own file, without loading it into pandas.
+
+    Rows are copied from the database in batches (see :func:`fetch_table_rows`),
+    so memory use stays flat however large the table is.
+
+    Args:
+        config: Report configuration
+        conn: Temporary database in memory
+        name: Table name, used as basename for output file
+        ext: Export format; any except :data:`xlsx`
+        msg_export: Confirmation message
+        indent: Number of indents before message
+        verbose: Minimum verbosity required to show the message
+        overwrite: If False, any existing CSV has already been removed
+            (see :func:`export_csv_parallel`)
+    """
+    s = Settings()
+    columns, batches = fetch_table_rows(conn, name)
+    if ext in s.ARROW_EXPORT_FORMATS:
+        export_chunks_arrow(
+            config,
+            ((columns, rows) for rows in batches),
+            name,
+            ext,
+            msg_export,
+            indent,
+            verbose,
+        )
+        return
+    filename: str = get_csv_path(config, name)
+    if overwrite:
+        overwrite_file(filename)
+    with open_csv(config, filename) as write:
+        buffer = io.StringIO()
+        # NOTE Same line endings as DataFrame.to_csv().
+        writer = csv.writer(buffer, lineterminator=os.linesep)
+        writer.writerow(columns)
+        count: int = 0
+        for rows in batches:
+            writer.writerows(rows)
+            write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            count += len(rows)
+        set_output_rows(filename, count)
+    msg_with_data(msg_export, data=filename, indent=indent, verbose=verbose)
+
+
+def export_chunks_arrow(
+    config: Nob,
+    chunks: Iterable[Any],
+    name: str,
+    ext: str,
+    msg_export: str,
+    indent: int = 1,
+    verbose: int = 1,
+):
+    """Export data to a single Parquet or Feather file, one chunk at a time.
+
+    Args:
+        config: Report configuration
+        chunks: Data to export, as one or more dataframes with the same columns,
+            or tuples of :data:`(column names, list of rows)`
+        name: Name of data, used as basename for output file
+        ext: Export format, one of :data:`ARROW_EXPORT_FORMATS`
+        msg_export: Confirmation message
+        indent: Number of indents before message
+        verbose: Minimum verbosity required to show the message
+
+    See Also:
+        - :func:`yarm.arrow.open_arrow`
+    """
+    filename = get_output_dir_path(config, f"{name}.{ext}")
+    overwrite_file(filename)
+    with open_arrow(config, filename, ext, name) as write:
+        count: int = 0
+        for df in chunks:
+            write(df)
+            count += len(df) if isinstance(df, DataFrame) else len(df[1])
+        set_output_rows(filename, count)
+    msg_with_data(msg_export, data=filename, indent=indent, verbose=verbose)
 
 
 def export_df_csv(
@@ -212,10 +436,45 @@ def export_df_csv(
         indent: Number of indents before message
         verbose: Minimum verbosity required to show the message
     """
-    ext = "csv"
-    filename = get_output_dir_path(config, f"{name}.{ext}")
-    overwrite_file(filename)
-    df.to_csv(filename, index=False)
+    export_chunks_csv(config, [df], name, msg_export, indent, verbose)
+
+
+def export_chunks_csv(
+    config: Nob,
+    chunks: Iterable[DataFrame],
+    name: str,
+    msg_export: str,
+    indent: int = 1,
+    verbose: int = 1,
+    overwrite: bool = True,
+):
+    """Export data to a single CSV, one chunk at a time.
+
+    Args:
+        config: Report configuration
+        chunks: Data to export, as one or more dataframes with the same columns
+        name: Name of data, used as basename for output CSV
+        msg_export: Confirmation message
+        indent: Number of indents before message
+        verbose: Minimum verbosity required to show the message
+        overwrite: If False, any existing CSV has already been removed
+            (see :func:`export_csv_parallel`)
+    """
+    s = Settings()
+    filename = get_csv_path(config, name)
+    if overwrite:
+        overwrite_file(filename)
+    with open_csv(config, filename) as write:
+        header: bool = True
+        count: int = 0
+        for df in chunks:
+            # Format a slice at a time, so a compressed CSV is written meanwhile.
+            for start in range(0, max(len(df), 1), s.CSV_WRITE_ROWS):
+                rows: DataFrame = df.iloc[start : start + s.CSV_WRITE_ROWS]
+                write(rows.to_csv(index=False, header=header))
+                header = False
+            count += len(df)
+        set_output_rows(filename, count)
     msg_with_data(
         msg_export,
         data=filename,
@@ -224,6 +483,345 @@ def export_df_csv(
     )
 
 
+def get_csv_path(config: Nob, name: str) -> str:
+    """Return path to the CSV for a table or query.
+
+    Args:
+        config: Report configuration
+        name: Name of table or query
+
+    Returns:
+        Full path to CSV in output dir, ending in ``.csv.gz`` etc. if compressed
+    """
+    return get_output_dir_path(config, f"{name}.csv{get_compression_ext(config)}")
+
+
+def get_export_workers(config: Nob) -> int:
+    """Return the number of CSV files to write at once.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`output: export_workers`, default 1
+    """
+    s = Settings()
+    if s.KEY_OUTPUT__EXPORT_WORKERS in config:
+        return int(config[s.KEY_OUTPUT__EXPORT_WORKERS][:])
+    return 1
+
+
+def export_csv_parallel(
+    config: Nob, names: List[str], tasks: List[Tuple[Callable, tuple]]
+):
+    """Write several CSV files at once, in a pool of threads.
+
+    Before any worker starts, each existing CSV is removed (asking first, unless
+    :data:`--force`), so no prompt ever comes from a worker.
+    Messages from each worker are collected and shown in the order of
+    :data:`tasks`, so the output is the same from run to run.
+
+    Args:
+        config: Report configuration
+        names: Names of tables or queries, one for each CSV
+        tasks: Function and its arguments for each worker
+            (**see** :func:`yarm.helpers.run_in_worker`)
+    """
+    s = Settings()
+    ctx = get_current_context()
+    for name in names:
+        overwrite_file(get_csv_path(config, name))
+    workers: int = get_export_workers(config)
+    msg_with_data(s.MSG_EXPORT_WORKERS, data=str(workers), verbose=2)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_in_worker, ctx, function, *args)
+            for function, args in tasks
+        ]
+        for future in futures:
+            worker_result(future.result())
+
+
+def export_tables_csv_parallel(
+    config: Nob,
+    conn: Connection,
+    msg_export: str,
+    indent: int = 1,
+    verbose: int = 1,
+):
+    """Export each database table to CSV, several tables at once.
+
+    Each worker reads its table on its own read-only connection to the temporary
+    database, so reading, formatting and writing overlap across tables.
+
+    Args:
+        config: Report configuration
+        conn: Temporary database in memory
+        msg_export: Confirmation message
+        indent: Number of indents before message
+        verbose: Minimum verbosity required to show the message
+    """
+    s = Settings()
+    ctx = get_current_context()
+    database_uri: str = ctx.meta[s.META_DATABASE_URI]
+    names: List[str] = get_database_table_names(conn)
+    tasks: List[Tuple[Callable, tuple]] = [
+        (
+            export_table_csv_worker,
+            (database_uri, config, name, msg_export, indent, verbose),
+        )
+        for name in names
+    ]
+    export_csv_parallel(config, names, tasks)
+
+
+def export_table_csv_worker(
+    database_uri: str,
+    config: Nob,
+    name: str,
+    msg_export: str,
+    indent: int = 1,
+    verbose: int = 1,
+):
+    """Export one database table to CSV, on a new read-only connection.
+
+    Important:
+        Intended to run in a worker thread, through
+        :func:`yarm.helpers.run_in_worker`.
+
+    Args:
+        database_uri: URI for the temporary database
+        config: Report configuration
+        name: Table name
+        msg_export: Confirmation message
+        indent: Number of indents before message
+        verbose: Minimum verbosity required to show the message
+    """
+    worker_conn: Connection = sqlite3.connect(database_uri, uri=True)
+    try:
+        worker_conn.execute("PRAGMA query_only = ON")
+        export_table(
+            config, worker_conn, name, "csv", msg_export, indent, verbose, False
+        )
+    finally:
+        worker_conn.close()
+
+
+def export_chunks_sheet(
+    writer: Any,
+    chunks: Iterable[DataFrame],
+    sheet_name: str,
+    msg_export: str,
+    indent: int = 1,
+    verbose: int = 1,
+    column_width: Any = None,
+) -> int:
+    """Export data to a single sheet in an open spreadsheet, one chunk at a time.
+
+    Args:
+        writer: Open spreadsheet (see :func:`open_xlsx`)
+        chunks: Data to export, as one or more dataframes with the same columns
+        sheet_name: Name of sheet
+        msg_export: Confirmation message
+        indent: Number of indents before message
+        verbose: Minimum verbosity required to show the message
+        column_width: Value of :data:`output: styles: column_width`, if any
+
+    Returns:
+        Number of rows exported, not counting the header
+    """
+    if isinstance(writer, Workbook):
+        count: int = append_chunks_sheet(writer, chunks, sheet_name, column_width)
+        msg_with_data(msg_export, data=sheet_name, indent=indent, verbose=verbose)
+        return count
+    startrow: int = 0
+    widths: Optional[List[float]] = None
+    for df in chunks:
+        if column_width is not None:
+            widths = merge_column_widths(widths, df, column_width)
+        header: bool = startrow == 0
+        # TODO Are there any situations where our spreadsheet needs the index?
+        # Probably not.
+        # If a table is imported into the database with include_index = True,
+        # then when it is later exported, the index is simply another column.
+        df.to_excel(
+            writer, sheet_name=sheet_name, index=False, startrow=startrow, header=header
+        )
+        startrow += len(df) + int(header)
+    if widths is not None:
+        set_column_widths(writer.sheets[sheet_name], widths)
+    msg_with_data(
+        msg_export,
+        data=sheet_name,
+        indent=indent,
+        verbose=verbose,
+    )
+    return max(startrow - 1, 0)
+
+
+def export_rows_sheet(
+    writer: Any,
+    columns: List[str],
+    batches: Iterable[List[tuple]],
+    sheet_name: str,
+    msg_export: str,
+    indent: int = 1,
+    verbose: int = 1,
+    column_width: Any = None,
+) -> int:
+    """Export rows from a cursor to a single sheet in an open spreadsheet.
+
+    With :data:`output: xlsx_write_only`, rows go straight into the sheet.
+    Otherwise, pandas needs a dataframe, so one is built for each batch.
+
+    Args:
+        writer: Open spreadsheet (see :func:`open_xlsx`)
+        columns: Column names
+        batches: Batches of rows (see :func:`fetch_table_rows`)
+        sheet_name: Name of sheet
+        msg_export: Confirmation message
+        indent: Number of indents before message
+        verbose: Minimum verbosity required to show the message
+        column_width: Value of :data:`output: styles: column_width`, if any
+
+    Returns:
+        Number of rows exported, not counting the header
+    """
+    if isinstance(writer, Workbook):
+        sheet: Any = writer.create_sheet(sheet_name)
+        count: int = 0
+        for rows in batches:
+            if count == 0 and column_width is not None:
+                # Widths must be set before the first row, so they come from
+                # the first batch.
+                first: DataFrame = pd.DataFrame.from_records(rows, columns=columns)
+                set_column_widths(sheet, get_column_widths(first, column_width))
+            if count == 0:
+                sheet.append(get_header_cells(sheet, columns))
+            for row in rows:
+                sheet.append(row)
+            count += len(rows)
+        msg_with_data(msg_export, data=sheet_name, indent=indent, verbose=verbose)
+        return count
+    chunks: Iterator[DataFrame] = (
+        pd.DataFrame.from_records(rows, columns=columns) for rows in batches
+    )
+    return export_chunks_sheet(
+        writer, chunks, sheet_name, msg_export, indent, verbose, column_width
+    )
+
+
+def get_header_cells(sheet: Any, columns: Iterable[Any]) -> List[Cell]:
+    """Return a bold header row for a sheet in a write-only spreadsheet.
+
+    Args:
+        sheet: Sheet in a write-only spreadsheet
+        columns: Column names
+
+    Returns:
+        Header cells, to append to the sheet
+    """
+    # WriteOnlyCell() is a function that returns a Cell.
+    header: List[Cell] = []
+    for column in columns:
+        cell = WriteOnlyCell(sheet, value=str(column))
+        cell.font = Font(bold=True)
+        header.append(cell)
+    return header
+
+
+def append_chunks_sheet(
+    workbook: Workbook,
+    chunks: Iterable[DataFrame],
+    title: str,
+    column_width: Any = None,
+) -> int:
+    """Append data to a new sheet in a write-only spreadsheet.
+
+    Rows are converted a slice at a time, and written straight to disk by
+    openpyxl, so memory use stays flat however long the sheet is.
+
+    Args:
+        workbook: Write-only spreadsheet (see :func:`open_xlsx`)
+        chunks: Data to export, as one or more dataframes with the same columns
+        title: Name of sheet
+        column_width: Value of :data:`output: styles: column_width`, if any.
+            Widths must be set before the first row, so they come from the
+            first chunk.
+
+    Returns:
+        Number of rows exported, not counting the header
+    """
+    s = Settings()
+    sheet: Any = None
+    count: int = 0
+    for df in chunks:
+        count += len(df)
+        if sheet is None:
+            sheet = workbook.create_sheet(title)
+            if column_width is not None:
+                set_column_widths(sheet, get_column_widths(df, column_width))
+            sheet.append(get_header_cells(sheet, df.columns))
+        for start in range(0, len(df), s.XLSX_WRITE_ONLY_ROWS):
+            rows: DataFrame = df.iloc[start : start + s.XLSX_WRITE_ONLY_ROWS]
+            # Missing values are left as empty cells, as pandas does.
+            rows = rows.astype(object).where(rows.notna(), None)
+            for row in rows.itertuples(index=False, name=None):
+                sheet.append(row)
+    return count
+
+
+def xlsx_write_only_enabled(config: Nob) -> bool:
+    """Return :data:`True` if spreadsheets should be written in constant memory.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`output: xlsx_write_only`, default :data:`False`
+    """
+    s = Settings()
+    return s.KEY_OUTPUT__XLSX_WRITE_ONLY in config and bool(
+        config[s.KEY_OUTPUT__XLSX_WRITE_ONLY][:]
+    )
+
+
+@contextmanager
+def open_xlsx(config: Nob, filename: str) -> Iterator[Any]:
+    """Open a spreadsheet for export, and save it once every sheet is written.
+
+    Args:
+        config: Report configuration
+        filename: Path to spreadsheet
+
+    Yields:
+        Open spreadsheet, for :func:`export_chunks_sheet`. With
+        :data:`output: xlsx_write_only`, this is a write-only openpyxl
+        :class:`Workbook`; otherwise, a :class:`pandas.ExcelWriter`.
+
+    Note:
+        If an error stops the report while the spreadsheet is open, the incomplete
+        spreadsheet is removed.
+    """
+    overwrite_file(filename)
+    write_only: bool = xlsx_write_only_enabled(config)
+    with output_file(config, filename) as path:
+        writer: Any = Workbook(write_only=True) if write_only else pd.ExcelWriter(path)
+        try:
+            yield writer
+        except BaseException:
+            if not write_only:
+                with suppress(Exception):
+                    writer.close()
+            with suppress(OSError):
+                os.remove(path)
+            raise
+        if write_only:
+            writer.save(path)
+        else:
+            writer.close()
+
+
 def export_df_list_xlsx(
     config: Nob,
     df_list: List[Tuple[str, DataFrame]],
@@ -249,23 +847,21 @@ def export_df_list_xlsx(
     # but coverage does not seem to realize it.
     filename = f"{export_basename}.{ext}"
     filename = get_output_dir_path(config, filename)
-    overwrite_file(filename)
-    with pd.ExcelWriter(filename) as writer:
-        for item in df_list:
+    with open_xlsx(config, filename) as writer:
+        sheets: Dict[str, int] = {}
+        for item in pop_each(df_list):
             sheet_name = item[0]
             df = item[1]
-            # TODO Are there any situations where our spreadsheet needs the index?
-            # Probably not.
-            # If a table is imported into the database with include_index = True,
-            # then when it is later exported, the index is simply another column.
-            index = False
-            df.to_excel(writer, sheet_name=sheet_name, index=index)
-            msg_with_data(
+            sheets[sheet_name] = export_chunks_sheet(
+                writer,
+                [df],
+                sheet_name,
                 msg_export,
-                data=sheet_name,
-                indent=indent,
-                verbose=verbose,
+                indent,
+                verbose,
+                get_column_width(config),
             )
+        set_output_rows(filename, sheets)
     msg_with_data(
         s.MSG_SHEETS_EXPORTED,
         data=filename,
@@ -274,6 +870,23 @@ def export_df_list_xlsx(
     )
 
 
+def pop_each(df_list: List[Tuple[str, DataFrame]]) -> Iterator[Tuple[str, DataFrame]]:
+    """Remove each item from a list, in order, and yield it.
+
+    Once the caller is done with an item, nothing else refers to it, so its
+    DataFrame can be freed before the next one is exported.
+
+    Args:
+        df_list: List of tuples :data:`(name, df)`; empty once every item is yielded
+
+    Yields:
+        Each tuple, in list order
+    """
+    df_list.reverse()
+    while df_list:
+        yield df_list.pop()
+
+
 def export_queries(config: Nob, df_list):
     """Export all queries.
 
@@ -285,27 +898,44 @@ def export_queries(config: Nob, df_list):
         Each item in :data:`df_list` should be a tuple of the form:
         :data:`(name, df)`
 
+        Items are removed from :data:`df_list` as they are exported (see
+        :func:`pop_each`), so each DataFrame can be freed as soon as it is written.
+
     Note:
         The default output format is :data:`XLSX`, but this can be overriden
         with :data:`export_queries: csv` under :data:`output:`.
 
+        With :data:`output: export_workers` greater than 1, several CSV files are
+        written at once (see :func:`export_csv_parallel`).
+
     See Also:
         - :func:`export_df_csv`
         - :func:`export_df_list_xlsx`
     """
     s = Settings()
-    # Export queries to CSV or XLSX
-    # By default, queries export to xlsx.
-    ext = s.XLSX
-    # Override if needed.
-    if s.KEY_OUTPUT__EXPORT_QUERIES in config:
-        ext = config[s.KEY_OUTPUT__EXPORT_QUERIES][:]
+    ext: str = get_export_queries_format(config)
 
     if ext in s.SCHEMA_EXPORT_FORMATS:
         indent = 1
         verbose = 2
-        if ext == "csv":
-            for table in df_list:
+        if ext == "csv" and get_export_workers(config) > 1:
+            names: List[str] = [table[0] for table in df_list]
+            tasks: List[Tuple[Callable, tuple]] = [
+                (
+                    export_chunks_csv,
+                    (config, [df], name, s.MSG_QUERY_EXPORTED, indent, verbose, False),
+                )
+                for name, df in df_list
+            ]
+            df_list.clear()
+            export_csv_parallel(config, names, tasks)
+        elif ext in s.ARROW_EXPORT_FORMATS:
+            for name, df in pop_each(df_list):
+                export_chunks_arrow(
+                    config, [df], name, ext, s.MSG_QUERY_EXPORTED, indent, verbose
+                )
+        elif ext == "csv":
+            for table in pop_each(df_list):
                 table_name = table[0]
                 df = table[1]
                 export_df_csv(
@@ -328,3 +958,114 @@ def export_queries(config: Nob, df_list):
     else:  # pragma: no cover
         # This path should never execute.
         abort(s.MSG_EXPORT_FORMAT_UNRECOGNIZED, data=ext)  # pragma: no cover
+
+
+def get_export_queries_format(config: Nob) -> str:
+    """Return the format for exporting queries.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Format for export, one of :data:`SCHEMA_EXPORT_FORMATS`
+    """
+    s = Settings()
+    # Export queries to CSV or XLSX
+    # By default, queries export to xlsx.
+    ext = s.XLSX
+    # Override if needed.
+    if s.KEY_OUTPUT__EXPORT_QUERIES in config:
+        ext = config[s.KEY_OUTPUT__EXPORT_QUERIES][:]
+    return ext
+
+
+def stream_queries_enabled(config: Nob) -> bool:
+    """Return :data:`True` if each query should be exported as soon as it finishes.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`output: stream_queries`, default :data:`False`
+    """
+    s = Settings()
+    return s.KEY_OUTPUT__STREAM_QUERIES in config and bool(
+        config[s.KEY_OUTPUT__STREAM_QUERIES][:]
+    )
+
+
+@contextmanager
+def stream_queries(config: Nob) -> Iterator[Callable[[str, Iterable[DataFrame]], None]]:
+    """Open the query export, and export each query as soon as it is ready.
+
+    Unlike :func:`export_queries`, this never holds more than one query in memory
+    for export. A query may even arrive as several chunks, which are written out
+    one at a time.
+
+    Usage::
+
+        with stream_queries(config) as export_query:
+            export_query(name, [df])
+
+    Args:
+        config: Report configuration
+
+    Yields:
+        Function :data:`export_query(name, chunks)`, which exports one query.
+        Call it once per query, in the order the queries should appear.
+
+    Note:
+        If an error stops the report while a spreadsheet is open, the incomplete
+        spreadsheet is removed.
+    """
+    s = Settings()
+    ext: str = get_export_queries_format(config)
+    indent: int = 1
+    verbose: int = 2
+    msg_with_data(s.MSG_STREAMING_QUERIES, data=ext, verbose=verbose)
+
+    if ext == "csv":
+
+        def export_query_csv(name: str, chunks: Iterable[DataFrame]):
+            export_chunks_csv(
+                config, chunks, name, s.MSG_QUERY_EXPORTED, indent, verbose
+            )
+
+        yield export_query_csv
+    elif ext in s.ARROW_EXPORT_FORMATS:
+
+        def export_query_arrow(name: str, chunks: Iterable[DataFrame]):
+            export_chunks_arrow(
+                config, chunks, name, ext, s.MSG_QUERY_EXPORTED, indent, verbose
+            )
+
+        yield export_query_arrow
+    elif ext == "xlsx":  # pragma: no branch
+        filename: str = get_output_dir_path(
+            config, f"{config[s.KEY_OUTPUT__BASENAME][:]}.{ext}"
+        )
+        with open_xlsx(config, filename) as writer:
+            sheets: Dict[str, int] = {}
+            set_output_rows(filename, sheets)
+
+            def export_query_sheet(name: str, chunks: Iterable[DataFrame]):
+                sheets[name] = export_chunks_sheet(
+                    writer,
+                    chunks,
+                    name,
+                    s.MSG_QUERY_EXPORTED_SHEET,
+                    indent,
+                    verbose,
+                    get_column_width(config),
+                )
+
+            yield export_query_sheet
+        msg_with_data(
+            s.MSG_SHEETS_EXPORTED,
+            data=filename,
+            indent=indent,
+            verbose=verbose,
+        )
+    else:  # pragma: no cover
+        # This path should never execute.
+        abort(s.MSG_EXPORT_FORMAT_UNRECOGNIZED, data=ext)  # pragma: no cover
@@ -2,12 +2,19 @@
 
 """Helper functions."""
 
+import importlib.util
+import io
 import os
+import re
 import sys
+import threading
 from typing import Any
+from typing import Callable
 from typing import List
+from typing import NoReturn
 from typing import Optional
 from typing import Tuple
+from typing import Union
 
 import click
 from nob.nob import Nob
@@ -26,6 +33,85 @@ from strictyaml.ruamel.scanner import ScannerError
 from yarm.settings import Settings
 
 
+# Messages from a worker thread are collected here. See run_in_worker().
+_worker = threading.local()
+
+
+def echo(message: Any = "", nl: bool = True, **styles: Any) -> None:
+    """Show text, optionally styled with :func:`click.style`.
+
+    Important:
+        All messages should pass through this function, rather than
+        :func:`click.echo` or :func:`print`.
+
+    Note:
+        Inside :func:`run_in_worker`, the text is collected rather than shown,
+        so that messages from concurrent work can be shown in a predictable order.
+
+    Args:
+        message: Text to show
+        nl: If True, end with a newline
+        styles: Keyword arguments for :func:`click.style`, e.g. :data:`fg`
+    """
+    output: Optional[io.StringIO] = getattr(_worker, "output", None)
+    if styles:
+        message = click.style(message, **styles)
+    if output is None:
+        click.echo(message, nl=nl)
+    else:
+        # Keep the styles; click strips them later if the terminal needs it.
+        click.echo(message, file=output, nl=nl, color=True)
+
+
+def run_in_worker(
+    ctx: click.Context, function: Callable, *args: Any
+) -> Tuple[Any, str, Optional[BaseException]]:
+    """Run a function in a worker thread, and collect its messages.
+
+    Important:
+        This function never raises. Pass its result to :func:`worker_result`
+        in the main thread to show the messages and raise any error.
+
+    Args:
+        ctx: Context of the main thread, so that helpers like :func:`verbose_ge`
+            still work
+        function: Function to run
+        args: Arguments for :data:`function`
+
+    Returns:
+        Tuple of (result, messages, error), where :data:`error` is any exception
+        raised, including the :class:`SystemExit` raised by :func:`abort`
+    """
+    _worker.output = io.StringIO()
+    try:
+        with ctx.scope(cleanup=False):
+            result = function(*args)
+        return result, _worker.output.getvalue(), None
+    except BaseException as error:  # noqa: B902
+        return None, _worker.output.getvalue(), error
+    finally:
+        _worker.output = None
+
+
+def worker_result(outcome: Tuple[Any, str, Optional[BaseException]]) -> Any:
+    """Show the messages from :func:`run_in_worker`, then return its result.
+
+    Args:
+        outcome: Value returned by :func:`run_in_worker`
+
+    Returns:
+        Result of the function run in the worker
+
+    Raises:
+        error: Any exception raised in the worker, e.g. :class:`SystemExit`
+    """
+    result, messages, error = outcome
+    echo(messages, nl=False)
+    if error is not None:
+        raise error
+    return result
+
+
 def msg_options(
     msg: str,
     prefix: Optional[str] = None,
@@ -68,22 +154,22 @@ def msg_options(
     i = s.MSG_TAB * indent
     # TODO test_msg_options tests this, but coverage doesn't recognize the test.
     if prefix and prefix_color:  # pragma: no cover
-        click.secho(i + prefix, fg=prefix_color, nl=False, bold=True)
-        click.echo(" ", nl=False)
+        echo(i + prefix, fg=prefix_color, nl=False, bold=True)
+        echo(" ", nl=False)
     if data:
-        click.echo(msg, nl=False)
-        click.echo(": ", nl=False)
-        click.secho(data, fg=s.COLOR_DATA, bold=True)
+        echo(msg, nl=False)
+        echo(": ", nl=False)
+        echo(data, fg=s.COLOR_DATA, bold=True)
     else:
-        click.echo(i + msg)
+        echo(i + msg)
     if file_path:
-        click.secho(i + "In file: ", nl=False)
-        click.secho(file_path, fg=s.COLOR_DATA, bold=True)
+        echo(i + "In file: ", nl=False)
+        echo(file_path, fg=s.COLOR_DATA, bold=True)
     if error:
-        click.echo(i + "Error: ", nl=False)
-        click.secho(error, fg=s.COLOR_ERROR)
+        echo(i + "Error: ", nl=False)
+        echo(error, fg=s.COLOR_ERROR)
     if ps:
-        click.echo(ps)
+        echo(ps)
 
 
 def warn(
@@ -126,7 +212,7 @@ def abort(
     ps: Optional[str] = None,
     indent: int = 0,
     suggest_verbose: int = 1,
-):
+) -> NoReturn:
     """Abort with error message and status 1.
 
     Args:
@@ -177,7 +263,7 @@ def msg_suggest_verbose(suggest_verbose: int):
                 msg_verbose += " or -"
                 msg_verbose += "v" * (suggest_verbose + 1)
             msg_verbose += "."
-            click.echo(msg_verbose)
+            echo(msg_verbose)
 
 
 def success(
@@ -246,7 +332,7 @@ def msg(msg: str, verbose: int = 0, indent: int = 0):
     s = Settings()
     if verbose_ge(verbose):
         msg = (s.MSG_TAB * indent) + msg
-        click.echo(msg)
+        echo(msg)
 
 
 def msg_with_data(msg: str, data: str, verbose: int = 1, indent: int = 0):
@@ -266,8 +352,8 @@ def msg_with_data(msg: str, data: str, verbose: int = 1, indent: int = 0):
     if verbose_ge(verbose):
         msg = (s.MSG_TAB * indent) + msg
         msg += ": "
-        click.echo(msg, nl=False)
-        click.secho(data, fg=s.COLOR_DATA)
+        echo(msg, nl=False)
+        echo(data, fg=s.COLOR_DATA)
 
 
 def verbose_ge(verbose: int) -> bool:
@@ -298,6 +384,11 @@ def overwrite_file(path: str, indent: int = 1) -> bool:
     Note:
         If a prompt question is shown, it is not indented.
 
+    Note:
+        With :data:`output: manifest`, the file is **not** removed, only confirmed.
+        It is replaced later, and only if its content has changed
+        (see :func:`yarm.manifest.output_file`).
+
     Args:
         path: File to overwrite
         indent: Number of indents before message
@@ -325,6 +416,11 @@ def overwrite_file(path: str, indent: int = 1) -> bool:
             else:
                 abort(s.MSG_OVERWRITE_FILE_ABORT, data=path)  # pragma: no cover
 
+        if remove and s.META_MANIFEST in ctx.meta:
+            msg_with_data(
+                s.MSG_OVERWRITE_IF_CHANGED, data=path, indent=indent, verbose=3
+            )
+            return False
         if remove:  # pragma: no cover
             # TODO Why doesn't coverage detect test_overwrite_file()?
             if verbose_ge(2):
@@ -360,6 +456,85 @@ def key_show_message(key_msg: List[Tuple[str, str]], config: Nob, verbose: int =
             msg(msg_str, verbose=verbose)
 
 
+def import_module_path(file_path: str):
+    """Import the user's Python code from a file.
+
+    Every file is imported as the same module, :data:`IMPORT_MODULE_NAME`.
+
+    Args:
+        file_path: Path to :data:`.py` file
+
+    See Also:
+        - :func:`yarm.validate.validate_key_import`
+    """
+    s = Settings()
+    module_name = s.IMPORT_MODULE_NAME
+    # https://docs.python.org/3/library/importlib.html#importing-a-source-file-directly
+    spec = importlib.util.spec_from_file_location(module_name, file_path)  # type: ignore  # noqa:B950
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)  # type: ignore
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a table or column name for use in SQL.
+
+    Note:
+        You cannot use placeholders for table names, so quote them instead.
+
+    Args:
+        name: Table or column name
+
+    Returns:
+        Name in double quotes, with any double quotes inside it escaped
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def format_query_name(name: str, params: Union[dict, list]) -> str:
+    """Fill in the placeholders in a query name with one set of parameters.
+
+    Args:
+        name: Query name, e.g. "Orders {region}" or "Orders {0}"
+        params: Named (dict) or positional (list) parameters for the SQL
+
+    Returns:
+        Query name for this set of parameters
+
+    Raises:
+        KeyError: A named placeholder is not in :data:`params`
+        IndexError: A numbered placeholder is not in :data:`params`
+        ValueError: The name is not a valid format string
+    """
+    if isinstance(params, dict):
+        return name.format_map(params)
+    return name.format(*params)
+
+
+def get_table_references(sql: str, names: List[str]) -> List[str]:
+    """Find which of these table names appear in an SQL statement.
+
+    Note:
+        This is deliberately cautious. A name counts as a reference wherever it
+        appears as a whole word, even in a comment or a string. An extra
+        reference only costs a little parallelism, but a missed one would run
+        a query before the table it needs.
+
+    Args:
+        sql: SQL statement
+        names: Table names to look for (case-insensitive, like sqlite)
+
+    Returns:
+        Names that appear in :data:`sql`, in the order of :data:`names`
+    """
+    references: List[str] = []
+    for name in names:
+        pattern: str = r"(?<![\w$])" + re.escape(name) + r"(?![\w$])"
+        if re.search(pattern, sql, flags=re.IGNORECASE) and name not in references:
+            references.append(name)
+    return references
+
+
 def show_df(df: DataFrame, data: str, verbose: int = 3):
     """Display a dataframe.
 
@@ -371,10 +546,10 @@ def show_df(df: DataFrame, data: str, verbose: int = 3):
     """
     s = Settings()
     if verbose_ge(verbose):
-        print(s.MSG_LINE)
+        echo(s.MSG_LINE)
         msg_with_data(s.MSG_SHOW_DF, data=data)
         if df.empty:
             warn(s.MSG_EMPTY_DF)
         else:
-            print(df)
-        print(s.MSG_LINE)
+            echo(df)
+        echo(s.MSG_LINE)
@@ -0,0 +1,220 @@
+"""Leave unchanged outputs untouched, with :data:`output: manifest`."""
+import hashlib
+import json
+import os
+import zipfile
+from contextlib import contextmanager
+from contextlib import suppress
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+
+from click import get_current_context
+from nob.nob import Nob
+
+from yarm.helpers import msg_with_data
+from yarm.helpers import warn
+from yarm.settings import Settings
+
+
+def manifest_enabled(config: Nob) -> bool:
+    """Return :data:`True` if outputs should be checked against a manifest.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`output: manifest`, default :data:`False`
+    """
+    s = Settings()
+    return s.KEY_OUTPUT__MANIFEST in config and bool(config[s.KEY_OUTPUT__MANIFEST][:])
+
+
+def get_manifest_path(config: Nob) -> str:
+    """Return path to the manifest, in the output dir.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Path to manifest file
+    """
+    s = Settings()
+    return os.path.join(os.fspath(config[s.KEY_OUTPUT__DIR][:]), s.FILE_MANIFEST)
+
+
+def start_manifest(config: Nob):
+    """Load the manifest from the last run, and start a new one for this run.
+
+    Does nothing without :data:`output: manifest`.
+
+    Args:
+        config: Report configuration
+    """
+    s = Settings()
+    if not manifest_enabled(config):
+        return
+    ctx = get_current_context()
+    ctx.meta[s.META_MANIFEST] = {}
+    ctx.meta[s.META_OUTPUT_ROWS] = {}
+    ctx.meta[s.META_LAST_MANIFEST] = {}
+    path: str = get_manifest_path(config)
+    if os.path.isfile(path):
+        try:
+            with open(path) as f:
+                ctx.meta[s.META_LAST_MANIFEST] = dict(json.load(f)[s.MANIFEST_FILES])
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            warn(s.MSG_MANIFEST_READ_ERROR, error=str(error), file_path=path)
+
+
+def set_output_rows(filename: str, rows: Any):
+    """Record the number of rows in an output, for the manifest.
+
+    Args:
+        filename: Path to output file
+        rows: Number of rows; for a spreadsheet, :data:`{sheet name: rows}`
+    """
+    s = Settings()
+    ctx = get_current_context()
+    if s.META_OUTPUT_ROWS in ctx.meta:
+        ctx.meta[s.META_OUTPUT_ROWS][filename] = rows
+
+
+@contextmanager
+def output_file(config: Nob, filename: str) -> Iterator[str]:
+    """Write an output, and only replace the existing file if its content changed.
+
+    Without :data:`output: manifest`, the output is simply written to
+    :data:`filename`.
+
+    With :data:`output: manifest`, the output is written to a temporary file
+    with the same name, in :data:`DIR_OUTPUT_TEMP`. Once it is complete, its
+    content is hashed (see :func:`hash_output`). If the existing file is exactly
+    as the last run left it, and its content hash is the same, the existing file
+    is left untouched, so its modification time does not change. Otherwise, the
+    new file replaces it.
+
+    Usage::
+
+        with output_file(config, filename) as path:
+            df.to_csv(path)
+
+    Args:
+        config: Report configuration
+        filename: Path to output file
+
+    Yields:
+        Path to write the output to
+    """
+    if not manifest_enabled(config):
+        yield filename
+        return
+    s = Settings()
+    temp_dir: str = os.path.join(os.path.dirname(filename), s.DIR_OUTPUT_TEMP)
+    os.makedirs(temp_dir, exist_ok=True)
+    temp: str = os.path.join(temp_dir, os.path.basename(filename))
+    try:
+        yield temp
+    except BaseException:
+        with suppress(OSError):
+            os.remove(temp)
+        raise
+    publish_output(config, filename, temp)
+
+
+def publish_output(config: Nob, filename: str, temp: str):
+    """Replace an output with its new version, unless the content is unchanged.
+
+    Args:
+        config: Report configuration
+        filename: Path to output file
+        temp: Path to new version of output file
+    """
+    s = Settings()
+    ctx = get_current_context()
+    if not os.path.isfile(temp):
+        # Nothing was written, e.g. a Parquet file for a query with no chunks.
+        return
+    output_dir: str = os.fspath(config[s.KEY_OUTPUT__DIR][:])
+    name: str = os.path.relpath(filename, output_dir)
+    sha256: str = hash_output(temp)
+    last: Optional[Dict[str, Any]] = ctx.meta[s.META_LAST_MANIFEST].get(name)
+    changed: bool = not (
+        last is not None
+        and last.get("sha256") == sha256
+        and os.path.isfile(filename)
+        and os.stat(filename).st_mtime_ns == last.get("mtime_ns")
+    )
+    if changed:
+        os.replace(temp, filename)
+    else:
+        os.remove(temp)
+        msg_with_data(s.MSG_OUTPUT_UNCHANGED, data=filename, indent=1, verbose=2)
+    stat = os.stat(filename)
+    ctx.meta[s.META_MANIFEST][name] = {
+        "sha256": sha256,
+        "bytes": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "rows": ctx.meta[s.META_OUTPUT_ROWS].pop(filename, None),
+        "changed": changed,
+    }
+
+
+def hash_output(path: str) -> str:
+    """Return a hash of the content of an output file.
+
+    A spreadsheet is a zip archive, which holds the time it was saved.
+    So for a spreadsheet, only the name and content of each part are hashed,
+    except for the parts in :data:`XLSX_VOLATILE_PARTS`.
+
+    Args:
+        path: Path to output file
+
+    Returns:
+        SHA-256 hash, as hex
+    """
+    s = Settings()
+    digest = hashlib.sha256()
+    if path.lower().endswith(f".{s.XLSX}"):
+        with zipfile.ZipFile(path) as archive:
+            for part in sorted(archive.namelist()):
+                if part in s.XLSX_VOLATILE_PARTS:
+                    continue
+                digest.update(part.encode())
+                digest.update(archive.read(part))
+        return digest.hexdigest()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(s.HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_manifest(config: Nob):
+    """Save the manifest for this run, unless it is the same as the last one.
+
+    For each output, the manifest lists its content hash, size, modification
+    time, number of rows, and whether it :data:`changed` in this run.
+
+    Does nothing without :data:`output: manifest`.
+
+    Args:
+        config: Report configuration
+    """
+    s = Settings()
+    ctx = get_current_context()
+    if s.META_MANIFEST not in ctx.meta:
+        return
+    output_dir: str = os.fspath(config[s.KEY_OUTPUT__DIR][:])
+    with suppress(OSError):
+        os.rmdir(os.path.join(output_dir, s.DIR_OUTPUT_TEMP))
+    files: Dict[str, Any] = dict(sorted(ctx.meta[s.META_MANIFEST].items()))
+    text: str = json.dumps({s.MANIFEST_FILES: files}, indent=2)
+    path: str = get_manifest_path(config)
+    if os.path.isfile(path):
+        with open(path) as f:
+            if f.read() == text:
+                return
+    with open(path, "w") as f:
+        f.write(text)
+    msg_with_data(s.MSG_MANIFEST_SAVED, data=path, verbose=2)
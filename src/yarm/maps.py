@@ -0,0 +1,151 @@
+"""Map values through lookup tables in mapping files."""
+import os
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+import pandas as pd
+from click import get_current_context
+from pandas.core.frame import DataFrame
+
+from yarm.helpers import abort
+from yarm.helpers import msg_with_data
+from yarm.helpers import warn
+from yarm.settings import Settings
+
+
+def load_mapping(path: str, key: str, value: str) -> pd.Series:
+    """Load a mapping file as a lookup table.
+
+    Each mapping is loaded only once per run, however many tables and queries
+    use it.
+
+    Note:
+        Keys are always compared as text (see :func:`key_text`), so e.g. a ZIP
+        code of :data:`02134` keeps its leading zero.
+
+    Args:
+        path: CSV or Parquet file
+        key: Column with the values to look up
+        value: Column with the value for each key
+
+    Returns:
+        Values, indexed by key
+    """
+    s = Settings()
+    ctx = get_current_context()
+    mappings: Dict[Tuple[str, str, str], pd.Series] = ctx.meta.setdefault(
+        s.META_MAPPINGS, {}
+    )
+    cache_key: Tuple[str, str, str] = (os.path.abspath(path), key, value)
+    if cache_key in mappings:
+        return mappings[cache_key]
+
+    msg_with_data(s.MSG_LOADING_MAP, data=path, indent=2, verbose=2)
+    df: DataFrame = read_mapping_file(path, key, value)
+    df[key] = key_text(df[key])
+    if df[key].duplicated().any():
+        warn(s.MSG_MAP_DUPLICATE_KEYS, file_path=path, indent=2)
+        df = df.drop_duplicates(subset=key)
+    mapping: pd.Series = df.set_index(key)[value]
+    mappings[cache_key] = mapping
+    return mapping
+
+
+def key_text(values: pd.Series) -> pd.Series:
+    """Convert keys to text, for comparison.
+
+    A column of whole numbers with any empty values is read as floats, so
+    :data:`123` would become :data:`"123.0"`. Such a column is converted as
+    whole numbers instead.
+
+    Args:
+        values: Keys to look up, or keys in a mapping file
+
+    Returns:
+        Keys as text; empty values stay empty
+    """
+    if pd.api.types.is_float_dtype(values) and values.dropna().mod(1).eq(0).all():
+        values = values.astype("Int64")
+    return values.astype(str).where(values.notna())
+
+
+def read_mapping_file(path: str, key: str, value: str) -> DataFrame:
+    """Read the key and value columns from a mapping file.
+
+    Args:
+        path: CSV or Parquet file
+        key: Column with the values to look up
+        value: Column with the value for each key
+
+    Returns:
+        Mapping data, with only the key and value columns
+    """
+    s = Settings()
+    columns: List[str] = [key, value]
+    try:
+        if path.lower().endswith(".parquet"):
+            try:
+                return pd.read_parquet(path, columns=columns)
+            except ImportError:
+                abort(
+                    s.MSG_MAP_PARQUET_MISSING,
+                    file_path=path,
+                    ps=s.MSG_MAP_PARQUET_MISSING_PS,
+                )
+        return pd.read_csv(path, usecols=columns, dtype={key: str})
+    except (KeyError, ValueError) as error:
+        abort(
+            s.MSG_MAP_COLUMN_ERROR,
+            data=", ".join(columns),
+            error=str(error),
+            file_path=path,
+        )
+    return DataFrame()  # pragma: no cover
+
+
+def df_map(df: DataFrame, maps: List[Dict[str, str]], name: str) -> DataFrame:
+    """Process :data:`map:` for a table source or a query.
+
+    Each mapping looks up every value of one column in a mapping file, and saves
+    the results in another column, with a single vectorized hash lookup.
+    The column to look up may also be the index (e.g. after :data:`pivot:`).
+
+    If the results go to a column that already exists, any value with no match
+    in the mapping file is left as it was. In a new column, it is empty.
+
+    Args:
+        df: Data to map
+        maps: Mappings, in config order, as found under :data:`map:`
+        name: Name of table or query
+
+    Returns:
+        Data with mapped columns
+
+    See Also:
+        - :func:`load_mapping`
+        - :func:`yarm.validate.validate_map`
+    """
+    s = Settings()
+    for mapping_config in maps:
+        path: str = mapping_config["path"]
+        key: str = mapping_config["key"]
+        value: str = mapping_config["value"]
+        column: str = mapping_config.get("column", key)
+        to: str = mapping_config.get("to", value)
+        if column in df.columns:
+            values: pd.Series = df[column]
+        elif column == df.index.name:
+            # E.g. the index of a pivoted source.
+            values = df.index.to_series(index=df.index)
+        else:
+            warn(s.MSG_MAP_COLUMN_MISSING, data=f"{name}: {column}", indent=1)
+            continue
+        msg_with_data(s.MSG_APPLYING_MAP, data=f"{path}: {column} -> {to}", indent=1)
+        mapping: pd.Series = load_mapping(path, key, value)
+        keys: pd.Series = key_text(values)
+        mapped: pd.Series = keys.map(mapping)
+        if to in df.columns:
+            mapped = mapped.where(keys.isin(mapping.index), df[to])
+        df[to] = mapped
+    return df
@@ -1,22 +1,67 @@
 """Run queries on tables."""
 
 import re
+import sqlite3
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from contextlib import contextmanager
+from copy import deepcopy
 from sqlite3 import Connection
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Pattern
+from typing import Set
+from typing import Tuple
+from typing import Union
 
 import pandas as pd
+from click import get_current_context
 from nob.nob import Nob
 from nob.nob import NobView
 from pandas.core.frame import DataFrame
 from pandas.io.sql import DatabaseError
 
+from yarm.cache import cache_enabled
+from yarm.cache import get_query_cache_key
+from yarm.cache import load_cached_query
+from yarm.cache import save_cached_query
+from yarm.cache import save_fingerprint
+from yarm.engines import get_duckdb
+from yarm.engines import query_engine
+from yarm.engines import read_duckdb_query
+from yarm.engines import register_duckdb_query
 from yarm.export import export_queries
+from yarm.export import stream_queries
+from yarm.export import stream_queries_enabled
 from yarm.helpers import abort
+from yarm.helpers import format_query_name
+from yarm.helpers import get_table_references
 from yarm.helpers import msg
 from yarm.helpers import msg_with_data
+from yarm.helpers import quote_identifier
+from yarm.helpers import run_in_worker
 from yarm.helpers import show_df
 from yarm.helpers import warn
+from yarm.helpers import worker_result
+from yarm.maps import df_map
+from yarm.rerun import explain_rerun
 from yarm.settings import Settings
+from yarm.sql_functions import register_sql_functions
+from yarm.stats import add_query_rows
+from yarm.stats import explain_query
+from yarm.stats import set_query_stat
+from yarm.stats import time_query_step
+from yarm.temp_tables import release_temp_tables
+from yarm.temp_tables import shared_temp_tables
+from yarm.workers import postprocess_pool
+from yarm.workers import run_postprocess
 
 
 def run_queries(conn: Connection, config: Nob):
@@ -26,40 +71,548 @@ def run_queries(conn: Connection, config: Nob):
         config: Report configuration
         conn: Temporary database in memory
 
+    Note:
+        With :data:`output: stream_queries`, each query is exported as soon as it
+        finishes, and then released. Otherwise, all queries are exported together
+        at the end.
+
     See Also:
-        - :func:`run_query`
-        - :func:`save_query_to_database`
+        - :func:`expand_query_templates`
+        - :func:`yarm.engines.query_engine`
+        - :func:`yarm.temp_tables.shared_temp_tables`
+        - :func:`track_query_readers`
+        - :func:`run_each_query`
         - :func:`yarm.export.export_queries`
+        - :func:`yarm.export.stream_queries`
     """
     s = Settings()
 
     if s.KEY_QUERIES in config:
-        queries = config[s.KEY_QUERIES]
-        df_list = []
-        for i, _val in enumerate(queries):
-            query = queries[i]
-            # Within this query, start keys with "/" to ensure you have correct key.
-            # Because "replace" can have arbitrarily named columns, this avoids error
-            # if a column is e.g. 'name'.
-            sql = query[s.KEY_QUERY__SQL][:]
-            name = query[s.KEY_QUERY__NAME][:]
+        expand_query_templates(config)
+        check_query_names(config)
+        track_query_readers(config)
+        with postprocess_pool(config), query_engine(config):
+            with shared_temp_tables(conn, config):
+                run_and_export_queries(conn, config)
 
-            msg(s.MSG_LINE, verbose=3)
-            msg_with_data(s.MSG_RUNNING_QUERY, data=name, verbose=1)
-            msg(sql, verbose=3)
 
-            df = run_query(config, query, conn, sql, name)
+def run_and_export_queries(conn: Connection, config: Nob):
+    """Run each query, and export them as they finish or all together.
 
-            # Save processeed query to database.
-            save_query_to_database(df, conn, name)
+    Args:
+        conn: Temporary database in memory
+        config: Report configuration
+    """
+    if stream_queries_enabled(config):
+        with stream_queries(config) as export_query:
+            run_each_query(conn, config, export_query, stream=True)
+    else:
+        df_list: List[Tuple[str, DataFrame]] = []
 
-            # Save df to list for export
-            # TODO Should this be refactored to avoid the memory usage?
-            df_list.append((name, df))
+        def collect_query(name: str, chunks: Iterable[DataFrame]):
+            df_list.extend((name, df) for df in chunks)
 
+        run_each_query(conn, config, collect_query)
+        # Each DataFrame is removed from df_list as soon as it is exported.
         export_queries(config, df_list)
 
 
+def expand_query_templates(config: Nob):
+    """Replace each query template with one query for each set of :data:`params:`.
+
+    Each new query keeps the template's SQL and options, takes its name from the
+    template's name with the parameters filled in, and has its own set of
+    parameters under :data:`params:`. Every query from a template runs exactly
+    the same SQL text, with its own parameters bound to it (see
+    :func:`read_sql_query`), so on one connection sqlite3 finds the prepared
+    statement in its cache, rather than parsing it again.
+
+    Args:
+        config: Report configuration
+
+    See Also:
+        - :func:`get_query_params`
+        - :func:`yarm.validate.validate_query_params`
+    """
+    s = Settings()
+    queries = config[s.KEY_QUERIES]
+    expanded: List[dict] = []
+    for i, _val in enumerate(queries):
+        if s.KEY_QUERY__PARAMS not in queries[i]:
+            expanded.append(queries[i][:])
+            continue
+        name: str = queries[i][s.KEY_QUERY__NAME][:]
+        param_sets: list = queries[i][s.KEY_QUERY__PARAMS][:]
+        msg_with_data(
+            f"{name}: {s.MSG_EXPANDING_QUERY_TEMPLATE}",
+            data=str(len(param_sets)),
+            verbose=2,
+        )
+        for params in param_sets:
+            query = Nob(deepcopy(queries[i][:]))
+            query[s.KEY_QUERY__NAME] = format_query_name(name, params)
+            query[s.KEY_QUERY__PARAMS] = params
+            expanded.append(query[:])
+    config[s.KEY_QUERIES] = expanded
+
+
+def check_query_names(config: Nob):
+    """Abort if two queries have the same name.
+
+    Note:
+        Check before any query runs. A query's table may be dropped before a
+        later query with the same name is saved (see :func:`release_query_tables`),
+        so the database would not catch it.
+
+    Args:
+        config: Report configuration
+    """
+    s = Settings()
+    queries = config[s.KEY_QUERIES]
+    names: Set[str] = set()
+    for i, _val in enumerate(queries):
+        name: str = queries[i][s.KEY_QUERY__NAME][:]
+        # Like SQLite, ignore case.
+        if name.lower() in names:
+            abort(
+                s.MSG_QUERY_DUPLICATE_ERROR,
+                data=name,
+                ps=s.MSG_QUERY_DUPLICATE_ERROR_PS,
+            )
+        names.add(name.lower())
+
+
+def track_query_readers(config: Nob):
+    """Record which queries read each query, so its table can be dropped early.
+
+    Each query's table is needed until it has been exported, and until every
+    later query that reads it has finished. After that, :func:`release_query_tables`
+    drops it, so a long report does not hold every query in memory at once.
+
+    Note:
+        With :data:`--database`, every query is kept for export to the database
+        file, so nothing is recorded.
+
+        Without :data:`output: stream_queries`, each query's DataFrame is still
+        held until every query has finished (see :func:`run_and_export_queries`),
+        so dropping its table lowers peak memory much less.
+
+    Args:
+        config: Report configuration
+
+    See Also:
+        - :func:`yarm.helpers.get_table_references`
+    """
+    s = Settings()
+    ctx = get_current_context()
+    if ctx.params[s.ARG_EXPORT_DATABASE]:
+        return
+    queries = config[s.KEY_QUERIES]
+    names: List[str] = []
+    # A query is its own first reader, until it has been exported.
+    readers: Dict[str, Set[str]] = {}
+    for i, _val in enumerate(queries):
+        sql: str = queries[i][s.KEY_QUERY__SQL][:]
+        name: str = queries[i][s.KEY_QUERY__NAME][:]
+        for ref in get_table_references(sql, names):
+            readers[ref].add(name)
+        names.append(name)
+        readers[name] = {name}
+    ctx.meta[s.META_QUERY_READERS] = readers
+
+
+def release_query_tables(conn: Connection, reader: str):
+    """Record that a query is finished and exported, and drop tables no longer needed.
+
+    Args:
+        conn: Temporary database in memory
+        reader: Name of the query that has just been exported
+
+    See Also:
+        - :func:`track_query_readers`
+    """
+    s = Settings()
+    ctx = get_current_context()
+    readers: Dict[str, Set[str]] = ctx.meta.get(s.META_QUERY_READERS, {})
+    for name in list(readers):
+        if reader not in readers[name]:
+            continue
+        readers[name].remove(reader)
+        if not readers[name]:
+            del readers[name]
+            drop_query_table(conn, name)
+            msg_with_data(s.MSG_QUERY_TABLE_DROPPED, data=name, indent=1, verbose=2)
+
+
+def drop_query_table(conn: Connection, name: str):
+    """Drop a query's table from the database, and from DuckDB if it is in use.
+
+    Args:
+        conn: Temporary database in memory
+        name: Name for this query
+    """
+    duck: Optional[Any] = get_duckdb()
+    if duck is not None:
+        duck.unregister(name)
+    with conn:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(name)}")
+
+
+def get_query_params(query: NobView) -> Union[dict, list]:
+    """Return the parameters to bind to a query's SQL.
+
+    Args:
+        query: Configuration for this query, after :func:`expand_query_templates`
+
+    Returns:
+        Named (dict) or positional (list) parameters; empty if there are none
+    """
+    s = Settings()
+    if s.KEY_QUERY__PARAMS in query:
+        return query[s.KEY_QUERY__PARAMS][:]
+    return []
+
+
+def run_each_query(
+    conn: Connection,
+    config: Nob,
+    export_query: Callable[[str, Iterable[DataFrame]], None],
+    stream: bool = False,
+):
+    """Run each query, save it to the database, and pass it on for export.
+
+    Args:
+        conn: Temporary database in memory
+        config: Report configuration
+        export_query: Function that exports one query, given its name and data
+            (**see** :func:`yarm.export.stream_queries`)
+        stream: If True, read plain queries for export in chunks
+
+    Note:
+        Plain queries are saved straight to the database, and only read into
+        pandas for export. See :func:`create_query_table`.
+
+        With :data:`--jobs` greater than 1, independent queries run in parallel.
+        See :func:`run_queries_parallel`.
+
+        With :data:`engine: duckdb`, queries run one at a time, since DuckDB
+        already runs each query on several threads.
+
+    See Also:
+        - :func:`run_query`
+        - :func:`save_query_to_database`
+    """
+    s = Settings()
+    queries = config[s.KEY_QUERIES]
+    ctx = get_current_context()
+    jobs: int = ctx.params[s.ARG_JOBS]
+    duck: Optional[Any] = get_duckdb()
+    if jobs > 1 and duck is not None:
+        msg(s.MSG_DUCKDB_JOBS, verbose=1)
+    elif jobs > 1:
+        run_queries_parallel(conn, config, jobs, export_query)
+        return
+
+    for i, _val in enumerate(queries):
+        query = queries[i]
+        # Within this query, start keys with "/" to ensure you have correct
+        # key. Because "replace" can have arbitrarily named columns, this
+        # avoids error if a column is e.g. 'name'.
+        sql = query[s.KEY_QUERY__SQL][:]
+        name = query[s.KEY_QUERY__NAME][:]
+
+        msg_running_query(sql, name)
+
+        if duck is None and is_plain_query(config, query):
+            create_query_table(conn, sql, name, get_query_timeout(config, query))
+            release_temp_tables(conn, name)
+            chunksize: Optional[int] = s.QUERY_CHUNKSIZE if stream else None
+            export_query(name, read_query_table(conn, name, chunksize))
+            release_query_tables(conn, name)
+            continue
+
+        df = run_query(config, query, conn, sql, name)
+
+        # Save processeed query to database.
+        save_query_to_database(df, conn, name)
+        if duck is not None:
+            register_duckdb_query(duck, name, df)
+        release_temp_tables(conn, name)
+
+        export_query(name, [df])
+        release_query_tables(conn, name)
+
+
+def is_plain_query(config: Nob, query: NobView) -> bool:
+    """Return :data:`True` if a query can stay inside the database until export.
+
+    Args:
+        config: Report configuration
+        query: Configuration for this query
+
+    Returns:
+        True if the query is a single :data:`SELECT` (see :func:`is_select`)
+        with no :data:`map:`, :data:`replace:`, :data:`postprocess:` or
+        :data:`params:`, and its results will not be cached
+
+    Note:
+        A query from a template (see :func:`expand_query_templates`) is read
+        through :func:`read_sql_query` instead. Wrapping it in
+        :data:`CREATE TABLE` would put each query's own table name into the SQL,
+        so SQLite could no longer reuse one prepared statement for them all.
+    """
+    s = Settings()
+    return (
+        s.KEY_MAP not in query
+        and s.KEY_QUERY__REPLACE not in query
+        and s.KEY_QUERY__POSTPROCESS not in query
+        and s.KEY_QUERY__PARAMS not in query
+        and not cache_enabled(config)
+        and is_select(query[s.KEY_QUERY__SQL][:])
+    )
+
+
+def is_select(sql: str) -> bool:
+    """Return :data:`True` if SQL is a :data:`SELECT`, which can follow :data:`AS`.
+
+    Other statements that return rows, such as :data:`PRAGMA table_info(...)`,
+    cannot be used in :data:`CREATE TABLE ... AS`.
+
+    Args:
+        sql: SQL statement for a query
+
+    Returns:
+        True if the statement starts with :data:`SELECT` or :data:`WITH`,
+        after any comments
+    """
+    s = Settings()
+    return re.match(s.RE_SELECT_STATEMENT, sql, re.IGNORECASE | re.DOTALL) is not None
+
+
+def create_query_table(
+    conn: Connection,
+    sql: str,
+    name: str,
+    timeout: Optional[float] = None,
+):
+    """Save a plain query straight to the database, without a trip through pandas.
+
+    Args:
+        conn: Temporary database in memory
+        sql: SQL statement for this query
+        name: Name for this query
+        timeout: Stop the query after this many seconds (**see** :func:`watch_query`)
+
+    See Also:
+        - :func:`is_plain_query`
+    """
+    s = Settings()
+    table: str = quote_identifier(name)
+    select: str = sql.strip().rstrip(";").strip()
+    explain_query(conn, sql, name)
+    try:
+        with conn, time_query_step(name, "sqlite"), watch_query(conn, name, timeout):
+            conn.execute(f"CREATE TABLE {table} AS {select}")  # noqa: S608
+    except sqlite3.Error as error:
+        if re.match(r"table .* already exists", str(error)):
+            abort(
+                s.MSG_QUERY_DUPLICATE_ERROR,
+                data=name,
+                ps=s.MSG_QUERY_DUPLICATE_ERROR_PS,
+            )
+        else:
+            abort(s.MSG_QUERY_RUN_ERROR, data=name, error=str(error))
+    if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None:  # noqa: S608
+        # Empty query results? Sometimes that is desirable, but throw a warning.
+        warn(s.MSG_QUERY_EMPTY_ERROR, data=name)
+
+
+def read_query_table(
+    conn: Connection, name: str, chunksize: Optional[int] = None
+) -> Iterator[DataFrame]:
+    """Read a query saved in the database, for export.
+
+    Args:
+        conn: Temporary database in memory
+        name: Name for this query
+        chunksize: If set, read this many rows at a time. Otherwise, read all rows.
+
+    Yields:
+        Query results, all at once or in chunks
+    """
+    table: str = quote_identifier(name)
+    sql: str = f"SELECT * FROM {table}"  # noqa: S608
+    with time_query_step(name, "dataframe"):
+        if chunksize:
+            chunks: Iterator[DataFrame] = pd.read_sql(sql, conn, chunksize=chunksize)
+        else:
+            chunks = iter([pd.read_sql(sql, conn)])
+    first: bool = True
+    while True:
+        with time_query_step(name, "dataframe"):
+            df: Optional[DataFrame] = next(chunks, None)
+        if df is None:
+            break
+        add_query_rows(name, len(df))
+        if first:
+            show_df(df, name)
+            first = False
+        yield df
+
+
+def msg_running_query(sql: str, name: str):
+    """Show message that a query is running.
+
+    Args:
+        sql: SQL statement for this query
+        name: Name for this query
+    """
+    s = Settings()
+    msg(s.MSG_LINE, verbose=3)
+    msg_with_data(s.MSG_RUNNING_QUERY, data=name, verbose=1)
+    msg(sql, verbose=3)
+
+
+def get_query_waves(queries: NobView) -> List[List[int]]:
+    """Group queries into waves, so that each wave only depends on earlier waves.
+
+    A query depends on an earlier query if its SQL refers to that query's name.
+    (A query cannot depend on a later query, since that query does not exist yet.)
+
+    Args:
+        queries: Configuration for all queries
+
+    Returns:
+        List of waves, where each wave is a list of query indexes in config order
+
+    See Also:
+        - :func:`yarm.helpers.get_table_references`
+    """
+    s = Settings()
+    names: List[str] = []
+    query_wave: List[int] = []
+    waves: List[List[int]] = []
+    for i, _val in enumerate(queries):
+        sql: str = queries[i][s.KEY_QUERY__SQL][:]
+        name: str = queries[i][s.KEY_QUERY__NAME][:]
+        wave: int = 0
+        dependencies: List[str] = get_table_references(sql, names)
+        if dependencies:
+            msg_with_data(
+                f"{name}: {s.MSG_QUERY_DEPENDS_ON}",
+                data=", ".join(dependencies),
+                indent=1,
+                verbose=3,
+            )
+            wave = 1 + max(query_wave[names.index(dep)] for dep in dependencies)
+        names.append(name)
+        query_wave.append(wave)
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(i)
+    return waves
+
+
+def run_queries_parallel(
+    conn: Connection,
+    config: Nob,
+    jobs: int,
+    export_query: Callable[[str, Iterable[DataFrame]], None],
+):
+    """Run independent queries at the same time, in a pool of threads.
+
+    Queries run in waves (see :func:`get_query_waves`). Within a wave, each query
+    runs on its own read-only connection to the temporary database, including
+    any :data:`replace:` and :data:`postprocess:`. Once the whole wave is done,
+    the results are saved to the database in config order, so the next wave
+    can read them. Nothing is saved or dropped while a query in the wave is
+    still running, since SQLite would refuse to change the schema under it.
+
+    Messages from each query are collected and shown in config order,
+    so the output is the same from run to run. Each query is passed on for export
+    as soon as every query before it in the config has been.
+
+    Args:
+        conn: Temporary database in memory
+        config: Report configuration
+        jobs: Maximum number of queries to run at once
+        export_query: Function that exports one query (**see** :func:`run_each_query`)
+    """
+    s = Settings()
+    ctx = get_current_context()
+    database_uri: str = ctx.meta[s.META_DATABASE_URI]
+    queries = config[s.KEY_QUERIES]
+
+    msg_with_data(s.MSG_QUERY_JOBS, data=str(jobs), verbose=1)
+    waves: List[List[int]] = get_query_waves(queries)
+
+    results: dict = {}
+    next_export: int = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for wave in waves:
+            msg_with_data(
+                s.MSG_QUERY_WAVE,
+                data=str(len(wave)),
+                verbose=2,
+            )
+            futures = [
+                (
+                    i,
+                    executor.submit(
+                        run_in_worker,
+                        ctx,
+                        run_query_worker,
+                        database_uri,
+                        config,
+                        queries[i],
+                    ),
+                )
+                for i in wave
+            ]
+            # Queries still running hold locks on the database schema, so nothing
+            # is saved or dropped until every query in the wave has finished.
+            wait([future for _, future in futures])
+            for i, future in futures:
+                df: DataFrame = worker_result(future.result())
+                name: str = queries[i][s.KEY_QUERY__NAME][:]
+                save_query_to_database(df, conn, name)
+                release_temp_tables(conn, name)
+                results[i] = (name, df)
+            while next_export in results:
+                name, df = results.pop(next_export)
+                export_query(name, [df])
+                release_query_tables(conn, name)
+                next_export += 1
+
+
+def run_query_worker(database_uri: str, config: Nob, query: NobView) -> DataFrame:
+    """Run a query on a new read-only connection.
+
+    Important:
+        Intended to run in a worker thread, through
+        :func:`yarm.helpers.run_in_worker`.
+
+    Args:
+        database_uri: URI for the temporary database
+        config: Report configuration
+        query: Configuration for this query
+
+    Returns:
+        Query data after all processing
+    """
+    s = Settings()
+    sql: str = query[s.KEY_QUERY__SQL][:]
+    name: str = query[s.KEY_QUERY__NAME][:]
+    worker_conn: Connection = sqlite3.connect(database_uri, uri=True)
+    try:
+        worker_conn.execute("PRAGMA query_only = ON")
+        register_sql_functions(worker_conn, config, show_messages=False)
+        msg_running_query(sql, name)
+        return run_query(config, query, worker_conn, sql, name)
+    finally:
+        worker_conn.close()
+
+
 def query_options(df: DataFrame, config: Nob, query_config: NobView) -> DataFrame:
     """Process options for a particular query.
 
@@ -72,6 +625,7 @@ def query_options(df: DataFrame, config: Nob, query_config: NobView) -> DataFram
         Query data with all options applied for this query.
 
     See Also:
+        - :func:`yarm.maps.df_map`
         - :func:`df_query_replace`
         - :func:`df_query_postprocess`
         - :func:`yarm.validate.validate_key_queries`
@@ -84,9 +638,16 @@ def query_options(df: DataFrame, config: Nob, query_config: NobView) -> DataFram
     # Process each query option.
     # These options are defined in validate_key_queries()
 
-    df = df_query_replace(df, query_config)
+    name: str = qc[s.KEY_QUERY__NAME][:]
+    if s.KEY_MAP in qc:
+        with time_query_step(name, "map"):
+            df = df_map(df, qc[s.KEY_MAP][:], name)
 
-    df = df_query_postprocess(df, config, query_config)
+    with time_query_step(name, "replace"):
+        df = df_query_replace(df, query_config)
+
+    with time_query_step(name, "postprocess"):
+        df = df_query_postprocess(df, config, query_config)
 
     show_df(df, qc[s.KEY_QUERY__NAME][:])
     return df
@@ -101,6 +662,10 @@ def df_query_replace(df: DataFrame, query_config: NobView) -> DataFrame:
 
     Returns:
         Query data with replacements applied
+
+    See Also:
+        - :func:`compile_replace_rules`
+        - :func:`apply_replace_rules`
     """
     s = Settings()
     qc = query_config
@@ -109,32 +674,106 @@ def df_query_replace(df: DataFrame, query_config: NobView) -> DataFrame:
             if column_name in df.columns:
                 msg_with_data(s.MSG_APPLYING_REPLACE, column_name, indent=1)
                 column = qc[s.KEY_QUERY__REPLACE][column_name]
-                for find in column[:]:
-                    try:
-                        find = str(find)
-                        replace = str(column[find][:])
-                        msg_with_data(find, replace, indent=2)
-                    except KeyError as error:
-                        warn(s.MSG_QUERY_REPLACE_MATCH_ERROR, data=str(error), indent=2)
-                    try:
-                        df[column_name] = df[column_name].str.replace(
-                            find, replace, regex=True
-                        )
-                    # TODO Can this error ever happen?
-                    # except KeyError as error:
-                    #    warn(s.MSG_QUERY_REPLACE_ERROR, data=str(error))
-                    except re.error as error:
-                        warn(
-                            s.MSG_QUERY_REPLACE_MATCH_ERROR,
-                            data=replace,
-                            error=str(error),
-                            indent=3,
-                        )
+                rules: List[ReplaceRule] = compile_replace_rules(column)
+                df[column_name] = apply_replace_rules(df[column_name], rules)
             else:
                 warn(s.MSG_QUERY_REPLACE_COLUMN_ERROR, data=column_name, indent=1)
     return df
 
 
+# A find pattern (compiled, or a plain string for a literal match) and its
+# replacement.
+ReplaceRule = Tuple[Union[str, Pattern], str]
+
+
+def compile_replace_rules(column: NobView) -> List[ReplaceRule]:
+    """Compile the :data:`replace:` rules for one column, once.
+
+    A rule whose match has no special regex characters, and whose replacement
+    has no backslashes, is kept as a plain string. :meth:`str.replace` gives
+    the same result as the regex would, only faster.
+
+    Any rule that is not a valid regex is skipped, with a warning.
+
+    Args:
+        column: Replacements for this column, as :data:`{find: replace}`
+
+    Returns:
+        Rules in config order
+    """
+    s = Settings()
+    rules: List[ReplaceRule] = []
+    for find in column[:]:
+        try:
+            find = str(find)
+            replace = str(column[find][:])
+            msg_with_data(find, replace, indent=2)
+        except KeyError as error:
+            warn(s.MSG_QUERY_REPLACE_MATCH_ERROR, data=str(error), indent=2)
+            continue
+        if not re.search(r"[.^$*+?{}\[\]\\|()]", find) and "\\" not in replace:
+            rules.append((find, replace))
+            continue
+        try:
+            pattern: Pattern = re.compile(find)
+            # Check the replacement too, e.g. for an invalid group reference.
+            pattern.sub(replace, "")
+        except re.error as error:
+            warn(
+                s.MSG_QUERY_REPLACE_MATCH_ERROR,
+                data=replace,
+                error=str(error),
+                indent=3,
+            )
+            continue
+        rules.append((pattern, replace))
+    return rules
+
+
+def apply_replace_rules(series: pd.Series, rules: List[ReplaceRule]) -> pd.Series:
+    """Apply compiled :data:`replace:` rules to a column, in order.
+
+    Each rule applies to the result of the rules before it, exactly as if
+    :meth:`pandas.Series.str.replace` were called once per rule. But for a
+    column of strings, the rules run once per *distinct* value, not once per
+    row, and the results are mapped back onto the rows in a single pass.
+
+    Args:
+        series: Column of query results
+        rules: Rules from :func:`compile_replace_rules`
+
+    Returns:
+        Column with replacements applied
+    """
+    if not rules:
+        return series
+    if series.dtype != object:
+        for find, replace in rules:
+            # Plain strings have no special characters, so either is a valid regex.
+            pat: str = find if isinstance(find, str) else find.pattern
+            series = series.str.replace(pat, replace, regex=True)
+        return series
+
+    def replace_value(value: Any) -> Any:
+        # Like Series.str.replace(), turn any value that is not a string into NaN.
+        if not isinstance(value, str):
+            return float("nan")
+        for find, replace in rules:
+            if isinstance(find, str):
+                value = value.replace(find, replace)
+            else:
+                value = find.sub(replace, value)
+        return value
+
+    # Missing values have code -1, and stay as they are.
+    codes, uniques = pd.factorize(series)
+    replaced: list = [replace_value(value) for value in uniques]
+    result: pd.Series = series.copy()
+    found = codes >= 0
+    result[found] = pd.Series(replaced, dtype=object).to_numpy()[codes[found]]
+    return result
+
+
 def df_query_postprocess(
     df: DataFrame, config: Nob, query_config: NobView
 ) -> DataFrame:
@@ -164,18 +803,10 @@ def df_query_postprocess(
             indent=1,
         )
 
+        found: bool = True
         try:
-            module_name = s.IMPORT_MODULE_NAME
-            postprocess_function = getattr(sys.modules[module_name], postprocess)
-        except AttributeError:
-            abort(
-                s.MSG_POSTPROCESS_FUNCTION_NOT_FOUND,
-                data=postprocess,
-                ps=s.MSG_POSTPROCESS_FUNCTION_NOT_FOUND_PS,
-            )
-
-        try:
-            df = postprocess_function(df)
+            # With postprocess_workers:, this runs in a worker process.
+            found, df = run_postprocess(postprocess, df)
         except TypeError as error:  # pragma: no cover
             # TODO This branch is tested in test_query_error(),
             # but coverage misses it.
@@ -201,7 +832,13 @@ def df_query_postprocess(
                 ps=s.MSG_POSTPROCESS_EXAMINE_CODE,
             )
 
-        if not isinstance(df, DataFrame):
+        if not found:
+            abort(
+                s.MSG_POSTPROCESS_FUNCTION_NOT_FOUND,
+                data=postprocess,
+                ps=s.MSG_POSTPROCESS_FUNCTION_NOT_FOUND_PS,
+            )
+        elif not isinstance(df, DataFrame):
             abort(
                 s.MSG_POSTPROCESS_RETURNED_OTHER,
                 data=postprocess,
@@ -225,21 +862,166 @@ def run_query(config: Nob, query: NobView, conn: Connection, sql: str, name: str
     Returns:
         Initial query results
 
+    Note:
+        With :data:`cache:`, results are loaded from the cache if nothing that
+        could change them has changed since they were saved.
+        See :func:`yarm.cache.get_query_cache_key`.
+
+        With :data:`engine: duckdb`, the SQL runs in DuckDB.
+        See :func:`yarm.engines.read_duckdb_query`.
+
     See Also:
         - :func:`query_options`
     """
     s = Settings()
+    key: Optional[str] = get_query_cache_key(config, query, sql, name)
+    if key:
+        cached_df: Optional[DataFrame] = load_cached_query(config, key, name)
+        explain_rerun(config, name, reused=cached_df is not None)
+        if cached_df is not None:
+            save_fingerprint(name, key)
+            set_query_stat(name, "cached", True)
+            add_query_rows(name, len(cached_df))
+            show_df(cached_df, name)
+            return cached_df
+    elif cache_enabled(config):
+        explain_rerun(config, name, reused=False)
+    params: Union[dict, list] = get_query_params(query)
+    timeout: Optional[float] = get_query_timeout(config, query)
+    duck: Optional[Any] = get_duckdb()
+    if duck is None:
+        explain_query(conn, sql, name, params)
     try:
-        df = pd.read_sql(sql, conn)
+        if duck is not None:
+            df = read_duckdb_query(duck, sql, name, params, timeout)
+        else:
+            df = read_sql_query(conn, sql, name, params, timeout)
         # Empty query results? Sometimes that is desirable, but throw a warning.
         if len(df) == 0:
             warn(s.MSG_QUERY_EMPTY_ERROR, data=name)
         df = query_options(df, config, query)
-    except DatabaseError as error:
+    except (DatabaseError, sqlite3.Error) as error:
         abort(s.MSG_QUERY_RUN_ERROR, data=name, error=str(error))
+    add_query_rows(name, len(df))
+    if key:
+        save_cached_query(config, key, name, df)
+        save_fingerprint(name, key)
     return df
 
 
+def read_sql_query(
+    conn: Connection,
+    sql: str,
+    name: str,
+    params: Optional[Union[dict, list]] = None,
+    timeout: Optional[float] = None,
+) -> DataFrame:
+    """Run a query in SQLite, then build a DataFrame from the results.
+
+    Like :func:`pandas.read_sql`, but the two steps are timed separately
+    for :data:`--query-stats`.
+
+    Args:
+        conn: Temporary database in memory
+        sql: SQL statement for this query
+        name: Name for this query
+        params: Parameters to bind to the SQL (**see** :func:`get_query_params`)
+        timeout: Stop the query after this many seconds (**see** :func:`watch_query`)
+
+    Returns:
+        Initial query results
+    """
+    with time_query_step(name, "sqlite"), watch_query(conn, name, timeout):
+        cursor: sqlite3.Cursor = conn.execute(sql, params or ())
+        try:
+            rows: list = cursor.fetchall()
+            columns: List[str] = [col[0] for col in cursor.description or []]
+        finally:
+            cursor.close()
+    with time_query_step(name, "dataframe"):
+        return DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+def get_query_timeout(config: Nob, query: NobView) -> Optional[float]:
+    """Return the timeout for a query: its own :data:`timeout:`, or the global one.
+
+    Args:
+        config: Report configuration
+        query: Configuration for this query
+
+    Returns:
+        Timeout in seconds, or :data:`None` for no timeout
+    """
+    s = Settings()
+    if s.KEY_QUERY__TIMEOUT in query:
+        return float(query[s.KEY_QUERY__TIMEOUT][:])
+    if s.KEY_TIMEOUT in config:
+        return float(config[s.KEY_TIMEOUT][:])
+    return None
+
+
+@contextmanager
+def watch_query(
+    conn: Connection, name: str, timeout: Optional[float] = None
+) -> Iterator[None]:
+    """Show progress for a long query, and stop it if it runs past its timeout.
+
+    Every :data:`QUERY_PROGRESS_STEPS` SQLite VM steps, a progress handler checks
+    the clock. Once the query has run for :data:`QUERY_PROGRESS_SECONDS`, it shows
+    how long the query has run and how many steps it has taken, and does so
+    again at the same interval. Past the timeout, the handler interrupts SQLite.
+
+    Args:
+        conn: Connection running the query
+        name: Name for this query
+        timeout: Stop the query after this many seconds. If None, never stop it.
+
+    Yields:
+        Nothing; run the query inside the :data:`with` block
+    """
+    s = Settings()
+    start: float = time.monotonic()
+    progress: dict = {
+        "steps": 0,
+        "next_report": start + s.QUERY_PROGRESS_SECONDS,
+        "timed_out": False,
+    }
+
+    def check_query() -> int:
+        progress["steps"] += s.QUERY_PROGRESS_STEPS
+        now: float = time.monotonic()
+        if timeout is not None and now - start > timeout:
+            progress["timed_out"] = True
+            # Any value other than 0 interrupts the query.
+            return 1
+        if now >= progress["next_report"]:
+            msg_with_data(
+                s.MSG_QUERY_PROGRESS,
+                data=f"{name} ({now - start:.0f}s, {progress['steps']:,} steps)",
+                verbose=0,
+                indent=1,
+            )
+            progress["next_report"] = now + s.QUERY_PROGRESS_SECONDS
+        return 0
+
+    conn.set_progress_handler(check_query, s.QUERY_PROGRESS_STEPS)
+    try:
+        yield
+    except sqlite3.OperationalError:
+        if not progress["timed_out"]:
+            raise
+        abort(
+            s.MSG_QUERY_RUN_ERROR,
+            data=name,
+            error=(
+                f"{s.MSG_QUERY_TIMED_OUT}: {time.monotonic() - start:.1f}"
+                f" (timeout: {timeout:g})"
+            ),
+        )
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
 def save_query_to_database(df: DataFrame, conn: Connection, name: str):
     """Save the processed query to the database.
 
@@ -250,7 +1032,7 @@ def save_query_to_database(df: DataFrame, conn: Connection, name: str):
     """
     s = Settings()
     try:
-        df.to_sql(name, conn, index=False)
+        df.to_sql(name, conn, index=False, if_exists="fail")
     except DatabaseError as error:  # pragma: no cover
         # TODO Does this error ever trigger?
         abort(s.MSG_QUERY_SAVE_ERROR, data=name, error=str(error))
@@ -0,0 +1,173 @@
+"""Record the state of each run, and explain why each query runs again."""
+import hashlib
+import json
+import os
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from click import get_current_context
+from nob.nob import Nob
+
+from yarm.helpers import msg_with_data
+from yarm.helpers import warn
+from yarm.settings import Settings
+
+
+def explain_rerun_enabled() -> bool:
+    """Return :data:`True` if the report was run with :data:`--explain-rerun`.
+
+    Returns:
+        True if the reason for running or reusing each query should be shown
+    """
+    s = Settings()
+    ctx = get_current_context()
+    return bool(ctx.params[s.ARG_EXPLAIN_RERUN])
+
+
+def get_run_state_path(config: Nob) -> str:
+    """Return path to the file with the state of the last successful run.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Path to run state file, in the cache dir
+    """
+    s = Settings()
+    cache_dir: str = os.fspath(config[s.KEY_CACHE__DIR][:])
+    return os.path.join(cache_dir, s.FILE_RUN_STATE)
+
+
+def get_run_state() -> Dict[str, Any]:
+    """Return the state of each query so far in this run.
+
+    Returns:
+        Dictionary of :data:`{name: query state}`
+
+    See Also:
+        - :func:`record_query_state`
+    """
+    s = Settings()
+    ctx = get_current_context()
+    return ctx.meta.setdefault(s.META_RUN_STATE, {})  # type: ignore
+
+
+def record_query_state(name: str, parts: Dict[str, Any]):
+    """Record what went into a query's cache key, to compare with the next run.
+
+    Each part is stored as a short hash, except for the tables, which keep
+    their fingerprints by name, so that a changed table can be named.
+
+    Args:
+        name: Name for this query
+        parts: Parts of the cache key (see :func:`yarm.cache.get_query_cache_key`)
+    """
+    state: Dict[str, Any] = {
+        part: hashlib.sha256(json.dumps(value, default=str).encode()).hexdigest()
+        for part, value in parts.items()
+        if part != "tables"
+    }
+    state["tables"] = dict(parts["tables"])
+    get_run_state()[name] = state
+
+
+def load_last_run_state(config: Nob) -> Dict[str, Any]:
+    """Load the state of each query from the last successful run.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Dictionary of :data:`{name: query state}`; empty if there was no last run
+    """
+    s = Settings()
+    path: str = get_run_state_path(config)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            return dict(json.load(f))
+    except (OSError, ValueError) as error:
+        warn(s.MSG_RUN_STATE_READ_ERROR, error=str(error), file_path=path)
+        return {}
+
+
+def get_rerun_reasons(
+    last: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]
+) -> List[str]:
+    """Compare a query's state with the last run, and list what has changed.
+
+    Args:
+        last: State of this query in the last run, if it ran then
+        current: State of this query in this run, if it can be cached
+
+    Returns:
+        Reasons to run the query again; empty if nothing has changed
+    """
+    s = Settings()
+    if current is None:
+        return [s.MSG_RERUN_UNCACHEABLE]
+    if last is None:
+        return [s.MSG_RERUN_NEW]
+    reasons: List[str] = [
+        description
+        for part, description in s.RERUN_PARTS.items()
+        if last.get(part) != current.get(part)
+    ]
+    last_tables: Dict[str, str] = last.get("tables", {})
+    for table, fingerprint in current["tables"].items():
+        if last_tables.get(table) != fingerprint:
+            reasons.append(f"{s.MSG_RERUN_TABLE_CHANGED}: {table}")
+    return reasons
+
+
+def explain_rerun(config: Nob, name: str, reused: bool):
+    """Show why a query is running again, or that its last results are reused.
+
+    Only shown with :data:`--explain-rerun`.
+
+    Args:
+        config: Report configuration
+        name: Name for this query
+        reused: True if the query's results were loaded from the cache
+    """
+    s = Settings()
+    if not explain_rerun_enabled():
+        return
+    if reused:
+        msg_with_data(s.MSG_RERUN_REUSED, data=name, verbose=0)
+        return
+    ctx = get_current_context()
+    if s.META_LAST_RUN_STATE not in ctx.meta:
+        ctx.meta[s.META_LAST_RUN_STATE] = load_last_run_state(config)
+    last_run: Dict[str, Any] = ctx.meta[s.META_LAST_RUN_STATE]
+    reasons: List[str] = get_rerun_reasons(
+        last_run.get(name), get_run_state().get(name)
+    )
+    if not reasons:
+        # Nothing changed, but the results were evicted or never saved.
+        reasons = [s.MSG_RERUN_NOT_CACHED]
+    msg_with_data(s.MSG_RERUN_RUNNING, data=f"{name} ({'; '.join(reasons)})", verbose=0)
+
+
+def save_run_state(config: Nob):
+    """Save the state of each query, once the whole report has run successfully.
+
+    The state is saved in the cache dir, so nothing is saved without
+    :data:`cache:`.
+
+    Args:
+        config: Report configuration
+    """
+    s = Settings()
+    if s.KEY_CACHE__DIR not in config:
+        return
+    path: str = get_run_state_path(config)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(get_run_state(), f, indent=2)
+    except OSError as error:
+        warn(s.MSG_RUN_STATE_WRITE_ERROR, error=str(error), file_path=path)
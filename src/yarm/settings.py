@@ -18,6 +18,27 @@ class Settings:
     ARG_VERBOSE: str = "verbose"
     ARG_EXPORT_DATABASE: str = "database"
     ARG_FORCE: str = "force"
+    ARG_JOBS: str = "jobs"
+    ARG_QUERY_STATS: str = "query_stats"
+    ARG_EXPLAIN_RERUN: str = "explain_rerun"
+
+    # Keys for click's ctx.meta, which holds state for the current run.
+    META_DATABASE_URI: str = "yarm_database_uri"
+    META_MANIFEST: str = "yarm_manifest"
+    META_LAST_MANIFEST: str = "yarm_last_manifest"
+    META_OUTPUT_ROWS: str = "yarm_output_rows"
+    META_QUERY_STATS: str = "yarm_query_stats"
+    META_MAPPINGS: str = "yarm_mappings"
+    META_POSTPROCESS_POOL: str = "yarm_postprocess_pool"
+    META_DUCKDB: str = "yarm_duckdb"
+    META_ENGINE_TABLES: str = "yarm_engine_tables"
+    META_TEMP_TABLES: str = "yarm_temp_tables"
+    META_QUERY_READERS: str = "yarm_query_readers"
+    META_RUN_STATE: str = "yarm_run_state"
+    META_LAST_RUN_STATE: str = "yarm_last_run_state"
+    # Named in-memory database, so that worker threads can open their own
+    # connections to it. Format with a name unique to this run.
+    DATABASE_URI: str = "file:yarm_{}?mode=memory&cache=shared"
 
     # Maximum number of -v switches.
     MAX_VERBOSE = 4
@@ -72,7 +93,32 @@ try surrounding the entire value with single or double quote marks."""
 
     CONFIG_SCHEMA = "config_schema.yaml"
 
-    SCHEMA_EXPORT_FORMATS: list = ["csv", "xlsx"]
+    SCHEMA_EXPORT_FORMATS: list = ["csv", "xlsx", "parquet", "feather"]
+    # Export formats written through Arrow, with output: arrow
+    ARROW_EXPORT_FORMATS: list = ["parquet", "feather"]
+    SCHEMA_ARROW_COMPRESSIONS: list = [
+        "none",
+        "snappy",
+        "gzip",
+        "brotli",
+        "lz4",
+        "zstd",
+    ]
+    # Feather files support only these compressions.
+    FEATHER_COMPRESSIONS: list = ["none", "lz4", "zstd"]
+    # Defaults for output: arrow, for each export format.
+    ARROW_DEFAULTS: dict = {
+        "parquet": {
+            "compression": "snappy",
+            "dictionary": True,
+            "row_group_size": 100000,
+        },
+        "feather": {
+            "compression": "lz4",
+            "dictionary": False,
+            "row_group_size": 100000,
+        },
+    }
 
     MSG_TEST_KEY_NOT_IN_SCHEMA: str = "key not in schema"
     MSG_TEST_EXPECTED_LIST: str = "found a mapping"
@@ -116,6 +162,25 @@ with a higher level of verbosity, such as """
         "You need to add an import: rule for your code."
     )
 
+    # postprocess_workers
+    MSG_POSTPROCESS_WORKERS: str = "Running postprocess functions in worker processes"
+    MSG_POSTPROCESS_WORKERS_ERROR: str = "postprocess_workers must be at least 1, not"
+    MSG_POSTPROCESS_WORKER_FAILED: str = "Worker process failed while running"
+
+    # sql_functions
+    # Number of compiled patterns to keep for the REGEXP operator.
+    REGEXP_CACHE_SIZE: int = 256
+    MSG_REGISTERING_SQL_FUNCTION: str = "Registering SQL function"
+    MSG_REGISTERING_SQL_AGGREGATE: str = "Registering SQL aggregate"
+    MSG_SQL_FUNCTION_NOT_FOUND: str = "Could not find SQL function"
+    MSG_SQL_FUNCTION_NOT_FOUND_PS: str = (
+        "Are you sure you defined this function in your import: code?"
+    )
+    MSG_SQL_FUNCTION_NOT_CALLABLE: str = (
+        "SQL function must be a function, or a class with step() and finalize()"
+    )
+    MSG_SQL_FUNCTIONS_BUT_NO_IMPORT: str = "No imported code found for SQL functions"
+
     # tables_config
     MSG_CREATING_TABLE: str = "Creating table"
     MSG_CREATED_TABLE: str = "Table created"
@@ -146,6 +211,22 @@ with a higher level of verbosity, such as """
     MSG_INCLUDE_INDEX_TABLE_CONFLICT_PS: str = (
         "Please define 'include_index' for only one path, at most, in each table."
     )
+    MSG_DEDUPLICATE_TABLE: str = (
+        "deduplicate: Duplicate rows will be removed from table"
+    )
+    MSG_DEDUPLICATE_TABLE_COLUMNS: str = (
+        "deduplicate: Rows are duplicates if they match on"
+    )
+    MSG_DEDUPLICATE_REMOVED: str = "Duplicate rows removed"
+    MSG_DEDUPLICATE_KEY_ERROR: str = (
+        "Could not deduplicate, because this column is missing"
+    )
+    MSG_DEDUPLICATE_TABLE_CONFLICT: str = (
+        "More than one 'deduplicate' defined for this table"
+    )
+    MSG_DEDUPLICATE_TABLE_CONFLICT_PS: str = (
+        "Please define 'deduplicate' for only one path, at most, in each table."
+    )
     MSG_MERGING_PATH: str = "Merging path"
     MSG_CONCAT_PATH: str = "Joining path with pandas.concat()"
     MSG_MERGE_ORIGINAL: str = "Original dataframe"
@@ -180,14 +261,108 @@ To fix: specify the same datetime format for this column on every path.
     MSG_CREATE_TABLE_VALUE_ERROR: str = "Value Error: Could not create table"
     MSG_MISSING_DATETIME: str = "Column under 'datetime:' not found"
     MSG_PIVOT_FAILED_KEY_ERROR: str = "Pivot failed, because this column is missing"
+    MSG_APPLYING_WHERE: str = "Keeping only rows where"
+    MSG_WHERE_ROWS_KEPT: str = "Rows kept"
+    MSG_WHERE_ERROR: str = "Could not apply 'where' expression"
+    MSG_WHERE_ERROR_PS: str = """Remember:
+    - 'where' uses the column names *after* any input: options are applied.
+    - Quote strings, e.g. region == 'West'
+    - Use backticks for column names with spaces, e.g. `fiscal year` == 2022"""
+    MSG_WHERE_NOT_COLUMN: str = "Not a column"
+    MSG_WHERE_UNSAFE: str = "This 'where' expression is not allowed"
+    MSG_WHERE_UNSAFE_PS: str = (
+        "A 'where' expression may only compare columns with values, using "
+        "comparisons, 'in', 'and', 'or', 'not' and arithmetic. Variables (@name), "
+        "attributes, function or method calls, indexing and powers (**) are "
+        "not allowed."
+    )
+    # Kinds of node (from the ast module) allowed in a 'where' expression
+    WHERE_ALLOWED_NODES: tuple = (
+        "Expression",
+        "Name",
+        "Load",
+        "Constant",
+        "List",
+        "Tuple",
+        "Compare",
+        "Eq",
+        "NotEq",
+        "Lt",
+        "LtE",
+        "Gt",
+        "GtE",
+        "In",
+        "NotIn",
+        "BoolOp",
+        "And",
+        "Or",
+        "UnaryOp",
+        "Not",
+        # Negative numbers, e.g. balance < -100
+        "USub",
+        "UAdd",
+        # Arithmetic, e.g. price * quantity > 1000. No Pow: 9 ** 9 ** 9 would
+        # hang the report.
+        "BinOp",
+        "Add",
+        "Sub",
+        "Mult",
+        "Div",
+        "FloorDiv",
+        "Mod",
+    )
+
+    # A SELECT statement, after any comments, for CREATE TABLE ... AS
+    RE_SELECT_STATEMENT: str = (
+        r"\s*(?:(?:--[^\n]*(?:\n|$)|/\*.*?\*/)\s*)*(?:SELECT|WITH)\b"
+    )
+    # Number of rows to read at a time when filtering a CSV with 'where'.
+    INPUT_CHUNKSIZE: int = 100000
+    # Number of rows to read at a time when streaming a query to export.
+    QUERY_CHUNKSIZE: int = 100000
+    # With output: manifest, outputs are written here inside the output dir,
+    # then moved into place only if their content has changed.
+    DIR_OUTPUT_TEMP: str = ".yarm_tmp"
+    FILE_MANIFEST: str = "manifest.json"
+    MANIFEST_FILES: str = "files"
+    # Parts of an xlsx file that change every time it is saved.
+    XLSX_VOLATILE_PARTS: tuple = ("docProps/core.xml",)
+    # Number of bytes to read at a time when hashing an output.
+    HASH_BLOCK_BYTES: int = 1 << 20
+    # Number of rows to fetch at a time when exporting a table.
+    EXPORT_FETCH_ROWS: int = 10000
+    # With parquet or feather output, hold at most this many rows while a
+    # column's type is still unknown, because every value so far is empty.
+    ARROW_SCHEMA_ROWS: int = 100000
+    # Number of rows to format at a time when writing a CSV.
+    CSV_WRITE_ROWS: int = 10000
+    # With output: compression, hold at most this many blocks of CSV text
+    # while they wait to be compressed.
+    CSV_COMPRESSION_QUEUE: int = 8
+    # With output: compression, extension added after .csv
+    COMPRESSION_EXTS: dict = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+    # With output: compression, (lowest, highest, default) compression level
+    COMPRESSION_LEVELS: dict = {"gzip": (1, 9, 6), "xz": (0, 9, 6), "zstd": (1, 22, 3)}
+    # With output: xlsx_write_only, convert this many rows at a time for openpyxl.
+    XLSX_WRITE_ONLY_ROWS: int = 10000
+    # With output: styles: column_width: auto, measure at most this many rows
+    # of each sheet, evenly spaced, plus a little padding.
+    COLUMN_WIDTH_SAMPLE_ROWS: int = 10000
+    COLUMN_WIDTH_PADDING: int = 2
+    # Excel's widest column, in characters
+    COLUMN_WIDTH_MAX: int = 255
 
     # NOTE These keys are for use with Nob objects, not for validating YAML schemas.
     KEY_IMPORT = "/import"
     # within each imported module:
     KEY_MODULE__PATH = "/path"
     KEY_TABLES_CONFIG = "/tables_config"
-    # Sheet relative to table
+    # Path and sheet relative to table source
+    KEY_TABLE__PATH = "/path"
     KEY_TABLE__SHEET = "/sheet"
+    KEY_TABLE__WHERE = "/where"
+    # map: is relative to a table source, or to a query.
+    KEY_MAP = "/map"
     KEY_OUTPUT__BASENAME = "/output/basename"
     KEY_OUTPUT__DIR = "/output/dir"
     KEY_INPUT = "/input"
@@ -198,7 +373,25 @@ To fix: specify the same datetime format for this column on every path.
     KEY_INPUT__INCLUDE_INDEX = "/input/include_index"
     KEY_OUTPUT__EXPORT_TABLES = "/output/export_tables"
     KEY_OUTPUT__EXPORT_QUERIES = "/output/export_queries"
+    KEY_OUTPUT__STREAM_QUERIES = "/output/stream_queries"
+    KEY_OUTPUT__MANIFEST = "/output/manifest"
+    KEY_OUTPUT__ARROW = "/output/arrow"
+    KEY_OUTPUT__COMPRESSION = "/output/compression"
+    KEY_OUTPUT__COMPRESSION_LEVEL = "/output/compression_level"
+    KEY_OUTPUT__EXPORT_WORKERS = "/output/export_workers"
+    KEY_OUTPUT__XLSX_WRITE_ONLY = "/output/xlsx_write_only"
+    KEY_OUTPUT__DATABASE_PAGE_SIZE = "/output/database_page_size"
+    KEY_OUTPUT__DATABASE_VACUUM = "/output/database_vacuum"
+    KEY_OUTPUT__STYLES__COLUMN_WIDTH = "/output/styles/column_width"
     KEY_QUERIES = "/queries"
+    KEY_SQL_FUNCTIONS = "/sql_functions"
+    KEY_POSTPROCESS_WORKERS = "/postprocess_workers"
+    KEY_TIMEOUT = "/timeout"
+    KEY_ENGINE = "/engine"
+    KEY_TEMP_TABLES = "/temp_tables"
+    KEY_CACHE = "/cache"
+    KEY_CACHE__DIR = "/cache/dir"
+    KEY_CACHE__MAX_SIZE = "/cache/max_size"
 
     # tables_config keys. They are deep in the path, so do not use /.
     KEY_PIVOT = "pivot"
@@ -210,12 +403,20 @@ To fix: specify the same datetime format for this column on every path.
     KEY_DATETIME = "datetime"
     # Individual paths can override the include_index.
     KEY_INCLUDE_INDEX = "include_index"
+    # Like include_index, this is set on one path but applies to the whole table.
+    KEY_DEDUPLICATE = "deduplicate"
 
     # Individual query options
     KEY_QUERY__SQL = "/sql"
     KEY_QUERY__NAME = "/name"
     KEY_QUERY__REPLACE = "/replace"
     KEY_QUERY__POSTPROCESS = "/postprocess"
+    KEY_QUERY__PARAMS = "/params"
+    KEY_QUERY__TIMEOUT = "/timeout"
+
+    # Individual temp table options
+    KEY_TEMP_TABLE__SQL = "/sql"
+    KEY_TEMP_TABLE__INDEX = "/index"
 
     CSV = "csv"
     XLSX = "xlsx"
@@ -230,6 +431,13 @@ To fix: specify the same datetime format for this column on every path.
     MSG_REMOVED_FILE_FORCE: str = "Automatic overwrite (--force), removed file"
     MSG_CREATING_DATABASE: str = "Creating database"
     MSG_DATABASE_EXPORTED: str = "Database exported to"
+    MSG_DATABASE_BACKUP_PROGRESS: str = "Copied database pages"
+    MSG_DATABASE_VACUUM: str = "Rebuilding database file with VACUUM"
+    MSG_DATABASE_PAGE_SIZE_ERROR: str = (
+        "database_page_size must be a power of 2 from 512 to 65536, not"
+    )
+    # Copy this many pages of the database at a time, with --database.
+    DATABASE_BACKUP_PAGES: int = 4096
     MSG_OVERWRITE_FILE_ABORT: str = "Cannot proceed without overwriting"
 
     MSG_EXPORTING_TABLES: str = "Exporting tables to"
@@ -240,6 +448,31 @@ To fix: specify the same datetime format for this column on every path.
     MSG_QUERY_EXPORTED: str = "Query exported to"
     MSG_QUERY_EXPORTED_SHEET: str = "Query exported to sheet"
     MSG_SHEETS_EXPORTED: str = "All sheets saved in"
+    MSG_OUTPUT_UNCHANGED: str = "Content unchanged, kept existing file"
+    MSG_OVERWRITE_IF_CHANGED: str = "Will replace file if its content has changed"
+    MSG_MANIFEST_SAVED: str = "Manifest of outputs saved to"
+    MSG_MANIFEST_READ_ERROR: str = "Could not read manifest from the last run"
+    MSG_PYARROW_MISSING: str = "Exporting Parquet or Feather files requires pyarrow"
+    MSG_PYARROW_MISSING_PS: str = "To install it, type: pip install pyarrow"
+    MSG_ARROW_EXPORT_ERROR: str = "Could not convert data to Arrow for"
+    MSG_ARROW_EXPORT_PS: str = (
+        "Each column needs one type. In your SQL, use CAST() to give it one."
+    )
+    MSG_ARROW_ROW_GROUP_SIZE_ERROR: str = "row_group_size must be at least 1, not"
+    MSG_FEATHER_COMPRESSION_ERROR: str = "Feather files cannot use compression"
+    MSG_ARROW_DICTIONARY_ERROR: str = "arrow: dictionary is only used for Parquet files"
+    MSG_ARROW_DICTIONARY_PS: str = "Remove it, or export to parquet"
+    MSG_COMPRESSION_LEVEL_ERROR: str = "compression_level is out of range for"
+    MSG_COMPRESSION_LEVEL_NO_COMPRESSION: str = "compression_level requires compression"
+    MSG_CSV_COMPRESSION_ERROR: str = "Could not compress CSV"
+    MSG_ZSTANDARD_MISSING: str = "compression: zstd requires zstandard"
+    MSG_ZSTANDARD_MISSING_PS: str = "To install it, type: pip install zstandard"
+    MSG_EXPORT_WORKERS: str = "Writing CSV files in parallel, workers"
+    MSG_EXPORT_WORKERS_ERROR: str = "export_workers must be at least 1, not"
+    MSG_COLUMN_WIDTH_ERROR: str = (
+        "column_width must be auto, or a number from 1 to 255, not"
+    )
+    MSG_STREAMING_QUERIES: str = "Exporting each query as it finishes, to format"
     MSG_EXPORT_FORMAT_UNRECOGNIZED: str = "Format for export_tables not recognized"
 
     MSG_OUTPUT_DIR_EXISTS: str = "Output directory already exists"
@@ -270,6 +503,103 @@ Your postprocess function must take a DataFrame as its one argument,
 and return the processed DataFrame as its one result."""
     MSG_POSTPROCESS_EXAMINE_CODE: str = "This error seems to be in your custom code."
     MSG_QUERY_SAVE_ERROR: str = "Could not save query to database"
+    MSG_QUERY_JOBS: str = "Running independent queries in parallel, jobs"
+    MSG_QUERY_WAVE: str = "Starting queries that depend only on finished queries"
+    MSG_QUERY_DEPENDS_ON: str = "Depends on"
+    MSG_JOBS_ERROR: str = "Number of jobs must be at least 1, not"
+    # Check the clock every this many SQLite VM steps while a query runs.
+    QUERY_PROGRESS_STEPS: int = 100000
+    # Show progress for a query that runs this long, then again this often.
+    QUERY_PROGRESS_SECONDS: float = 5.0
+    MSG_QUERY_PROGRESS: str = "Query still running"
+    MSG_QUERY_TIMED_OUT: str = "Query stopped at its timeout, seconds spent"
+    MSG_TIMEOUT_ERROR: str = "timeout must be more than 0 seconds, not"
+    MSG_QUERY_TABLE_DROPPED: str = "No more queries need query, dropped its table"
+    MSG_EXPANDING_QUERY_TEMPLATE: str = "Expanding query template, parameter sets"
+    MSG_QUERY_PARAMS_NAME_ERROR: str = "Could not name each query in template"
+    MSG_QUERY_PARAMS_NAME_PS: str = """Each set of params: needs a different query name.
+Use the parameters in the name, e.g. "Orders {region}" or "Orders {0}"."""
+
+    # query stats
+    FILE_QUERY_STATS_SUFFIX: str = "_query_stats.json"
+    # Steps timed for each query, in seconds.
+    QUERY_STATS_STEPS: tuple = (
+        "sqlite",
+        "duckdb",
+        "dataframe",
+        "map",
+        "replace",
+        "postprocess",
+    )
+    # Warn about any query that takes at least this many seconds.
+    QUERY_SLOW_SECONDS: float = 1.0
+    MSG_QUERY_STATS_SAVED: str = "Query stats saved to"
+    MSG_QUERY_SLOW: str = "Slow query"
+    MSG_QUERY_FULL_SCAN: str = "Query scans a whole table"
+
+    # map
+    MAP_FILE_EXTS: tuple = (".csv", ".parquet")
+    MSG_APPLYING_MAP: str = "Mapping values with"
+    MSG_LOADING_MAP: str = "Loading mapping file"
+    MSG_MAP_BAD_FILE_EXT: str = "Mapping file must be CSV or Parquet"
+    MSG_MAP_COLUMN_ERROR: str = "Could not find key or value column in mapping file"
+    MSG_MAP_COLUMN_MISSING: str = "Could not find column to map"
+    MSG_MAP_DUPLICATE_KEYS: str = (
+        "Mapping file has duplicate keys, using the first value for each"
+    )
+    MSG_MAP_PARQUET_MISSING: str = "Reading Parquet files requires pyarrow"
+    MSG_MAP_PARQUET_MISSING_PS: str = "To install it, type: pip install pyarrow"
+
+    # temp tables
+    MSG_CREATING_TEMP_TABLE: str = "Creating temp table"
+    MSG_CREATING_TEMP_INDEX: str = "Creating index on columns"
+    MSG_TEMP_TABLE_ERROR: str = "Could not create temp table"
+    MSG_TEMP_TABLE_UNUSED: str = "No query uses temp table, skipping"
+    MSG_TEMP_TABLE_DROPPED: str = "No more queries need temp table, dropped"
+
+    # engines
+    ENGINE_SQLITE: str = "sqlite"
+    ENGINE_DUCKDB: str = "duckdb"
+    ENGINES: tuple = (ENGINE_SQLITE, ENGINE_DUCKDB)
+    MSG_DUCKDB_MISSING: str = "engine: duckdb requires duckdb"
+    MSG_DUCKDB_MISSING_PS: str = "To install it, type: pip install duckdb"
+    MSG_DUCKDB_LOADING: str = "Running queries in DuckDB, tables"
+    MSG_DUCKDB_JOBS: str = "DuckDB uses several threads for each query, ignoring jobs"
+    MSG_DUCKDB_SQL_FUNCTIONS_ERROR: str = "sql_functions is not available with engine"
+
+    # cache
+    # Default maximum size of query cache, in megabytes.
+    CACHE_MAX_SIZE: int = 1024
+    CACHE_FILE_EXT: str = ".pkl"
+    META_FINGERPRINTS: str = "yarm_fingerprints"
+    MSG_CACHE_HIT: str = "Query cache hit, skipping query"
+    MSG_CACHE_MISS: str = "Query cache miss, running query"
+    MSG_CACHE_UNCACHEABLE: str = "Query cannot be cached, no fingerprint for"
+    MSG_CACHE_READ_ERROR: str = "Could not read from query cache"
+    MSG_CACHE_WRITE_ERROR: str = "Could not write to query cache"
+    MSG_CACHE_EVICTED: str = "Removed from query cache (max_size reached)"
+
+    # run state, for --explain-rerun
+    FILE_RUN_STATE: str = "run_state.json"
+    # Describe each part of a query's cache key, when it changes.
+    RERUN_PARTS: dict = {
+        "sql": "sql: changed",
+        "engine": "engine: changed",
+        "params": "params: changed",
+        "map": "map: or its mapping file changed",
+        "replace": "replace: changed",
+        "postprocess": "postprocess: changed",
+        "imports": "code in import: changed",
+    }
+    MSG_RERUN_REUSED: str = "Reusing query, unchanged since last run"
+    MSG_RERUN_RUNNING: str = "Rerunning query"
+    MSG_RERUN_NEW: str = "not in last run"
+    MSG_RERUN_TABLE_CHANGED: str = "table changed"
+    MSG_RERUN_NOT_CACHED: str = "results not in cache"
+    MSG_RERUN_UNCACHEABLE: str = "cannot be cached"
+    MSG_RERUN_NO_CACHE: str = "--explain-rerun needs cache:, so every query will run"
+    MSG_RUN_STATE_READ_ERROR: str = "Could not read state of last run"
+    MSG_RUN_STATE_WRITE_ERROR: str = "Could not save state of this run"
 
     MSG_SUCCESS_REPORT_COMPLETE: str = (
         "Report run complete, output file(s) exported to directory"
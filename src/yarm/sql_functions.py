@@ -0,0 +1,114 @@
+"""Register Python functions for use inside SQL."""
+import inspect
+import re
+import sqlite3
+import sys
+from functools import lru_cache
+from sqlite3 import Connection
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Pattern
+
+from nob.nob import Nob
+
+from yarm.helpers import abort
+from yarm.helpers import msg_with_data
+from yarm.helpers import verbose_ge
+from yarm.settings import Settings
+
+
+def register_sql_functions(conn: Connection, config: Nob, show_messages: bool = True):
+    """Register the :data:`REGEXP` operator and any :data:`sql_functions:`.
+
+    SQLite functions belong to a connection, so this must be called for every
+    connection that runs queries.
+
+    Args:
+        conn: Connection to temporary database in memory
+        config: Report configuration
+        show_messages: If False, register quietly (e.g. for a worker connection)
+
+    See Also:
+        - :func:`yarm.validate.validate_key_sql_functions`
+    """
+    s = Settings()
+    conn.create_function("REGEXP", 2, regexp, deterministic=True)
+    # Show the real error if a function fails, not just a generic SQLite error.
+    sqlite3.enable_callback_tracebacks(verbose_ge(3))
+
+    if s.KEY_SQL_FUNCTIONS not in config:
+        return
+    for name in config[s.KEY_SQL_FUNCTIONS][:]:
+        function: Any = getattr(sys.modules[s.IMPORT_MODULE_NAME], name, None)
+        if function is None:
+            abort(
+                s.MSG_SQL_FUNCTION_NOT_FOUND,
+                data=name,
+                ps=s.MSG_SQL_FUNCTION_NOT_FOUND_PS,
+            )
+        if inspect.isclass(function):
+            # isclass() narrows to type[object], which has no step() to check.
+            aggregate: Any = function
+            if not (hasattr(aggregate, "step") and hasattr(aggregate, "finalize")):
+                abort(s.MSG_SQL_FUNCTION_NOT_CALLABLE, data=name)
+            # Don't count 'self'.
+            num_args: int = count_args(aggregate.step) - 1
+            if show_messages:
+                msg_with_data(s.MSG_REGISTERING_SQL_AGGREGATE, data=name, verbose=2)
+            conn.create_aggregate(name, num_args, aggregate)
+        elif callable(function):
+            if show_messages:
+                msg_with_data(s.MSG_REGISTERING_SQL_FUNCTION, data=name, verbose=2)
+            conn.create_function(name, count_args(function), function)
+        else:
+            abort(s.MSG_SQL_FUNCTION_NOT_CALLABLE, data=name)
+
+
+def count_args(function: Callable) -> int:
+    """Count the arguments a function takes, for SQLite.
+
+    Args:
+        function: Function to inspect
+
+    Returns:
+        Number of positional arguments, or :data:`-1` if it takes :data:`*args`
+    """
+    num_args: int = 0
+    for param in inspect.signature(function).parameters.values():
+        if param.kind == param.VAR_POSITIONAL:
+            return -1
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+            num_args += 1
+    return num_args
+
+
+@lru_cache(maxsize=Settings.REGEXP_CACHE_SIZE)
+def compile_pattern(pattern: str) -> Pattern[str]:
+    """Compile a regex, once per pattern.
+
+    Args:
+        pattern: Regular expression
+
+    Returns:
+        Compiled pattern
+    """
+    return re.compile(pattern)
+
+
+def regexp(pattern: Optional[str], value: Any) -> Optional[bool]:
+    """Implement the SQLite :data:`REGEXP` operator.
+
+    :data:`value REGEXP pattern` is true if the pattern matches anywhere in the
+    value, as with :func:`re.search`.
+
+    Args:
+        pattern: Regular expression
+        value: Value to search
+
+    Returns:
+        Whether the pattern matches, or :data:`None` if either side is NULL
+    """
+    if pattern is None or value is None:
+        return None
+    return compile_pattern(pattern).search(str(value)) is not None
@@ -0,0 +1,202 @@
+"""Record time, rows and query plan for each query."""
+import json
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from sqlite3 import Connection
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Union
+
+from click import get_current_context
+from nob.nob import Nob
+
+from yarm.export import get_output_dir_path
+from yarm.helpers import msg_with_data
+from yarm.helpers import overwrite_file
+from yarm.helpers import warn
+from yarm.manifest import output_file
+from yarm.settings import Settings
+
+
+def query_stats_enabled() -> bool:
+    """Return :data:`True` if the report was run with :data:`--query-stats`.
+
+    Returns:
+        True if query stats should be recorded
+    """
+    s = Settings()
+    ctx = get_current_context()
+    return bool(ctx.params[s.ARG_QUERY_STATS])
+
+
+def get_query_stats(name: str) -> Dict[str, Any]:
+    """Return the stats recorded so far for a query.
+
+    Args:
+        name: Name for this query
+
+    Returns:
+        Dictionary of stats for this query, created if needed
+    """
+    s = Settings()
+    ctx = get_current_context()
+    all_stats: Dict[str, Dict[str, Any]] = ctx.meta.setdefault(s.META_QUERY_STATS, {})
+    if name not in all_stats:
+        all_stats[name] = {
+            "rows": 0,
+            "cached": False,
+            "seconds": {step: 0.0 for step in s.QUERY_STATS_STEPS},
+            "plan": [],
+            "full_scans": [],
+        }
+    return all_stats[name]
+
+
+def set_query_stat(name: str, key: str, value: Any):
+    """Record a stat for a query, if :data:`--query-stats` is on.
+
+    Args:
+        name: Name for this query
+        key: Name of stat
+        value: Value of stat
+    """
+    if query_stats_enabled():
+        get_query_stats(name)[key] = value
+
+
+def add_query_rows(name: str, rows: int):
+    """Add to the number of rows returned by a query, if :data:`--query-stats` is on.
+
+    Args:
+        name: Name for this query
+        rows: Number of rows to add
+    """
+    if query_stats_enabled():
+        get_query_stats(name)["rows"] += rows
+
+
+@contextmanager
+def time_query_step(name: str, step: str) -> Iterator[None]:
+    """Time one step of a query, if :data:`--query-stats` is on.
+
+    Usage::
+
+        with time_query_step(name, "replace"):
+            df = df_query_replace(df, query_config)
+
+    If a step runs more than once for the same query (e.g. once per chunk),
+    the times are added together.
+
+    Args:
+        name: Name for this query
+        step: One of :data:`QUERY_STATS_STEPS`
+
+    Yields:
+        Nothing
+    """
+    if not query_stats_enabled():
+        yield
+        return
+    start: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds: Dict[str, float] = get_query_stats(name)["seconds"]
+        seconds[step] += time.perf_counter() - start
+
+
+def is_full_scan(detail: str) -> bool:
+    """Return :data:`True` if a line of a query plan reads a whole table.
+
+    Args:
+        detail: One line from :data:`EXPLAIN QUERY PLAN`
+
+    Returns:
+        True if SQLite reads every row of a table or subquery for this step
+    """
+    return re.match(r"SCAN (?!CONSTANT ROW)", detail) is not None
+
+
+def explain_query(
+    conn: Connection,
+    sql: str,
+    name: str,
+    params: Optional[Union[dict, list]] = None,
+):
+    """Record the query plan for a query, if :data:`--query-stats` is on.
+
+    Note:
+        If the plan cannot be found, nothing is recorded. Any error in the SQL
+        is reported when the query itself runs.
+
+    Args:
+        conn: Temporary database in memory
+        sql: SQL statement for this query
+        name: Name for this query
+        params: Parameters to bind to the SQL
+    """
+    if not query_stats_enabled():
+        return
+    select: str = sql.strip().rstrip(";").strip()
+    try:
+        plan_sql: str = f"EXPLAIN QUERY PLAN {select}"
+        rows: list = conn.execute(plan_sql, params or ()).fetchall()
+    except sqlite3.Error:
+        return
+    # The last column of each row holds the description of that step.
+    plan: List[str] = [row[-1] for row in rows]
+    stats: Dict[str, Any] = get_query_stats(name)
+    stats["plan"] = plan
+    stats["full_scans"] = [detail for detail in plan if is_full_scan(detail)]
+
+
+def export_query_stats(config: Nob):
+    """Save the stats for every query as JSON, and warn about slow queries.
+
+    The file is saved in the output directory, named with :data:`basename:` and
+    :data:`FILE_QUERY_STATS_SUFFIX`. Queries are listed in config order.
+
+    Args:
+        config: Report configuration
+    """
+    s = Settings()
+    if not query_stats_enabled() or s.KEY_QUERIES not in config:
+        return
+
+    queries = config[s.KEY_QUERIES]
+    report: List[Dict[str, Any]] = []
+    for i, _val in enumerate(queries):
+        name: str = queries[i][s.KEY_QUERY__NAME][:]
+        stats: Dict[str, Any] = get_query_stats(name)
+        total: float = sum(stats["seconds"].values())
+        slow: bool = total >= s.QUERY_SLOW_SECONDS
+        report.append(
+            {
+                "name": name,
+                **stats,
+                "seconds": {**stats["seconds"], "total": total},
+                "slow": slow,
+            }
+        )
+        if slow:
+            warn(s.MSG_QUERY_SLOW, data=f"{name} ({total:.2f}s)")
+        for detail in stats["full_scans"]:
+            msg_with_data(
+                s.MSG_QUERY_FULL_SCAN, data=f"{name}: {detail}", indent=1, verbose=2
+            )
+
+    filename: str = get_output_dir_path(
+        config, f"{config[s.KEY_OUTPUT__BASENAME][:]}{s.FILE_QUERY_STATS_SUFFIX}"
+    )
+    overwrite_file(filename)
+    with output_file(config, filename) as path:
+        with open(path, "w") as f:
+            json.dump(
+                {"slow_seconds": s.QUERY_SLOW_SECONDS, "queries": report}, f, indent=2
+            )
+    msg_with_data(s.MSG_QUERY_STATS_SAVED, data=filename)
@@ -0,0 +1,90 @@
+"""Format spreadsheet output, with :data:`output: styles`."""
+from typing import Any
+from typing import List
+from typing import Optional
+
+from nob.nob import Nob
+from openpyxl.utils import get_column_letter
+from pandas.core.frame import DataFrame
+
+from yarm.settings import Settings
+
+
+def get_column_width(config: Nob) -> Any:
+    """Return the column width for spreadsheet output.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`output: styles: column_width`, either a number or
+        :data:`"auto"`; :data:`None` if not set
+    """
+    s = Settings()
+    if s.KEY_OUTPUT__STYLES__COLUMN_WIDTH in config:
+        return config[s.KEY_OUTPUT__STYLES__COLUMN_WIDTH][:]
+    return None
+
+
+def get_column_widths(df: DataFrame, column_width: Any) -> List[float]:
+    """Return the width of each column of a sheet.
+
+    For :data:`"auto"`, each column is as wide as its longest value or header.
+    Lengths are measured a whole column at a time, and on a long sheet only
+    :data:`COLUMN_WIDTH_SAMPLE_ROWS` evenly spaced rows are measured.
+
+    Args:
+        df: Data in the sheet, or its first chunk
+        column_width: Value of :data:`output: styles: column_width`
+
+    Returns:
+        Width of each column, in characters
+    """
+    s = Settings()
+    if column_width != "auto":
+        return [float(column_width)] * len(df.columns)
+    step: int = -(-len(df) // s.COLUMN_WIDTH_SAMPLE_ROWS)
+    sample: DataFrame = df.iloc[::step] if step > 1 else df
+    widths: List[float] = []
+    for i, column in enumerate(sample.columns):
+        # By position, in case two columns have the same name.
+        values = sample.iloc[:, i].dropna()
+        longest: int = int(values.astype(str).str.len().max()) if len(values) else 0
+        width: int = max(longest, len(str(column))) + s.COLUMN_WIDTH_PADDING
+        widths.append(float(min(width, s.COLUMN_WIDTH_MAX)))
+    return widths
+
+
+def merge_column_widths(
+    widths: Optional[List[float]], df: DataFrame, column_width: Any
+) -> List[float]:
+    """Widen columns to fit another chunk of the same sheet.
+
+    Args:
+        widths: Widths so far, or :data:`None` for the first chunk
+        df: Next chunk
+        column_width: Value of :data:`output: styles: column_width`
+
+    Returns:
+        Width of each column, in characters
+    """
+    if widths is None:
+        return get_column_widths(df, column_width)
+    if column_width != "auto":
+        return widths
+    new_widths: List[float] = get_column_widths(df, column_width)
+    return [max(widths[i], new_widths[i]) for i in range(len(widths))]
+
+
+def set_column_widths(sheet: Any, widths: List[float]):
+    """Set the width of each column of a sheet, once per column.
+
+    Important:
+        In a write-only spreadsheet, call this before appending any rows.
+
+    Args:
+        sheet: openpyxl sheet
+        widths: Width of each column (see :func:`get_column_widths`)
+    """
+    for i, width in enumerate(widths, start=1):
+        sheet.column_dimensions[get_column_letter(i)].width = width
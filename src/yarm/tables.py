@@ -2,6 +2,8 @@
 import re
 from pathlib import Path
 from sqlite3 import Connection
+from typing import List
+from typing import Literal
 from typing import Union
 
 import pandas as pd
@@ -10,6 +12,8 @@ from nob.nob import NobView
 from pandas.core.frame import DataFrame
 from slugify import slugify
 
+from yarm.cache import save_table_fingerprint
+from yarm.engines import keep_engine_table
 from yarm.export import export_tables
 from yarm.helpers import abort
 from yarm.helpers import key_show_message
@@ -17,7 +21,9 @@ from yarm.helpers import msg
 from yarm.helpers import msg_with_data
 from yarm.helpers import show_df
 from yarm.helpers import warn
+from yarm.maps import df_map
 from yarm.settings import Settings
+from yarm.validate import get_where_names
 
 
 def create_tables(conn: Connection, config: Nob):
@@ -52,7 +58,7 @@ def create_tables(conn: Connection, config: Nob):
         msg_with_data(s.MSG_CREATING_TABLE, table_name, verbose=2)
 
         # For each new table, mode should start as "replace"
-        exists_mode: str = "replace"
+        exists_mode: Literal["replace", "append"] = "replace"
 
         table: NobView = tables[table_name]
         table_df = None
@@ -61,9 +67,21 @@ def create_tables(conn: Connection, config: Nob):
             table, table_name, include_index_all
         )
 
+        deduplicate: Union[bool, List[str]] = get_deduplicate_table(table, table_name)
+        # Hashes of every row kept so far, across all sources for this table.
+        seen_rows: set = set()
+
         for source, _val in enumerate(table):
             table_df = create_table_df(
-                conn, config, table_df, table_name, table, source, exists_mode
+                conn,
+                config,
+                table_df,
+                table_name,
+                table,
+                source,
+                exists_mode,
+                deduplicate=deduplicate,
+                seen_rows=seen_rows,
             )
 
             # If there are any more paths for this table, we will want to append.
@@ -85,6 +103,15 @@ def create_tables(conn: Connection, config: Nob):
                             ps=s.MSG_CONCAT_DATETIME_FIX_PS,
                         )
 
+                save_table_fingerprint(config, table_name, table_df)  # type: ignore
+                keep_engine_table(
+                    config,
+                    table_name,
+                    table_df.reset_index()  # type: ignore
+                    if include_index_table
+                    else table_df,
+                )
+
                 table_df.to_sql(  # type: ignore
                     table_name, conn, if_exists=exists_mode, index=include_index_table
                 )
@@ -125,7 +152,9 @@ def create_table_df(
     table_name: str,
     table: NobView,
     source,
-    exists_mode: str,
+    exists_mode: Literal["replace", "append"],
+    deduplicate: Union[bool, List[str]] = False,
+    seen_rows: Union[set, None] = None,
 ) -> DataFrame:
     """Create or append to a table from a configured source.
 
@@ -145,6 +174,8 @@ def create_table_df(
         table: Table configuration
         source: Source configuration
         exists_mode: :data:`replace` for a new table, otherwise :data:`append`
+        deduplicate: Columns to deduplicate on (**see** :func:`df_deduplicate`)
+        seen_rows: Hashes of rows already in this table
 
     Returns:
         DataFrame of our new or updated table
@@ -159,7 +190,7 @@ def create_table_df(
     """
     s = Settings()
 
-    filename = table[source]["path"][:]
+    filename = table[source][s.KEY_TABLE__PATH][:]
     file_ext = Path(filename).suffix
     msg_with_data(s.MSG_IMPORTING_DATA, filename, verbose=2, indent=1)
 
@@ -175,6 +206,8 @@ def create_table_df(
             table_df=table_df,
             input_file=filename,
             input_sheet=None,
+            deduplicate=deduplicate,
+            seen_rows=seen_rows,
         )
     elif re.findall(s.XLSX, file_ext):
         sheet: Union[int, str] = 0
@@ -197,6 +230,8 @@ def create_table_df(
             table_df=table_df,
             input_file=filename,
             input_sheet=sheet,
+            deduplicate=deduplicate,
+            seen_rows=seen_rows,
         )
     else:
         abort(s.MSG_BAD_FILE_EXT, file_path=filename)
@@ -271,6 +306,38 @@ def get_include_index_table(
     return include_index_table
 
 
+def get_deduplicate_table(table: NobView, table_name: str) -> Union[bool, List[str]]:
+    """Set :data:`deduplicate` for a particular table.
+
+    Args:
+        table: Configuration for this table
+        table_name: Name for this table
+
+    Returns:
+        :data:`False` to keep duplicates, :data:`True` to compare all columns,
+        or a list of the columns to compare
+
+    See Also:
+        - :func:`df_deduplicate`
+    """
+    s = Settings()
+    deduplicate: Union[bool, List[str]] = False
+    # NOTE We have already confirmed that only one deduplicate, at most,
+    # is in this table. See validate_key_tables_config()
+    if s.KEY_DEDUPLICATE in table:
+        deduplicate = table[s.KEY_DEDUPLICATE][:]
+        if deduplicate is True:
+            msg_with_data(s.MSG_DEDUPLICATE_TABLE, data=table_name, verbose=2, indent=1)
+        elif deduplicate:
+            msg_with_data(
+                s.MSG_DEDUPLICATE_TABLE_COLUMNS,
+                data=", ".join(deduplicate),  # type: ignore
+                verbose=2,
+                indent=1,
+            )
+    return deduplicate
+
+
 def input_source(
     input_format: str,
     conn,
@@ -280,6 +347,8 @@ def input_source(
     table_df: Union[DataFrame, None],
     input_file: str,
     input_sheet: Union[int, str, None],
+    deduplicate: Union[bool, List[str]] = False,
+    seen_rows: Union[set, None] = None,
 ) -> DataFrame:
     """Input a source into a table DataFrame.
 
@@ -292,6 +361,8 @@ def input_source(
         table_df: :data:`None` if this table is new, otherwise the existing table
         input_file: Actual file with source data
         input_sheet: Name of sheet if source is spreadsheet, otherwise :data:`None`
+        deduplicate: Columns to deduplicate on (**see** :func:`df_deduplicate`)
+        seen_rows: Hashes of rows already in this table
 
     Returns:
         New or updated table
@@ -307,22 +378,25 @@ def input_source(
 
     msg_show_df: str = table_name
 
-    if input_format == s.CSV:
-        df: DataFrame = pd.read_csv(input_file)
-    elif input_format == s.XLSX:
-        msg_show_df += f": {input_sheet}"
-        with open(input_file, "rb") as f:
-            df = pd.read_excel(f, sheet_name=input_sheet)
-    else:  # pragma: no cover
-        # This branch should never execute, because of previous tests.
-        abort(s.MSG_INPUT_FORMAT_UNRECOGNIZED, data=input_format)
+    where: Union[str, None] = None
+    if s.KEY_TABLE__WHERE in source_config:
+        where = source_config[s.KEY_TABLE__WHERE][:]
+        msg_with_data(s.MSG_APPLYING_WHERE, data=where, indent=2, verbose=2)
 
-    # Show data before any options (only at high verbosity)
-    show_df(df, msg_show_df, 4)
+    df: DataFrame = read_source(
+        input_format, config, input_file, input_sheet, where, msg_show_df
+    )
+
+    if where:
+        msg_with_data(s.MSG_WHERE_ROWS_KEPT, data=str(len(df)), indent=2, verbose=2)
 
-    df = df_input_options(df, config)
     df = df_tables_config_options(df, source_config, table_name, input_file)
 
+    if deduplicate:
+        if seen_rows is None:
+            seen_rows = set()
+        df = df_deduplicate(df, deduplicate, seen_rows, input_file)
+
     if df.empty:
         if isinstance(table_df, DataFrame):
             warn(s.MSG_EMPTY_DF_ORIGINAL, data=table_name)
@@ -342,6 +416,184 @@ def input_source(
     return df
 
 
+def read_source(
+    input_format: str,
+    config: Nob,
+    input_file: str,
+    input_sheet: Union[int, str, None],
+    where: Union[str, None],
+    msg_show_df: str,
+) -> DataFrame:
+    """Read a source, then apply :data:`input:` options and :data:`where:`.
+
+    Args:
+        input_format: Format for this source (e.g. :data:`CSV`)
+        config: Report configuration
+        input_file: Actual file with source data
+        input_sheet: Name of sheet if source is spreadsheet, otherwise :data:`None`
+        where: Expression that each row must match, or :data:`None` for all rows
+        msg_show_df: Name to show with the raw data
+
+    Returns:
+        Source data, ready for the options for this source
+
+    See Also:
+        - :func:`input_source`
+    """
+    s = Settings()
+    if input_format == s.CSV and where:
+        # Filter each chunk as it is read, so that discarded rows never
+        # accumulate in memory.
+        return read_csv_where(input_file, config, where)
+
+    if input_format == s.CSV:
+        df: DataFrame = pd.read_csv(input_file)
+    elif input_format == s.XLSX:
+        msg_show_df += f": {input_sheet}"
+        # With no sheet name, read_excel() would return every sheet.
+        sheet: Union[int, str] = 0 if input_sheet is None else input_sheet
+        with open(input_file, "rb") as f:
+            df = pd.read_excel(f, sheet_name=sheet)
+    else:  # pragma: no cover
+        # This branch should never execute, because of previous tests.
+        abort(s.MSG_INPUT_FORMAT_UNRECOGNIZED, data=input_format)
+
+    # Show data before any options (only at high verbosity)
+    show_df(df, msg_show_df, 4)
+
+    df = df_input_options(df, config)
+
+    # pandas cannot read a spreadsheet in chunks, so filter it all at once.
+    if where:
+        df = df_where(df, where, input_file)
+    return df
+
+
+def read_csv_where(input_file: str, config: Nob, where: str) -> DataFrame:
+    """Read a CSV in chunks, keeping only the rows that match :data:`where:`.
+
+    Each chunk has the :data:`input:` options applied before it is filtered,
+    so that :data:`where:` sees the same column names as the rest of the config.
+
+    Args:
+        input_file: Actual file with source data
+        config: Report configuration
+        where: Expression that each row must match
+
+    Returns:
+        Matching rows from every chunk
+
+    See Also:
+        - :func:`df_where`
+    """
+    s = Settings()
+    chunks: List[DataFrame] = []
+    with pd.read_csv(input_file, chunksize=s.INPUT_CHUNKSIZE) as reader:
+        for chunk in reader:
+            chunk = df_input_options(chunk, config)
+            chunks.append(df_where(chunk, where, input_file))
+    return pd.concat(chunks)
+
+
+def df_where(df: DataFrame, where: str, input_file: str) -> DataFrame:
+    """Keep only the rows that match a :data:`where:` expression.
+
+    Args:
+        df: Data to filter
+        where: Expression for :meth:`pandas.DataFrame.query`
+        input_file: Actual file with source data
+
+    Returns:
+        Rows for which :data:`where` is true
+
+    Note:
+        The expression is checked before any data is read, by
+        :func:`yarm.validate.validate_where`. Every name must also be a column:
+        :meth:`pandas.DataFrame.query` would otherwise read :data:`index` as the
+        row numbers.
+    """
+    s = Settings()
+    columns: List[str] = [str(column) for column in df.columns]
+    missing: List[str] = [
+        name for name in get_where_names(where) if name not in columns
+    ]
+    if missing:
+        abort(
+            s.MSG_WHERE_ERROR,
+            data=where,
+            error=f"{s.MSG_WHERE_NOT_COLUMN}: {', '.join(missing)}",
+            file_path=input_file,
+            ps=s.MSG_WHERE_ERROR_PS,
+        )
+    try:
+        df = df.query(where)
+    except (
+        SyntaxError,
+        NameError,
+        KeyError,
+        TypeError,
+        ValueError,
+        AttributeError,
+    ) as error:
+        abort(
+            s.MSG_WHERE_ERROR,
+            data=where,
+            error=str(error),
+            file_path=input_file,
+            ps=s.MSG_WHERE_ERROR_PS,
+        )
+    return df
+
+
+def df_deduplicate(
+    df: DataFrame,
+    deduplicate: Union[bool, List[str]],
+    seen_rows: set,
+    input_file: str,
+) -> DataFrame:
+    """Drop rows that duplicate a row already kept for this table.
+
+    Each row is reduced to a 64-bit hash of its key columns. A row is dropped if
+    its hash appeared earlier in this source or in any previous source, which
+    are tracked in :data:`seen_rows`. Only the hashes are kept, not the rows.
+
+    Args:
+        df: Data from this source, after all source options
+        deduplicate: :data:`True` to compare all columns, or a list of columns
+        seen_rows: Hashes of rows already in this table (**updated in place**)
+        input_file: Actual file with source data
+
+    Returns:
+        Data without duplicate rows
+
+    Note:
+        Values must match exactly, including their type. For instance,
+        :data:`1` and :data:`1.0` are different values.
+    """
+    s = Settings()
+    # A named index (e.g. after a pivot) holds real data, so compare it too.
+    keys: DataFrame = df.reset_index() if any(df.index.names) else df
+    if deduplicate is True:
+        columns: List[str] = list(keys.columns)
+    else:
+        columns = deduplicate  # type: ignore
+        for column in columns:
+            if column not in keys.columns:
+                abort(s.MSG_DEDUPLICATE_KEY_ERROR, data=column, file_path=input_file)
+
+    hashes = pd.util.hash_pandas_object(keys[columns], index=False)
+    keep = ~(hashes.duplicated() | hashes.isin(seen_rows))
+    seen_rows.update(hashes[keep])
+
+    msg_with_data(
+        s.MSG_DEDUPLICATE_REMOVED,
+        data=str(len(df) - int(keep.sum())),
+        indent=2,
+        verbose=2,
+    )
+    return df[keep.to_numpy(dtype=bool)]
+
+
 def concat_dfs(
     conn,
     table_name: str,
@@ -534,6 +786,9 @@ def df_tables_config_options(
             else:
                 abort(s.MSG_MISSING_DATETIME, data=key, file_path=input_file)
 
+    if s.KEY_MAP in sc:
+        df = df_map(df, sc[s.KEY_MAP][:], table_name)
+
     # TODO Add config option to pass index to join on.
 
     # Always return the dataframe!
@@ -0,0 +1,171 @@
+"""Create temporary tables that several queries share, with :data:`temp_tables:`."""
+import sqlite3
+from contextlib import contextmanager
+from sqlite3 import Connection
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from click import get_current_context
+from nob.nob import Nob
+from nob.nob import NobView
+
+from yarm.cache import get_temp_table_names
+from yarm.cache import save_temp_table_fingerprint
+from yarm.engines import get_duckdb
+from yarm.engines import import_duckdb
+from yarm.helpers import abort
+from yarm.helpers import get_table_references
+from yarm.helpers import msg
+from yarm.helpers import msg_with_data
+from yarm.helpers import quote_identifier
+from yarm.helpers import warn
+from yarm.settings import Settings
+
+
+def get_temp_table_consumers(config: Nob) -> Dict[str, Set[str]]:
+    """Find which later temp tables and queries use each temp table.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Dictionary of :data:`{temp table name: names of its consumers}`
+
+    See Also:
+        - :func:`yarm.helpers.get_table_references`
+    """
+    s = Settings()
+    names: List[str] = get_temp_table_names(config)
+    consumers: Dict[str, Set[str]] = {name: set() for name in names}
+    for i, name in enumerate(names):
+        sql: str = config[s.KEY_TEMP_TABLES][name][s.KEY_TEMP_TABLE__SQL][:]
+        for ref in get_table_references(sql, names[:i]):
+            consumers[ref].add(name)
+    if s.KEY_QUERIES in config:
+        queries = config[s.KEY_QUERIES]
+        for i, _val in enumerate(queries):
+            sql = queries[i][s.KEY_QUERY__SQL][:]
+            for ref in get_table_references(sql, names):
+                consumers[ref].add(queries[i][s.KEY_QUERY__NAME][:])
+    return consumers
+
+
+@contextmanager
+def shared_temp_tables(conn: Connection, config: Nob) -> Iterator[None]:
+    """Create the temp tables before the queries run, and drop any left after.
+
+    Each temp table is created once, whether queries run in SQLite or DuckDB.
+    Temp tables are never exported. Each one is dropped as soon as every query
+    that uses it has finished (see :func:`release_temp_tables`).
+
+    Args:
+        conn: Temporary database in memory
+        config: Report configuration
+
+    Yields:
+        Nothing
+    """
+    s = Settings()
+    ctx = get_current_context()
+    consumers: Dict[str, Set[str]] = get_temp_table_consumers(config)
+    ctx.meta[s.META_TEMP_TABLES] = consumers
+    try:
+        for name in get_temp_table_names(config):
+            if not consumers[name]:
+                warn(s.MSG_TEMP_TABLE_UNUSED, data=name)
+                del consumers[name]
+                continue
+            create_temp_table(conn, config, config[s.KEY_TEMP_TABLES][name], name)
+            release_temp_tables(conn, name)
+        yield
+    finally:
+        for name in list(consumers):
+            drop_temp_table(conn, name)
+        del ctx.meta[s.META_TEMP_TABLES]
+
+
+def get_temp_table_conn(conn: Connection) -> Tuple[Any, tuple]:
+    """Return the connection that holds the temp tables, and its errors.
+
+    Args:
+        conn: Temporary database in memory
+
+    Returns:
+        DuckDB connection with :data:`engine: duckdb`, otherwise :data:`conn`;
+        and the exceptions that connection raises for a failed statement
+    """
+    duck: Any = get_duckdb()
+    if duck is None:
+        return conn, (sqlite3.Error,)
+    return duck, (import_duckdb().Error,)
+
+
+def create_temp_table(conn: Connection, config: Nob, temp_table: NobView, name: str):
+    """Save the results of a temp table's SQL, and create any indexes.
+
+    Args:
+        conn: Temporary database in memory
+        config: Report configuration
+        temp_table: Configuration for this temp table
+        name: Temp table name
+    """
+    s = Settings()
+    sql: str = temp_table[s.KEY_TEMP_TABLE__SQL][:]
+    select: str = sql.strip().rstrip(";").strip()
+    table: str = quote_identifier(name)
+    db, errors = get_temp_table_conn(conn)
+    msg_with_data(s.MSG_CREATING_TEMP_TABLE, data=name, verbose=1)
+    msg(sql, verbose=3)
+    try:
+        db.execute(f"CREATE TABLE {table} AS {select}")  # noqa: S608
+        if s.KEY_TEMP_TABLE__INDEX in temp_table:
+            for i, index in enumerate(temp_table[s.KEY_TEMP_TABLE__INDEX][:]):
+                columns: List[str] = [col.strip() for col in index.split(",")]
+                msg_with_data(
+                    s.MSG_CREATING_TEMP_INDEX, data=", ".join(columns), indent=1
+                )
+                index_name: str = quote_identifier(f"{name}__index_{i}")
+                quoted: str = ", ".join(quote_identifier(col) for col in columns)
+                db.execute(f"CREATE INDEX {index_name} ON {table} ({quoted})")
+    except errors as error:
+        abort(s.MSG_TEMP_TABLE_ERROR, data=name, error=str(error))
+    save_temp_table_fingerprint(config, name, sql)
+
+
+def release_temp_tables(conn: Connection, consumer: str):
+    """Record that a query or temp table is done, and drop tables no longer needed.
+
+    Args:
+        conn: Temporary database in memory
+        consumer: Name of the query or temp table that has just been saved
+    """
+    s = Settings()
+    ctx = get_current_context()
+    consumers: Dict[str, Set[str]] = ctx.meta.get(s.META_TEMP_TABLES, {})
+    for name in list(consumers):
+        if consumer not in consumers[name]:
+            continue
+        consumers[name].remove(consumer)
+        if not consumers[name]:
+            del consumers[name]
+            drop_temp_table(conn, name)
+            msg_with_data(s.MSG_TEMP_TABLE_DROPPED, data=name, indent=1, verbose=2)
+
+
+def drop_temp_table(conn: Connection, name: str):
+    """Drop a temp table, along with its indexes.
+
+    Args:
+        conn: Temporary database in memory
+        name: Temp table name
+    """
+    db, errors = get_temp_table_conn(conn)
+    try:
+        db.execute(f"DROP TABLE IF EXISTS {quote_identifier(name)}")
+    except errors:  # pragma: no cover
+        # NOTE If the report is aborting, the connection may already be closed.
+        pass
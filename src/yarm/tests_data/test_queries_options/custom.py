@@ -1,4 +1,6 @@
 """import for test_validate_complete_config_valid.yaml()."""
+import time
+
 import pandas as pd
 
 
@@ -37,3 +39,37 @@ def return_empty_df(data):
 def other_type(data):
     """Other type."""
     return "df: Oops, this is a string."
+
+
+def pause(value):
+    """SQL function: wait a moment, then return the value unchanged."""
+    time.sleep(0.005)
+    return value
+
+
+def double(value):
+    """SQL function: double a number."""
+    return value * 2
+
+
+class Longest:
+    """SQL aggregate: longest string."""
+
+    def __init__(self):
+        """Start with no string."""
+        self.longest = ""
+
+    def step(self, value):
+        """Compare each string."""
+        if len(value) > len(self.longest):
+            self.longest = value
+
+    def finalize(self):
+        """Return the longest string."""
+        return self.longest
+
+
+def add_total(data):
+    """Postprocess function that adds a column."""
+    data["total"] = data["order_id"] + data["product_id"]
+    return data
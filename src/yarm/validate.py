@@ -3,11 +3,11 @@
 
 """Validate configuration file."""
 
+import ast
 import importlib.resources as pkg_resources
-import importlib.util
 import os
 import re
-import sys
+from typing import Any
 from typing import Dict
 from typing import List
 from typing import Optional
@@ -23,6 +23,7 @@ from strictyaml import Any as AnyYAML
 from strictyaml import Bool
 from strictyaml import EmptyNone
 from strictyaml import Enum
+from strictyaml import Float
 from strictyaml import Int
 from strictyaml import Map
 from strictyaml import MapPattern
@@ -35,6 +36,8 @@ from strictyaml.exceptions import YAMLValidationError
 from strictyaml.yamllocation import YAMLChunk
 
 from yarm.helpers import abort
+from yarm.helpers import format_query_name
+from yarm.helpers import import_module_path
 from yarm.helpers import load_yaml_file
 from yarm.helpers import msg_with_data
 from yarm.helpers import verbose_ge
@@ -255,6 +258,9 @@ def validate_key_tables_config(config_yaml: YAML, config_path: str):
                         OptionalYAML("datetime"): EmptyNone() | AnyYAML(),
                         OptionalYAML("pivot"): EmptyNone() | AnyYAML(),
                         OptionalYAML("include_index"): Bool(),
+                        OptionalYAML("where"): StrNotEmpty(),
+                        OptionalYAML("deduplicate"): Bool() | Seq(StrNotEmpty()),
+                        OptionalYAML("map"): AnyYAML(),
                     },
                     key_validator=Slug(),
                 )
@@ -262,7 +268,6 @@ def validate_key_tables_config(config_yaml: YAML, config_path: str):
             revalidate_yaml(table, schema, config_path, table_name, "table")
             check_is_file(c[key][table_name].data, "path")
 
-            include_index_defined: bool = False
             for source in table:
                 if "datetime" in source:
                     schema = MapPattern(Str(), EmptyNone() | Str())
@@ -284,17 +289,142 @@ def validate_key_tables_config(config_yaml: YAML, config_path: str):
                     revalidate_yaml(
                         source["pivot"], schema, config_path, f"{table_name}: pivot"
                     )
-                if "include_index" in source:
-                    # Because a table is a list of paths, it is possible for more
-                    # than one path to define include_index, which is unfortunate.
-                    if not include_index_defined:
-                        include_index_defined = True
-                    else:
-                        abort(
-                            s.MSG_INCLUDE_INDEX_TABLE_CONFLICT,
-                            data=table_name,
-                            ps=s.MSG_INCLUDE_INDEX_TABLE_CONFLICT_PS,
-                        )
+                if "where" in source:
+                    validate_where(source["where"].data, table_name)
+                if "map" in source:
+                    validate_map(source["map"], config_path, f"{table_name}: map")
+
+            # Because a table is a list of paths, it is possible for more
+            # than one path to define a key that applies to the whole table,
+            # which is unfortunate.
+            for table_key, conflict_msg, conflict_ps in [
+                (
+                    "include_index",
+                    s.MSG_INCLUDE_INDEX_TABLE_CONFLICT,
+                    s.MSG_INCLUDE_INDEX_TABLE_CONFLICT_PS,
+                ),
+                (
+                    "deduplicate",
+                    s.MSG_DEDUPLICATE_TABLE_CONFLICT,
+                    s.MSG_DEDUPLICATE_TABLE_CONFLICT_PS,
+                ),
+            ]:
+                if len([source for source in table if table_key in source]) > 1:
+                    abort(conflict_msg, data=table_name, ps=conflict_ps)
+
+
+def parse_where(where: str) -> ast.AST:
+    """Parse a :data:`where:` expression.
+
+    A backticked column name may contain anything, so it's parsed as a plain name
+    of the same length, which keeps the position of everything after it.
+
+    Args:
+        where: Expression to parse
+
+    Returns:
+        Parsed expression
+
+    Raises:
+        SyntaxError: If the expression is not valid Python
+    """
+    expression: str = re.sub(
+        r"`[^`]*`", lambda m: "_" + "x" * (len(m[0]) - 1), where.strip()
+    )
+    return ast.parse(expression, mode="eval")
+
+
+def get_where_names(where: str) -> List[str]:
+    """Get the column names used in a :data:`where:` expression.
+
+    Args:
+        where: Expression, already checked by :func:`validate_where`
+
+    Returns:
+        Names in the expression, without any backticks
+    """
+    text: str = where.strip()
+    return [
+        str(ast.get_source_segment(text, node)).strip("`")
+        for node in ast.walk(parse_where(where))
+        if isinstance(node, ast.Name)
+    ]
+
+
+def validate_where(where: str, table_name: str):
+    """Check that a :data:`where:` expression only compares columns with values.
+
+    The expression is evaluated by :meth:`pandas.DataFrame.query`, which can also
+    reach local variables (with :data:`@`), attributes, and methods such as
+    :meth:`pandas.Series.to_csv`. So the expression is parsed, and may only
+    contain the kinds of node in :data:`WHERE_ALLOWED_NODES`: names, constants,
+    comparisons (including :data:`in` and :data:`not in`), :data:`and`,
+    :data:`or`, :data:`not`, arithmetic other than :data:`**`, and lists or
+    tuples. Attributes, calls and subscripts are rejected.
+
+    Args:
+        where: Expression to check
+        table_name: Table this expression belongs to
+
+    See Also:
+        - :func:`yarm.tables.df_where`, which checks that every name is a column
+    """
+    s = Settings()
+    text: str = where.strip()
+    try:
+        tree: ast.AST = parse_where(where)
+    except SyntaxError as error:
+        abort(
+            s.MSG_WHERE_UNSAFE,
+            data=f"{table_name}: {where}",
+            error=str(error),
+            ps=s.MSG_WHERE_UNSAFE_PS,
+        )
+    for node in ast.walk(tree):
+        kind: str = type(node).__name__
+        if kind not in s.WHERE_ALLOWED_NODES or (
+            isinstance(node, ast.Name) and "__" in node.id
+        ):
+            abort(
+                s.MSG_WHERE_UNSAFE,
+                data=f"{table_name}: {where}",
+                error=f"{kind}: {ast.get_source_segment(text, node)}",
+                ps=s.MSG_WHERE_UNSAFE_PS,
+            )
+
+
+def validate_map(map_yaml: YAML, config_path: str, msg_key: str):
+    """Validate :data:`map:` for a table source or a query.
+
+    .. literalinclude:: validate/validate_map.yaml
+       :language: yaml
+
+    Args:
+        map_yaml: Configuration to validate
+        config_path: Configuration file
+        msg_key: Table or query this mapping belongs to
+
+    See Also:
+        - :func:`yarm.maps.df_map`
+    """
+    s = Settings()
+    schema = Seq(
+        Map(
+            {
+                "path": StrNotEmpty(),
+                "key": StrNotEmpty(),
+                "value": StrNotEmpty(),
+                OptionalYAML("column"): StrNotEmpty(),
+                OptionalYAML("to"): StrNotEmpty(),
+            },
+            key_validator=Slug(),
+        )
+    )
+    revalidate_yaml(map_yaml, schema, config_path, msg_key)
+    check_is_file(map_yaml.data, "path")
+    for mapping in map_yaml.data:
+        if not mapping["path"].lower().endswith(s.MAP_FILE_EXTS):
+            abort(s.MSG_MAP_BAD_FILE_EXT, file_path=mapping["path"])
 
 
 def check_key(key: str, config_yaml: YAML) -> Union[str, None]:
@@ -349,12 +479,118 @@ def validate_key_import(config_yaml: YAML, config_path: str):
         for source in c[key]:
             file_path = source[s.KEY_MODULE__PATH].data
             msg_with_data(s.MSG_IMPORTING_MODULE_PATH, data=file_path, indent=1)
-            module_name = s.IMPORT_MODULE_NAME
-            # https://docs.python.org/3/library/importlib.html#importing-a-source-file-directly
-            spec = importlib.util.spec_from_file_location(module_name, file_path)  # type: ignore  # noqa:B950
-            module = importlib.util.module_from_spec(spec)  # type: ignore
-            sys.modules[module_name] = module
-            spec.loader.exec_module(module)  # type: ignore
+            import_module_path(file_path)
+
+
+def validate_key_sql_functions(config_yaml: YAML, config_path: str):
+    """Validate config key: sql_functions.
+
+    .. literalinclude:: validate/validate_key_sql_functions.yaml
+       :language: yaml
+
+    Args:
+        config_yaml: Configuration to validate
+        config_path: Configuration file
+
+    See Also:
+        - :func:`validate_key_import`
+        - :func:`yarm.sql_functions.register_sql_functions`
+    """
+    s = Settings()
+    c: YAML = config_yaml
+    key: Union[str, None] = check_key("sql_functions", c)
+    if key:
+        schema = Seq(StrNotEmpty())
+        revalidate_yaml(c[key], schema, config_path)
+        if "import" not in c:
+            abort(
+                s.MSG_SQL_FUNCTIONS_BUT_NO_IMPORT,
+                data=", ".join(c[key].data),
+                ps=s.MSG_POSTPROCESS_BUT_NO_IMPORT_PS,
+            )
+
+
+def validate_key_postprocess_workers(config_yaml: YAML, config_path: str):
+    """Validate config key: postprocess_workers.
+
+    .. literalinclude:: validate/validate_key_postprocess_workers.yaml
+       :language: yaml
+
+    Args:
+        config_yaml: Configuration to validate
+        config_path: Configuration file
+
+    See Also:
+        - :func:`yarm.workers.postprocess_pool`
+    """
+    s = Settings()
+    c: YAML = config_yaml
+    key: Union[str, None] = check_key("postprocess_workers", c)
+    if key:
+        revalidate_yaml(c[key], Int(), config_path)
+        if c[key].data < 1:
+            abort(s.MSG_POSTPROCESS_WORKERS_ERROR, data=str(c[key].data))
+
+
+def validate_key_timeout(config_yaml: YAML, config_path: str):
+    """Validate config key: timeout.
+
+    .. literalinclude:: validate/validate_key_timeout.yaml
+       :language: yaml
+
+    Args:
+        config_yaml: Configuration to validate
+        config_path: Configuration file
+
+    See Also:
+        - :func:`validate_timeout`
+    """
+    c: YAML = config_yaml
+    key: Union[str, None] = check_key("timeout", c)
+    if key:
+        validate_timeout(c[key], config_path)
+
+
+def validate_key_engine(config_yaml: YAML, config_path: str):
+    """Validate config key: engine.
+
+    .. literalinclude:: validate/validate_key_engine.yaml
+       :language: yaml
+
+    Args:
+        config_yaml: Configuration to validate
+        config_path: Configuration file
+
+    Important:
+        :data:`sql_functions:` registers Python functions with SQLite,
+        so it cannot be used with :data:`engine: duckdb`.
+
+    See Also:
+        - :func:`yarm.engines.query_engine`
+    """
+    s = Settings()
+    c: YAML = config_yaml
+    key: Union[str, None] = check_key("engine", c)
+    if key:
+        revalidate_yaml(c[key], Enum(s.ENGINES), config_path)
+        if c[key].data == s.ENGINE_DUCKDB and "sql_functions" in c:
+            abort(s.MSG_DUCKDB_SQL_FUNCTIONS_ERROR, data=s.ENGINE_DUCKDB)
+
+
+def validate_timeout(timeout_yaml: YAML, config_path: str):
+    """Validate a timeout, in seconds, for all queries or for one query.
+
+    Args:
+        timeout_yaml: Timeout to validate
+        config_path: Configuration file
+
+    See Also:
+        - :func:`yarm.queries.watch_query`
+    """
+    s = Settings()
+    revalidate_yaml(timeout_yaml, Float(), config_path)
+    if timeout_yaml.data <= 0:
+        abort(s.MSG_TIMEOUT_ERROR, data=str(timeout_yaml.data))
 
 
 def validate_key_input(config_yaml: YAML, config_path: str):
@@ -409,22 +645,103 @@ def validate_key_output(config_yaml: YAML, config_path: str):
                 # OptionalYAML("prepend_date"): Bool(),
                 OptionalYAML("export_tables"): Enum(s.SCHEMA_EXPORT_FORMATS),
                 OptionalYAML("export_queries"): Enum(s.SCHEMA_EXPORT_FORMATS),
+                OptionalYAML("stream_queries"): Bool(),
+                OptionalYAML("xlsx_write_only"): Bool(),
+                OptionalYAML("export_workers"): Int(),
+                OptionalYAML("compression"): Enum(list(s.COMPRESSION_EXTS)),
+                OptionalYAML("compression_level"): Int(),
+                OptionalYAML("arrow"): Map(
+                    {
+                        OptionalYAML("row_group_size"): Int(),
+                        OptionalYAML("dictionary"): Bool(),
+                        OptionalYAML("compression"): Enum(
+                            s.SCHEMA_ARROW_COMPRESSIONS
+                        ),
+                    }
+                ),
+                OptionalYAML("database_page_size"): Int(),
+                OptionalYAML("database_vacuum"): Bool(),
+                OptionalYAML("manifest"): Bool(),
                 OptionalYAML("styles"): AnyYAML(),
             },
             key_validator=Slug(),
         )
         revalidate_yaml(c[key], schema, config_path)
+        if "export_workers" in c[key] and c[key]["export_workers"].data < 1:
+            abort(s.MSG_EXPORT_WORKERS_ERROR, data=str(c[key]["export_workers"].data))
+        validate_output_compression(c[key])
+        validate_output_arrow(c[key])
+        if "database_page_size" in c[key]:
+            page_size: int = c[key]["database_page_size"].data
+            # SQLite page sizes are powers of 2, from 512 to 65536 bytes.
+            if page_size not in [2**n for n in range(9, 17)]:
+                abort(s.MSG_DATABASE_PAGE_SIZE_ERROR, data=str(page_size))
         if "styles" in c[key]:
             schema = Map(
                 {
-                    "column_width": Int(),
+                    "column_width": Int() | Enum(["auto"]),
                 },
                 key_validator=Slug(),
             )
             revalidate_yaml(c[key]["styles"], schema, config_path, "output.styles")
+            column_width: Any = c[key]["styles"]["column_width"].data
+            if column_width != "auto" and not 1 <= column_width <= s.COLUMN_WIDTH_MAX:
+                abort(s.MSG_COLUMN_WIDTH_ERROR, data=str(column_width))
         validate_key_output_dir(c)
 
 
+def validate_output_compression(output_yaml: YAML):
+    """Check that :data:`compression_level` suits :data:`compression`.
+
+    Args:
+        output_yaml: Configuration under :data:`output:`, already validated
+    """
+    s = Settings()
+    o: YAML = output_yaml
+    if "compression_level" not in o:
+        return
+    level: int = o["compression_level"].data
+    if "compression" not in o:
+        abort(s.MSG_COMPRESSION_LEVEL_NO_COMPRESSION, data=str(level))
+    compression: str = o["compression"].data
+    lowest, highest, _default = s.COMPRESSION_LEVELS[compression]
+    if not lowest <= level <= highest:
+        abort(
+            f"{s.MSG_COMPRESSION_LEVEL_ERROR} {compression}",
+            data=str(level),
+            ps=f"Use a level from {lowest} to {highest}.",
+        )
+
+
+def validate_output_arrow(output_yaml: YAML):
+    """Check the options for Parquet and Feather output.
+
+    Args:
+        output_yaml: Configuration under :data:`output:`, already validated
+    """
+    s = Settings()
+    o: YAML = output_yaml
+    if "arrow" not in o:
+        return
+    arrow: YAML = o["arrow"]
+    if "row_group_size" in arrow and arrow["row_group_size"].data < 1:
+        abort(s.MSG_ARROW_ROW_GROUP_SIZE_ERROR, data=str(arrow["row_group_size"].data))
+    formats: List[str] = [
+        o[key].data for key in ["export_tables", "export_queries"] if key in o
+    ]
+    if "dictionary" in arrow and "parquet" not in formats:
+        # Feather files are written without dictionary encoding.
+        abort(s.MSG_ARROW_DICTIONARY_ERROR, ps=s.MSG_ARROW_DICTIONARY_PS)
+    if "feather" in formats and "compression" in arrow:
+        compression: str = arrow["compression"].data
+        if compression not in s.FEATHER_COMPRESSIONS:
+            abort(
+                s.MSG_FEATHER_COMPRESSION_ERROR,
+                data=compression,
+                ps=f"Use one of: {', '.join(s.FEATHER_COMPRESSIONS)}",
+            )
+
+
 def validate_key_output_dir(config_yaml: YAML):
     """Prepare output directory.
 
@@ -446,6 +763,61 @@ def validate_key_output_dir(config_yaml: YAML):
     msg_with_data(s.MSG_OUTPUT_DIR, data=output_dir)
 
 
+def validate_key_cache(config_yaml: YAML, config_path: str):
+    """Validate config key: cache.
+
+    .. literalinclude:: validate/validate_key_cache.yaml
+       :language: yaml
+
+    Args:
+        config_yaml: Configuration to validate
+        config_path: Configuration file
+
+    See Also:
+        - :mod:`yarm.cache`
+    """
+    c: YAML = config_yaml
+    key: Union[str, None] = check_key("cache", c)
+    if key:
+        schema = Map(
+            {
+                "dir": StrNotEmpty(),
+                OptionalYAML("max_size"): Int(),
+            },
+            key_validator=Slug(),
+        )
+        revalidate_yaml(c[key], schema, config_path)
+
+
+def validate_key_temp_tables(config_yaml: YAML, config_path: str):
+    """Validate config key: temp_tables.
+
+    .. literalinclude:: validate/validate_key_temp_tables.yaml
+       :language: yaml
+
+    Args:
+        config_yaml: Configuration to validate
+        config_path: Configuration file
+
+    See Also:
+        - :mod:`yarm.temp_tables`
+    """
+    c: YAML = config_yaml
+    key: Union[str, None] = check_key("temp_tables", c)
+    if key:
+        schema = MapPattern(
+            Str(),
+            Map(
+                {
+                    "sql": StrNotEmpty(),
+                    OptionalYAML("index"): Seq(StrNotEmpty()),
+                },
+                key_validator=Slug(),
+            ),
+        )
+        revalidate_yaml(c[key], schema, config_path)
+
+
 def validate_key_queries(config_yaml: YAML, config_path: str):
     """Validate config key: queries.
 
@@ -476,11 +848,25 @@ def validate_key_queries(config_yaml: YAML, config_path: str):
                     "sql": StrNotEmpty(),
                     OptionalYAML("postprocess"): StrNotEmpty(),
                     OptionalYAML("replace"): AnyYAML(),
+                    OptionalYAML("map"): AnyYAML(),
+                    OptionalYAML("params"): Seq(
+                        MapPattern(Str(), Str()) | Seq(Str())
+                    ),
+                    OptionalYAML("timeout"): AnyYAML(),
                 },
                 key_validator=Slug(),
             )
             revalidate_yaml(query, schema, config_path)
 
+            if "params" in query:
+                validate_query_params(query)
+
+            if "timeout" in query:
+                validate_timeout(query["timeout"], config_path)
+
+            if "map" in query:
+                validate_map(query["map"], config_path, f"{query['name']}: map")
+
             if "replace" in query:
                 schema = MapPattern(Str(), AnyYAML())
                 revalidate_yaml(
@@ -499,6 +885,32 @@ def validate_key_queries(config_yaml: YAML, config_path: str):
                     )
 
 
+def validate_query_params(query: YAML):
+    """Check that each set of :data:`params:` gives its query a different name.
+
+    Args:
+        query: Configuration for this query
+
+    See Also:
+        - :func:`yarm.queries.expand_query_templates`
+    """
+    s = Settings()
+    name: str = query["name"].data
+    names: List[str] = []
+    for params in query["params"].data:
+        try:
+            names.append(format_query_name(name, params))
+        except (KeyError, IndexError, ValueError) as error:
+            abort(
+                s.MSG_QUERY_PARAMS_NAME_ERROR,
+                data=name,
+                error=str(error),
+                ps=s.MSG_QUERY_PARAMS_NAME_PS,
+            )
+    if len(set(names)) < len(names):
+        abort(s.MSG_QUERY_PARAMS_NAME_ERROR, data=name, ps=s.MSG_QUERY_PARAMS_NAME_PS)
+
+
 def revalidate_yaml(
     yaml: YAML,
     schema: Union[Map, MapPattern, Seq],
@@ -542,6 +954,12 @@ def validate_config_schema(config_path: str) -> YAML:
         - :func:`validate_key_output`
         - :func:`validate_key_input`
         - :func:`validate_key_queries`
+        - :func:`validate_key_cache`
+        - :func:`validate_key_sql_functions`
+        - :func:`validate_key_postprocess_workers`
+        - :func:`validate_key_timeout`
+        - :func:`validate_key_engine`
+        - :func:`validate_key_temp_tables`
 
     """
     s = Settings()
@@ -561,6 +979,12 @@ def validate_config_schema(config_path: str) -> YAML:
             OptionalYAML("output"): EmptyNone() | AnyYAML(),
             OptionalYAML("input"): EmptyNone() | AnyYAML(),
             OptionalYAML("queries"): EmptyNone() | Seq(AnyYAML()),
+            OptionalYAML("cache"): EmptyNone() | AnyYAML(),
+            OptionalYAML("sql_functions"): EmptyNone() | AnyYAML(),
+            OptionalYAML("postprocess_workers"): AnyYAML(),
+            OptionalYAML("timeout"): AnyYAML(),
+            OptionalYAML("engine"): AnyYAML(),
+            OptionalYAML("temp_tables"): EmptyNone() | AnyYAML(),
         },
         key_validator=Slug(),
     )
@@ -574,9 +998,15 @@ def validate_config_schema(config_path: str) -> YAML:
     validate_key_tables_config(config, config_path)
     # validate_key_create_tables(c, config_path)
     validate_key_import(config, config_path)
+    validate_key_sql_functions(config, config_path)
+    validate_key_postprocess_workers(config, config_path)
+    validate_key_timeout(config, config_path)
+    validate_key_engine(config, config_path)
     validate_key_input(config, config_path)
     validate_key_output(config, config_path)
+    validate_key_temp_tables(config, config_path)
     validate_key_queries(config, config_path)
+    validate_key_cache(config, config_path)
 
     msg_with_data(s.MSG_CONFIG_FILE_VALID, config_path, verbose=2)
 
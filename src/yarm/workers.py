@@ -0,0 +1,250 @@
+"""Run postprocess functions in worker processes."""
+import multiprocessing
+import pickle  # noqa: S403
+import sys
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import cast
+
+from click import get_current_context
+from nob.nob import Nob
+from pandas.core.frame import DataFrame
+
+from yarm.helpers import abort
+from yarm.helpers import import_module_path
+from yarm.helpers import msg_with_data
+from yarm.settings import Settings
+
+
+class SharedFrame(NamedTuple):
+    """A DataFrame passed between processes through shared memory.
+
+    Only :data:`data` is pickled and sent to the other process: it holds the
+    structure of the DataFrame, plus any values that are Python objects.
+    Each column of numbers is in its own block of shared memory, which the
+    other process reads in place.
+    """
+
+    data: bytes
+    blocks: List[Tuple[str, int]]
+
+
+def get_postprocess_workers(config: Nob) -> int:
+    """Return the number of worker processes for postprocess functions.
+
+    Args:
+        config: Report configuration
+
+    Returns:
+        Value of :data:`postprocess_workers:`, or :data:`0` if not set
+    """
+    s = Settings()
+    if s.KEY_POSTPROCESS_WORKERS in config:
+        return int(config[s.KEY_POSTPROCESS_WORKERS][:])
+    return 0
+
+
+@contextmanager
+def postprocess_pool(config: Nob) -> Iterator[None]:
+    """Start worker processes for postprocess functions, if configured.
+
+    While the pool is open, :func:`run_postprocess` sends each postprocess call
+    to a worker process. Queries that run at the same time (see
+    :func:`yarm.queries.run_queries_parallel`) can then run their postprocess
+    functions at the same time, on separate CPUs.
+
+    Args:
+        config: Report configuration
+
+    Yields:
+        Nothing
+    """
+    s = Settings()
+    workers: int = get_postprocess_workers(config)
+    if not workers:
+        yield
+        return
+
+    paths: List[str] = []
+    if s.KEY_IMPORT in config:
+        modules = config[s.KEY_IMPORT]
+        paths = [modules[i][s.KEY_MODULE__PATH][:] for i, _val in enumerate(modules)]
+
+    msg_with_data(s.MSG_POSTPROCESS_WORKERS, data=str(workers), verbose=1)
+    ctx = get_current_context()
+    # NOTE Use "spawn", because forking a process that has other threads
+    # running is unsafe.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_postprocess_worker,
+        initargs=(paths,),
+    ) as pool:
+        ctx.meta[s.META_POSTPROCESS_POOL] = pool
+        try:
+            yield
+        finally:
+            del ctx.meta[s.META_POSTPROCESS_POOL]
+
+
+def init_postprocess_worker(paths: List[str]):
+    """Import the user's code in a new worker process.
+
+    Args:
+        paths: Files in :data:`import:`, in config order
+    """
+    for path in paths:
+        import_module_path(path)
+
+
+def call_postprocess(postprocess: str, df: DataFrame) -> Tuple[bool, Any]:
+    """Find a postprocess function in the user's code, and call it.
+
+    Args:
+        postprocess: Name of function
+        df: Query data
+
+    Returns:
+        Tuple :data:`(found, result)`, where :data:`found` is False if there is
+        no such function
+    """
+    s = Settings()
+    module: Any = sys.modules.get(s.IMPORT_MODULE_NAME)
+    function: Any = getattr(module, postprocess, None)
+    if function is None:
+        return False, None
+    return True, function(df)
+
+
+def run_postprocess(postprocess: str, df: DataFrame) -> Tuple[bool, Any]:
+    """Run a postprocess function, in a worker process if the pool is open.
+
+    Any error raised by the function is raised here, just as if it had run in
+    this process.
+
+    Args:
+        postprocess: Name of function
+        df: Query data
+
+    Returns:
+        Tuple :data:`(found, result)` (**see** :func:`call_postprocess`)
+
+    See Also:
+        - :func:`postprocess_pool`
+        - :func:`yarm.queries.df_query_postprocess`
+    """
+    s = Settings()
+    ctx = get_current_context()
+    pool: Optional[ProcessPoolExecutor] = ctx.meta.get(s.META_POSTPROCESS_POOL)
+    if pool is None:
+        return call_postprocess(postprocess, df)
+
+    shared, blocks = share_df(df)
+    try:
+        found, result = pool.submit(postprocess_worker, postprocess, shared).result()
+    except BrokenProcessPool as error:  # pragma: no cover
+        abort(s.MSG_POSTPROCESS_WORKER_FAILED, data=postprocess, error=str(error))
+    finally:
+        release_blocks(blocks, unlink=True)
+    if isinstance(result, SharedFrame):
+        result = load_shared_df(result, unlink=True)
+    return found, result
+
+
+def postprocess_worker(postprocess: str, shared: SharedFrame) -> Tuple[bool, Any]:
+    """Run a postprocess function in a worker process.
+
+    Args:
+        postprocess: Name of function
+        shared: Query data, in shared memory
+
+    Returns:
+        Tuple :data:`(found, result)`, with any DataFrame result in shared memory.
+        The main process frees that shared memory once it has read it.
+    """
+    found, result = call_postprocess(postprocess, load_shared_df(shared))
+    if isinstance(result, DataFrame):
+        result, blocks = share_df(result)
+        release_blocks(blocks, unlink=False)
+    return found, result
+
+
+def share_df(df: DataFrame) -> Tuple[SharedFrame, List[SharedMemory]]:
+    """Copy a DataFrame into shared memory.
+
+    Args:
+        df: Data to share
+
+    Returns:
+        Tuple :data:`(shared, blocks)`, where :data:`blocks` must be released
+        with :func:`release_blocks` once the other process has read them.
+    """
+    buffers: List[pickle.PickleBuffer] = []
+    data: bytes = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+    blocks: List[SharedMemory] = []
+    # NOTE A block may be larger than we asked for, so record each size.
+    names_sizes: List[Tuple[str, int]] = []
+    try:
+        for buffer in buffers:
+            raw = buffer.raw()
+            block = SharedMemory(create=True, size=max(raw.nbytes, 1))
+            blocks.append(block)
+            names_sizes.append((block.name, raw.nbytes))
+            cast(memoryview, block.buf)[: raw.nbytes] = raw
+    except BaseException:  # pragma: no cover
+        release_blocks(blocks, unlink=True)
+        raise
+    return SharedFrame(data, names_sizes), blocks
+
+
+def load_shared_df(shared: SharedFrame, unlink: bool = False) -> DataFrame:
+    """Load a DataFrame from shared memory, without copying its columns.
+
+    The columns of numbers are backed by the blocks of shared memory themselves.
+    Each block stays open until no DataFrame, Series or array uses it, and is
+    then closed.
+
+    Args:
+        shared: Data from :func:`share_df`
+        unlink: If True, free the shared memory once it is closed
+
+    Returns:
+        DataFrame
+    """
+    buffers: List[pickle.PickleBuffer] = []
+    for name, size in shared.blocks:
+        block = SharedMemory(name=name)
+        if unlink:
+            # Only the name goes: the memory stays until the block is closed.
+            block.unlink()
+        view: memoryview = cast(memoryview, block.buf)[:size]
+        # NOTE Every array over the block holds on to the PickleBuffer, which
+        # holds on to the view. The view releases the memory before its weak
+        # references are called, so the block can be closed then.
+        finalizer = weakref.finalize(view, release_blocks, [block], unlink=False)
+        finalizer.atexit = False
+        buffers.append(pickle.PickleBuffer(view))
+    # NOTE We only unpickle data that our own processes have just pickled.
+    return pickle.loads(shared.data, buffers=buffers)  # noqa: S301
+
+
+def release_blocks(blocks: List[SharedMemory], unlink: bool):
+    """Close blocks of shared memory.
+
+    Args:
+        blocks: Shared memory
+        unlink: If True, also free the memory (only once, in one process)
+    """
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
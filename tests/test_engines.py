@@ -0,0 +1,142 @@
+"""Test cases for engines.py."""
+# pylint: disable=redefined-outer-name
+
+import glob
+from typing import Dict
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from tests.helpers import prep_test_config
+from yarm.__main__ import cli
+from yarm.settings import Settings
+
+
+@pytest.fixture
+def runner() -> CliRunner:
+    """Fixture for invoking command-line interfaces."""
+    return CliRunner()
+
+
+def run_report(
+    runner: CliRunner, test_dir: str, engine: str
+) -> Dict[str, pd.DataFrame]:
+    """Run the report in a test directory with an engine, and read every output.
+
+    Args:
+        runner: Runner for command-line interfaces
+        test_dir: Directory in :data:`tests_data/`
+        engine: Value for :data:`engine:`
+
+    Returns:
+        Data from each sheet and CSV that the report output, by file and sheet
+    """
+    s = Settings()
+    outputs: Dict[str, pd.DataFrame] = {}
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        before = set(glob.glob("**/*", recursive=True))
+        with open(s.DEFAULT_CONFIG_FILE, "a") as f:
+            f.write(f"\nengine: {engine}\n")
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 0
+        for path in sorted(set(glob.glob("**/*", recursive=True)) - before):
+            if path.endswith(".xlsx"):
+                for sheet, df in pd.read_excel(path, sheet_name=None).items():
+                    outputs[f"{path}:{sheet}"] = df
+            elif path.endswith(".csv"):
+                outputs[path] = pd.read_csv(path)
+    return outputs
+
+
+def sort_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Sort rows by every column, since DuckDB keeps no row order without ORDER BY.
+
+    Args:
+        df: Data from one sheet or CSV
+
+    Returns:
+        Same data, in a fixed order
+    """
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize(
+    "test_dir",
+    [
+        "test_create_tables",
+        "test_queries_options",
+        "test_validate_complete_config_valid",
+        "test_validate_tables_config_valid_mwe",
+    ],
+)
+def test_engines_same_results(runner: CliRunner, test_dir: str) -> None:
+    """Reports give the same results with SQLite and DuckDB."""
+    pytest.importorskip("duckdb")
+    expected = run_report(runner, test_dir, "sqlite")
+    actual = run_report(runner, test_dir, "duckdb")
+    assert list(actual) == list(expected)
+    for key, df in expected.items():
+        pd.testing.assert_frame_equal(
+            sort_rows(actual[key]), sort_rows(df), check_dtype=False
+        )
+
+
+def test_engine_duckdb_missing(runner: CliRunner) -> None:
+    """Without duckdb installed, engine: duckdb explains how to install it."""
+    s = Settings()
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        pytest.skip("duckdb is installed")
+    with runner.isolated_filesystem():
+        prep_test_config("test_queries_options", append_config="\nengine: duckdb\n")
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_DUCKDB_MISSING in result.output
+
+
+def test_engine_duckdb_sql_functions(runner: CliRunner) -> None:
+    """sql_functions: cannot be used with engine: duckdb."""
+    s = Settings()
+    append_config: str = """
+engine: duckdb
+sql_functions:
+  - double
+"""
+    with runner.isolated_filesystem():
+        prep_test_config("test_queries_options", append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_DUCKDB_SQL_FUNCTIONS_ERROR in result.output
+
+
+def test_engine_cache(runner: CliRunner) -> None:
+    """Switching engines does not reuse results cached by the other engine."""
+    pytest.importorskip("duckdb")
+    s = Settings()
+    append_config: str = """
+  - name: half
+    sql: SELECT id / 2 AS half FROM products ORDER BY id;
+
+cache:
+  dir: cache
+"""
+    with runner.isolated_filesystem():
+        prep_test_config("test_queries_options", append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 0
+        df = pd.read_excel("output/test.xlsx", sheet_name="half")
+        # SQLite divides integers as integers.
+        assert list(df["half"]) == [0, 1, 1]
+
+        with open(s.DEFAULT_CONFIG_FILE, "a") as f:
+            f.write("\nengine: duckdb\n")
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "--explain-rerun"])
+        assert result.exit_code == 0
+        assert f"half ({s.RERUN_PARTS['engine']})" in result.output
+        df = pd.read_excel("output/test.xlsx", sheet_name="half")
+        assert list(df["half"]) == [0.5, 1.0, 1.5]
@@ -1,10 +1,24 @@
 """Test cases for export.py."""
 # pylint: disable=redefined-outer-name
 
+import gzip
+import json
+import lzma
 import os
+import sqlite3
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import cast
 
+import pandas as pd
 import pytest
 from click.testing import CliRunner
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
 
 from tests.helpers import prep_test_config
 
@@ -33,6 +47,39 @@ def test_export_database(runner: CliRunner) -> None:
         assert os.path.isfile(os.fspath("OUTPUT/BASENAME.db"))
 
 
+def test_export_database_page_size(runner: CliRunner) -> None:
+    """Database is rebuilt with a new page size, and holds the same rows."""
+    s = Settings()
+    test_dir: str = s.DEFAULT_TEST
+    export_db: str = os.fspath("OUTPUT/BASENAME.db")
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        result = runner.invoke(cli, [s.CMD_RUN, "--database"])
+        assert result.exit_code == 0
+        with sqlite3.connect(export_db) as conn:
+            dump: List[str] = list(conn.iterdump())
+
+        config = Path(s.DEFAULT_CONFIG_FILE)
+        config.write_text(
+            config.read_text().replace(
+                "  styles:", "  database_page_size: 65536\n  styles:"
+            )
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "--database", "-f", "-vv"])
+        assert result.exit_code == 0
+        assert s.MSG_DATABASE_VACUUM in result.output
+        with sqlite3.connect(export_db) as conn:
+            assert conn.execute("PRAGMA page_size").fetchone()[0] == 65536
+            assert list(conn.iterdump()) == dump
+
+        config.write_text(
+            config.read_text().replace("page_size: 65536", "page_size: 1000")
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "--database", "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_DATABASE_PAGE_SIZE_ERROR in result.output
+
+
 def test_export_tables_csv(runner: CliRunner) -> None:
     """Tables are successfully exported to csv."""
     s = Settings()
@@ -45,6 +92,215 @@ def test_export_tables_csv(runner: CliRunner) -> None:
         assert os.path.isfile(os.fspath("OUTPUT/TABLE_FROM_SPREADSHEET.csv"))
 
 
+def test_export_workers(runner: CliRunner) -> None:
+    """CSV files written in parallel match those written one at a time."""
+    s = Settings()
+    test_dir: str = s.DEFAULT_TEST
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        result = runner.invoke(cli, [s.CMD_RUN])
+        assert result.exit_code == 0
+        expected: Dict[str, str] = {
+            path.name: path.read_text() for path in Path("OUTPUT").glob("*.csv")
+        }
+        assert len(expected) > 1
+
+        config = Path(s.DEFAULT_CONFIG_FILE)
+        config.write_text(
+            config.read_text().replace("  styles:", "  export_workers: 4\n  styles:")
+        )
+        outputs: List[str] = []
+        for _ in range(2):
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv"])
+            assert result.exit_code == 0
+            assert s.MSG_EXPORT_WORKERS in result.output
+            outputs.append(result.output)
+            written: Dict[str, str] = {
+                path.name: path.read_text() for path in Path("OUTPUT").glob("*.csv")
+            }
+            assert written == expected
+        # Messages from the workers are always shown in the same order.
+        assert outputs[0] == outputs[1]
+
+        config.write_text(
+            config.read_text().replace("export_workers: 4", "export_workers: 0")
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_EXPORT_WORKERS_ERROR in result.output
+
+
+def test_export_compression(runner: CliRunner, monkeypatch: Any) -> None:
+    """Compressed CSV files hold the same text as plain CSV files."""
+    s = Settings()
+    test_dir: str = s.DEFAULT_TEST
+    # Compress each CSV in many small blocks.
+    monkeypatch.setattr(Settings, "CSV_WRITE_ROWS", 1)
+    monkeypatch.setattr(Settings, "CSV_COMPRESSION_QUEUE", 1)
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        result = runner.invoke(cli, [s.CMD_RUN])
+        assert result.exit_code == 0
+        expected: Dict[str, bytes] = {
+            path.name: path.read_bytes() for path in Path("OUTPUT").glob("*.csv")
+        }
+
+        config = Path(s.DEFAULT_CONFIG_FILE)
+        plain_config: str = config.read_text()
+        openers: List[Tuple[str, Callable[..., Any]]] = [
+            ("gzip", gzip.open),
+            ("xz", lzma.open),
+        ]
+        for compression, open_file in openers:
+            ext: str = s.COMPRESSION_EXTS[compression]
+            options: str = f"  compression: {compression}\n  compression_level: 1\n"
+            config.write_text(plain_config.replace("  styles:", f"{options}  styles:"))
+            result = runner.invoke(cli, [s.CMD_RUN])
+            assert result.exit_code == 0
+            for name, text in expected.items():
+                with open_file(f"OUTPUT/{name}{ext}") as f:
+                    assert f.read() == text
+
+        config.write_text(config.read_text().replace("level: 1", "level: 10"))
+        result = runner.invoke(cli, [s.CMD_RUN])
+        assert result.exit_code == 1
+        assert s.MSG_COMPRESSION_LEVEL_ERROR in result.output
+
+
+def set_export_format(ext: str, options: str = "") -> None:
+    """Export tables and queries to another format, with any more output options."""
+    s = Settings()
+    config = Path(s.DEFAULT_CONFIG_FILE)
+    text: str = config.read_text()
+    text = text.replace("export_tables: csv", f"export_tables: {ext}")
+    text = text.replace("export_queries: csv", f"export_queries: {ext}")
+    config.write_text(text.replace("  styles:", f"{options}  styles:"))
+
+
+@pytest.mark.parametrize("ext", ["parquet", "feather"])
+def test_export_arrow(runner: CliRunner, monkeypatch: Any, ext: str) -> None:
+    """Parquet and Feather files hold the same data as the database."""
+    pytest.importorskip("pyarrow")
+    s = Settings()
+    test_dir: str = s.DEFAULT_TEST
+    # Write each table and query in several chunks and row groups.
+    monkeypatch.setattr(Settings, "QUERY_CHUNKSIZE", 2)
+    options: str = "  stream_queries: true\n  arrow:\n    row_group_size: 2\n"
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        set_export_format(ext, options)
+        result = runner.invoke(cli, [s.CMD_RUN, "--database"])
+        assert result.exit_code == 0
+        expected: Dict[str, pd.DataFrame] = read_database_tables()
+        assert expected
+        read = pd.read_parquet if ext == "parquet" else pd.read_feather
+        for name, df in expected.items():
+            written: pd.DataFrame = read(f"OUTPUT/{name}.{ext}")
+            pd.testing.assert_frame_equal(written, df, check_dtype=False)
+
+
+@pytest.mark.parametrize("ext", ["parquet", "feather"])
+def test_export_arrow_column_types(
+    runner: CliRunner, monkeypatch: Any, ext: str
+) -> None:
+    """A column's type comes from its values, not just from the first chunk."""
+    pytest.importorskip("pyarrow")
+    s = Settings()
+    monkeypatch.setattr(Settings, "QUERY_CHUNKSIZE", 2)
+    # The first chunk has no values in 'x', and only integers in 'y'.
+    append_config: str = """
+  - name: numbers
+    sql: >
+      WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 5)
+      SELECT
+        CASE WHEN i <= 2 THEN NULL ELSE i * 1.5 END AS x,
+        CASE WHEN i <= 2 THEN i ELSE i + 0.5 END AS y
+      FROM n;
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(s.DEFAULT_TEST, append_config=append_config)
+        set_export_format(ext, "  stream_queries: true\n")
+        result = runner.invoke(cli, [s.CMD_RUN])
+        assert result.exit_code == 0
+        read = pd.read_parquet if ext == "parquet" else pd.read_feather
+        df: pd.DataFrame = read(f"OUTPUT/numbers.{ext}")
+        assert list(df["x"].fillna(0)) == [0, 0, 4.5, 6.0, 7.5]
+        assert list(df["y"]) == [1, 2, 3.5, 4.5, 5.5]
+
+
+def test_export_arrow_missing(runner: CliRunner) -> None:
+    """Without pyarrow installed, Parquet export explains how to install it."""
+    s = Settings()
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        pytest.skip("pyarrow is installed")
+    with runner.isolated_filesystem():
+        prep_test_config(s.DEFAULT_TEST)
+        set_export_format("parquet")
+        result = runner.invoke(cli, [s.CMD_RUN])
+        assert result.exit_code == 1
+        assert s.MSG_PYARROW_MISSING in result.output
+
+
+def test_export_feather_compression(runner: CliRunner) -> None:
+    """Feather files only allow the options that Feather supports."""
+    s = Settings()
+    for option, error in [
+        ("compression: snappy", s.MSG_FEATHER_COMPRESSION_ERROR),
+        ("dictionary: true", s.MSG_ARROW_DICTIONARY_ERROR),
+    ]:
+        with runner.isolated_filesystem():
+            prep_test_config(s.DEFAULT_TEST)
+            set_export_format("feather", f"  arrow:\n    {option}\n")
+            result = runner.invoke(cli, [s.CMD_RUN])
+            assert result.exit_code == 1
+            assert error in result.output
+
+
+def test_export_tables_fetch_rows(runner: CliRunner, monkeypatch: Any) -> None:
+    """Tables copied from the database in batches hold the same data."""
+    s = Settings()
+    monkeypatch.setattr(Settings, "EXPORT_FETCH_ROWS", 2)
+    with runner.isolated_filesystem():
+        prep_test_config(s.DEFAULT_TEST)
+        result = runner.invoke(cli, [s.CMD_RUN, "--database"])
+        assert result.exit_code == 0
+        expected: Dict[str, pd.DataFrame] = read_database_tables()
+        for name, df in expected.items():
+            pd.testing.assert_frame_equal(pd.read_csv(f"OUTPUT/{name}.csv"), df)
+
+        config = Path(s.DEFAULT_CONFIG_FILE)
+        plain_config: str = config.read_text()
+        for options in ["", "  xlsx_write_only: true\n"]:
+            config.write_text(plain_config)
+            set_export_format("xlsx", options)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+            assert result.exit_code == 0
+            # With sheet_name=None, every sheet is read, by name.
+            sheets = cast(
+                Dict[str, pd.DataFrame],
+                pd.read_excel(
+                    f"OUTPUT/{s.FILE_EXPORT_TABLES_BASENAME}.xlsx", sheet_name=None
+                ),
+            )
+            assert sheets
+            for name, df in sheets.items():
+                pd.testing.assert_frame_equal(df, expected[name])
+
+
+def read_database_tables() -> Dict[str, pd.DataFrame]:
+    """Read every table in the exported database into a dictionary of {name: df}."""
+    with sqlite3.connect("OUTPUT/BASENAME.db") as conn:
+        query: str = "SELECT name from sqlite_master WHERE type ='table'"
+        return {
+            name: pd.read_sql(f"SELECT * FROM [{name}]", conn)  # noqa: S608
+            for (name,) in conn.execute(query).fetchall()
+        }
+
+
 def test_export_tables_xlsx(runner: CliRunner) -> None:
     """Tables are successfully exported to xlsx."""
     s = Settings()
@@ -55,3 +311,99 @@ def test_export_tables_xlsx(runner: CliRunner) -> None:
         assert result.exit_code == 0
         assert s.MSG_TABLES_EXPORTED in result.output
         assert os.path.isfile(os.fspath(f"OUTPUT/{s.FILE_EXPORT_TABLES_BASENAME}.xlsx"))
+
+
+def test_export_manifest(runner: CliRunner) -> None:
+    """With output: manifest, outputs with the same content are left untouched."""
+    s = Settings()
+    test_dir: str = s.DEFAULT_TEST
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        for ext in ["csv", "xlsx"]:
+            set_export_format(ext, "  manifest: true\n" if ext == "csv" else "")
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-d"])
+            assert result.exit_code == 0
+            manifest = Path("OUTPUT", s.FILE_MANIFEST)
+            files: Dict[str, Any] = json.loads(manifest.read_text())["files"]
+            exported: List[str] = [name for name in files if name.endswith(ext)]
+            assert exported
+            assert all(files[name]["changed"] for name in exported)
+            assert not Path("OUTPUT", s.DIR_OUTPUT_TEMP).exists()
+            mtimes: Dict[str, int] = {
+                name: os.stat(f"OUTPUT/{name}").st_mtime_ns for name in files
+            }
+
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-d", "-vv"])
+            assert result.exit_code == 0
+            assert s.MSG_OUTPUT_UNCHANGED in result.output
+            rerun: Dict[str, Any] = json.loads(manifest.read_text())["files"]
+            assert rerun.keys() == files.keys()
+            for name, file in rerun.items():
+                assert not file["changed"]
+                assert file["sha256"] == files[name]["sha256"]
+                assert os.stat(f"OUTPUT/{name}").st_mtime_ns == mtimes[name]
+
+        # A file edited by hand is replaced, even with the same content.
+        name = next(name for name in rerun if name.endswith(".xlsx"))
+        assert isinstance(rerun[name]["rows"], dict)
+        os.utime(f"OUTPUT/{name}", ns=(0, 0))
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-d"])
+        assert result.exit_code == 0
+        files = json.loads(manifest.read_text())["files"]
+        assert files[name]["changed"]
+        assert files[name]["sha256"] == rerun[name]["sha256"]
+        assert sum(file["changed"] for file in files.values()) == 1
+
+
+def read_column_widths(filename: str) -> Dict[str, List[float]]:
+    """Read the width of each column in each sheet of a spreadsheet."""
+    workbook = load_workbook(filename)
+    return {
+        sheet.title: [
+            sheet.column_dimensions[get_column_letter(i)].width
+            for i in range(1, sheet.max_column + 1)
+        ]
+        for sheet in workbook.worksheets
+    }
+
+
+def test_export_column_width(runner: CliRunner) -> None:
+    """Columns in spreadsheets get a fixed width, or fit their values."""
+    s = Settings()
+    test_dir: str = s.DEFAULT_TEST
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        set_export_format("xlsx")
+        filename: str = f"OUTPUT/{s.FILE_EXPORT_TABLES_BASENAME}.xlsx"
+        result = runner.invoke(cli, [s.CMD_RUN])
+        assert result.exit_code == 0
+        for widths in read_column_widths(filename).values():
+            assert set(widths) == {15}
+
+        config = Path(s.DEFAULT_CONFIG_FILE)
+        config.write_text(
+            config.read_text().replace("column_width: 15", "column_width: auto")
+        )
+        outputs: List[Dict[str, List[float]]] = []
+        for options in ["", "  xlsx_write_only: true\n"]:
+            set_export_format("xlsx", options)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+            assert result.exit_code == 0
+            outputs.append(read_column_widths(filename))
+            tables = cast(
+                Dict[str, pd.DataFrame], pd.read_excel(filename, sheet_name=None)
+            )
+            for name, df in tables.items():
+                sheet_widths: List[float] = outputs[-1][name]
+                for i, column in enumerate(df.columns):
+                    assert sheet_widths[i] >= len(str(column)) + s.COLUMN_WIDTH_PADDING
+        # Small sheets are measured in full, either way.
+        assert outputs[0] == outputs[1]
+        assert len({w for widths in outputs[0].values() for w in widths}) > 1
+
+        config.write_text(
+            config.read_text().replace("column_width: auto", "column_width: 0")
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_COLUMN_WIDTH_ERROR in result.output
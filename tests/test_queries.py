@@ -1,9 +1,23 @@
 """Test cases for queries.py."""
 # pylint: disable=redefined-outer-name
 
+import gc
+import json
+import os
+import sqlite3
+import struct
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import cast
+
+import pandas as pd
 import pytest
 from click.testing import CliRunner
 
+import yarm.cache
+import yarm.queries
+import yarm.workers
 from tests.helpers import prep_test_config
 from tests.helpers import process_test_tuples
 
@@ -66,3 +80,700 @@ def test_query_error(runner: CliRunner) -> None:
         assert s.MSG_QUERY_REPLACE_MATCH_ERROR in result.output
         assert "unterminated character set at" in result.output
         assert "invalid group reference" in result.output
+
+
+def test_query_jobs(runner: CliRunner) -> None:
+    """Independent queries run in parallel, and keep their configured order."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: products_copy
+    sql: SELECT * FROM products;
+  - name: order_count
+    sql: SELECT COUNT(*) AS n FROM "Order Information";
+  - name: products_count
+    sql: SELECT COUNT(*) AS n FROM PRODUCTS_COPY;
+  - name: details_count
+    sql: SELECT COUNT(*) AS n FROM order_details;
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "--jobs", "3", "-vvv"])
+        print(result.output)
+        assert result.exit_code == 0
+        assert s.MSG_QUERY_JOBS in result.output
+        assert f"order_count: {s.MSG_QUERY_DEPENDS_ON}" in result.output
+        assert f"products_count: {s.MSG_QUERY_DEPENDS_ON}" in result.output
+        assert f"details_count: {s.MSG_QUERY_DEPENDS_ON}" not in result.output
+        # Messages for each query are not interleaved.
+        assert "POSTPROCESS FUNCTION RUNS" in result.output
+        sheets = pd.ExcelFile("output/test.xlsx").sheet_names
+        assert sheets == [
+            "Order Information",
+            "products_copy",
+            "order_count",
+            "products_count",
+            "details_count",
+        ]
+        counts = pd.read_excel("output/test.xlsx", sheet_name="products_count")
+        assert counts["n"][0] == 3
+
+    test_config: list = [
+        (1, test_dir, s.MSG_QUERY_RUN_ERROR, "query_error.yaml"),
+        (1, test_dir, s.MSG_QUERY_DUPLICATE_ERROR, "query_duplicate.yaml"),
+    ]
+    for exit_code, test_dir, message, config_file_override in test_config:
+        with runner.isolated_filesystem():
+            prep_test_config(test_dir, config_file_override=config_file_override)
+            result = runner.invoke(cli, [s.CMD_RUN, "-j", "2"])
+            assert result.exit_code == exit_code
+            assert message in result.output
+
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        result = runner.invoke(cli, [s.CMD_RUN, "-j", "0"])
+        assert result.exit_code == 1
+        assert s.MSG_JOBS_ERROR in result.output
+
+
+def test_query_jobs_wave(runner: CliRunner) -> None:
+    """A query that finishes early in a wave waits for the slower ones."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    # The slow query is still reading while the fast one finishes.
+    append_config: str = """
+  - name: fast
+    sql: SELECT * FROM products;
+  - name: slow
+    sql: |
+      SELECT pause(p.id) AS n
+      FROM products AS p, products AS q, products AS r, products AS t;
+  - name: after
+    sql: SELECT SUM(n) AS n FROM slow, fast;
+
+sql_functions:
+  - pause
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        # Every query in the first wave starts at once.
+        result = runner.invoke(cli, [s.CMD_RUN, "--jobs", "3"])
+        assert result.exit_code == 0
+        slow = pd.read_excel("output/test.xlsx", sheet_name="slow")
+        after = pd.read_excel("output/test.xlsx", sheet_name="after")
+        assert after["n"][0] == slow["n"].sum() * 3
+
+
+def test_query_cache(runner: CliRunner) -> None:
+    """Query results are reused until the SQL or the input data changes."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+cache:
+  dir: cache
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-v"])
+        assert result.exit_code == 0
+        assert s.MSG_CACHE_MISS in result.output
+        assert "POSTPROCESS FUNCTION RUNS" in result.output
+        first = pd.read_excel("output/test.xlsx", sheet_name="Order Information")
+
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-v"])
+        assert result.exit_code == 0
+        assert s.MSG_CACHE_HIT in result.output
+        assert "POSTPROCESS FUNCTION RUNS" not in result.output
+        second = pd.read_excel("output/test.xlsx", sheet_name="Order Information")
+        assert first.equals(second)
+
+        # A change to an input table invalidates the cache.
+        with open("products.csv", "a") as f:
+            f.write("1,note,changed\n")
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-v"])
+        assert result.exit_code == 0
+        assert s.MSG_CACHE_MISS in result.output
+
+        # Saving new results evicts old results beyond max_size.
+        with open(s.DEFAULT_CONFIG_FILE, "a") as f:
+            f.write("  max_size: 0\n")
+        with open("products.csv", "a") as f:
+            f.write("2,note,changed\n")
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv"])
+        assert result.exit_code == 0
+        assert s.MSG_CACHE_EVICTED in result.output
+        assert not [f for f in os.listdir("cache") if f.endswith(s.CACHE_FILE_EXT)]
+
+
+def test_stream_queries(runner: CliRunner, monkeypatch: Any) -> None:
+    """Streamed queries export the same data as queries exported together."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: products_copy
+    sql: SELECT * FROM products;
+  - name: products_none
+    sql: SELECT * FROM products_copy WHERE id > 1000;
+"""
+    # Read plain queries in several chunks.
+    monkeypatch.setattr(Settings, "QUERY_CHUNKSIZE", 2)
+    for ext in ["xlsx", "csv"]:
+        with runner.isolated_filesystem():
+            prep_test_config(test_dir, append_config=append_config)
+            with open(s.DEFAULT_CONFIG_FILE) as f:
+                config = f.read()
+            config = config.replace(
+                "basename: test", f"basename: test\n  export_queries: {ext}"
+            )
+            with open(s.DEFAULT_CONFIG_FILE, "w") as f:
+                f.write(config)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+            assert result.exit_code == 0
+            expected = read_query_output(ext)
+
+            with open(s.DEFAULT_CONFIG_FILE, "w") as f:
+                stream = "dir: output\n  stream_queries: true"
+                f.write(config.replace("dir: output", stream))
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv"])
+            assert result.exit_code == 0
+            assert s.MSG_STREAMING_QUERIES in result.output
+            assert s.MSG_QUERY_EMPTY_ERROR in result.output
+            streamed = read_query_output(ext)
+            assert list(streamed) == list(expected)
+            for name, df in expected.items():
+                assert df.equals(streamed[name])
+
+
+def test_xlsx_write_only(runner: CliRunner, monkeypatch: Any) -> None:
+    """Write-only spreadsheets hold the same data, whether streamed or not."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: products_copy
+    sql: SELECT * FROM products;
+  - name: products_none
+    sql: SELECT * FROM products_copy WHERE id > 1000;
+"""
+    # Write rows in several slices, from several chunks.
+    monkeypatch.setattr(Settings, "QUERY_CHUNKSIZE", 3)
+    monkeypatch.setattr(Settings, "XLSX_WRITE_ONLY_ROWS", 2)
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 0
+        expected = read_query_output("xlsx")
+
+        with open(s.DEFAULT_CONFIG_FILE) as f:
+            config = f.read()
+        for options in ["", "\n  stream_queries: true"]:
+            with open(s.DEFAULT_CONFIG_FILE, "w") as f:
+                write_only = f"dir: output\n  xlsx_write_only: true{options}"
+                f.write(config.replace("dir: output", write_only))
+            result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+            assert result.exit_code == 0
+            written = read_query_output("xlsx")
+            assert list(written) == list(expected)
+            for name, df in expected.items():
+                assert df.equals(written[name])
+
+
+def read_query_output(ext: str) -> Dict[str, pd.DataFrame]:
+    """Read every exported query into a dictionary of {name: df}."""
+    if ext == "xlsx":
+        # With sheet_name=None, every sheet is read, by name.
+        return cast(
+            Dict[str, pd.DataFrame], pd.read_excel("output/test.xlsx", sheet_name=None)
+        )
+    names = ["Order Information", "products_copy", "products_none"]
+    return {name: pd.read_csv(f"output/{name}.csv") for name in names}
+
+
+def test_plain_query_table(runner: CliRunner, monkeypatch: Any) -> None:
+    """Plain queries are saved inside the database, without pandas."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: products_copy
+    sql: |
+      SELECT id, name FROM products  -- no replace or postprocess
+      ;
+  - name: products_count
+    sql: SELECT COUNT(*) AS n FROM products_copy;
+  - name: products_columns
+    sql: PRAGMA table_info(products_copy);
+"""
+    saved: List[str] = []
+    save_query_to_database = yarm.queries.save_query_to_database
+
+    def spy_save_query_to_database(df: Any, conn: Any, name: str, *args: Any) -> None:
+        saved.append(name)
+        save_query_to_database(df, conn, name, *args)
+
+    monkeypatch.setattr(
+        yarm.queries, "save_query_to_database", spy_save_query_to_database
+    )
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 0
+        # Statements other than SELECT cannot follow CREATE TABLE ... AS.
+        assert saved == ["Order Information", "products_columns"]
+        sheets = pd.read_excel("output/test.xlsx", sheet_name=None)
+        assert list(sheets["products_copy"].columns) == ["id", "name"]
+        assert sheets["products_count"]["n"][0] == 3
+        assert list(sheets["products_columns"]["name"]) == ["id", "name"]
+
+
+def test_query_stats(runner: CliRunner, monkeypatch: Any) -> None:
+    """Each query's time, rows and query plan are saved as JSON."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: products_copy
+    sql: SELECT * FROM products;
+"""
+    # Every query is slow.
+    monkeypatch.setattr(Settings, "QUERY_SLOW_SECONDS", 0)
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv", "--query-stats"])
+        assert result.exit_code == 0
+        assert s.MSG_QUERY_STATS_SAVED in result.output
+        assert s.MSG_QUERY_SLOW in result.output
+        assert s.MSG_QUERY_FULL_SCAN in result.output
+        with open(f"output/test{s.FILE_QUERY_STATS_SUFFIX}") as f:
+            stats = json.load(f)["queries"]
+        assert [query["name"] for query in stats] == [
+            "Order Information",
+            "products_copy",
+        ]
+        assert [query["rows"] for query in stats] == [4, 3]
+        assert stats[0]["seconds"]["postprocess"] > 0
+        assert stats[1]["full_scans"] == ["SCAN products"]
+        assert all(query["slow"] for query in stats)
+
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert s.MSG_QUERY_STATS_SAVED not in result.output
+
+
+def test_replace_rules_in_order(runner: CliRunner) -> None:
+    """Each replace: rule applies to the results of the rules before it."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = r"""
+  - name: products_renamed
+    replace:
+      name:
+        Time: Space
+        Spa(ce): Pla\1
+        ^Re: Un
+        (VHS): DVD
+    sql: SELECT id, name FROM products ORDER BY id;
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 0
+        df = pd.read_excel("output/test.xlsx", sheet_name="products_renamed")
+        assert list(df["name"]) == [
+            "Untro Place Machine",
+            "Unplacement Crystals",
+            "D-QWON'S DANCE GROOVES (DVD)",
+        ]
+
+
+def test_map(runner: CliRunner) -> None:
+    """Values are looked up in a mapping file, for sources and queries."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: products_mapped
+    map:
+      - path: product_lines.csv
+        key: id
+        value: line
+      - path: product_lines.csv
+        key: id
+        value: line
+        to: name
+    sql: SELECT id, name FROM products ORDER BY id;
+  - name: products_source_mapped
+    sql: SELECT id, product_line FROM products ORDER BY id;
+  - name: null_key_mapped
+    map:
+      - path: product_lines.csv
+        key: id
+        value: line
+    sql: SELECT CASE WHEN id = 2 THEN NULL ELSE id END AS id FROM products ORDER BY id;
+"""
+    source_map: str = """values: value
+      map:
+        - path: product_lines.csv
+          key: id
+          value: line
+          to: product_line
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        with open(s.DEFAULT_CONFIG_FILE) as f:
+            config = f.read()
+        with open(s.DEFAULT_CONFIG_FILE, "w") as f:
+            f.write(config.replace("values: value\n", source_map, 1))
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv"])
+        assert result.exit_code == 0
+        # Each mapping file is only loaded once.
+        assert result.output.count(s.MSG_LOADING_MAP) == 1
+        sheets = pd.read_excel("output/test.xlsx", sheet_name=None)
+        df = sheets["products_mapped"]
+        assert list(df["line"].fillna("")) == ["Gadgets", "Parts", ""]
+        assert list(df["name"]) == [
+            "Gadgets",
+            "Parts",
+            "D-QWON'S DANCE GROOVES (VHS)",
+        ]
+        df = sheets["products_source_mapped"]
+        assert list(df["product_line"].fillna("")) == ["Gadgets", "Parts", ""]
+        # With a NULL, the keys are floats, but 1.0 still matches 1.
+        df = sheets["null_key_mapped"]
+        assert list(df["line"].fillna("")) == ["", "Gadgets", ""]
+
+
+def test_sql_functions(runner: CliRunner) -> None:
+    """Imported functions and aggregates, and REGEXP, can be used in SQL."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: products_sql_functions
+    sql: |
+      SELECT double(id) AS doubled, name FROM products
+      WHERE name REGEXP '^Re'
+      ORDER BY id;
+  - name: products_longest
+    sql: SELECT Longest(name) AS longest FROM products;
+
+sql_functions:
+  - double
+  - Longest
+"""
+    for jobs in ["1", "2"]:
+        with runner.isolated_filesystem():
+            prep_test_config(test_dir, append_config=append_config)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv", "-j", jobs])
+            assert result.exit_code == 0
+            assert s.MSG_REGISTERING_SQL_AGGREGATE in result.output
+            sheets = pd.read_excel("output/test.xlsx", sheet_name=None)
+            df = sheets["products_sql_functions"]
+            assert list(df["doubled"]) == [2, 4]
+            longest = sheets["products_longest"]["longest"][0]
+            assert longest == "D-QWON'S DANCE GROOVES (VHS)"
+
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config="\nsql_functions:\n  - missing\n")
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_SQL_FUNCTION_NOT_FOUND in result.output
+
+
+def test_postprocess_workers(runner: CliRunner) -> None:
+    """Postprocess functions give the same results in worker processes."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: totals
+    postprocess: add_total
+    sql: SELECT order_id, product_id FROM order_details ORDER BY order_id;
+
+postprocess_workers: 2
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-v"])
+        assert result.exit_code == 0
+        assert s.MSG_POSTPROCESS_WORKERS in result.output
+        # Queries still run one at a time without --jobs.
+        assert s.MSG_QUERY_JOBS not in result.output
+        df = pd.read_excel("output/test.xlsx", sheet_name="totals")
+        assert list(df["total"]) == list(df["order_id"] + df["product_id"])
+
+    # Errors are reported just as they are in the main process.
+    for expected_msg, config_file_override in [
+        (s.MSG_POSTPROCESS_WRONG_ARGS, "postprocess_wrong_args_1.yaml"),
+        (s.MSG_POSTPROCESS_OTHER_TYPE_ERROR, "postprocess_key_error.yaml"),
+        (s.MSG_POSTPROCESS_FUNCTION_NOT_FOUND, "postprocess_not_found.yaml"),
+    ]:
+        with runner.isolated_filesystem():
+            prep_test_config(
+                test_dir,
+                append_config="\npostprocess_workers: 2\n",
+                config_file_override=config_file_override,
+            )
+            result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+            assert result.exit_code == 1
+            assert expected_msg in result.output
+
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config="\npostprocess_workers: 0\n")
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_POSTPROCESS_WORKERS_ERROR in result.output
+
+
+def test_load_shared_df(monkeypatch: Any) -> None:
+    """A shared DataFrame is read in place, and closed once it is released."""
+    df = pd.DataFrame({"amount": [1.5, 2.5], "name": ["a", "b"]})
+    shared, blocks = yarm.workers.share_df(df)
+    closed: List[str] = []
+    release_blocks = yarm.workers.release_blocks
+
+    def spy_release_blocks(blocks: List[Any], unlink: bool) -> None:
+        closed.extend(block.name for block in blocks)
+        release_blocks(blocks, unlink)
+
+    monkeypatch.setattr(yarm.workers, "release_blocks", spy_release_blocks)
+    try:
+        loaded = yarm.workers.load_shared_df(shared)
+        pd.testing.assert_frame_equal(loaded, df)
+        # Writing to the shared memory changes the loaded data: it was not copied.
+        cast(memoryview, blocks[0].buf)[:8] = struct.pack("d", 5.0)
+        assert loaded["amount"][0] == 5.0
+        amount = loaded["amount"]
+        del loaded
+        gc.collect()
+        assert closed == []
+        del amount
+        gc.collect()
+        assert closed == [blocks[0].name]
+    finally:
+        release_blocks(blocks, unlink=True)
+
+
+def test_query_params(runner: CliRunner, monkeypatch: Any) -> None:
+    """A query template gives one query for each set of parameters."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: product {id}
+    params:
+      - id: "1"
+      - id: "3"
+    replace:
+      name:
+        Retro: Deluxe
+    sql: SELECT id, name FROM products WHERE id = :id;
+  - name: product {0} or {1}
+    params:
+      - - "1"
+        - "2"
+    sql: SELECT id FROM products WHERE id IN (?, ?) ORDER BY id;
+"""
+    executed: Dict[str, str] = {}
+    read_sql_query = yarm.queries.read_sql_query
+
+    def spy_read_sql_query(conn: Any, sql: str, name: str, *args: Any) -> Any:
+        executed[name] = sql
+        return read_sql_query(conn, sql, name, *args)
+
+    monkeypatch.setattr(yarm.queries, "read_sql_query", spy_read_sql_query)
+    for jobs in ["1", "2"]:
+        with runner.isolated_filesystem():
+            prep_test_config(test_dir, append_config=append_config)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-j", jobs])
+            assert result.exit_code == 0
+            sheets = pd.read_excel("output/test.xlsx", sheet_name=None)
+            assert list(sheets) == [
+                "Order Information",
+                "product 1",
+                "product 3",
+                "product 1 or 2",
+            ]
+            assert list(sheets["product 1"]["name"]) == ["Deluxe Time Machine"]
+            assert list(sheets["product 3"]["id"]) == [3]
+            assert list(sheets["product 1 or 2"]["id"]) == [1, 2]
+            # Every query from a template runs exactly the same SQL text.
+            assert executed["product 1"] == executed["product 3"]
+            assert "product 1 or 2" in executed
+
+    with runner.isolated_filesystem():
+        prep_test_config(
+            test_dir, append_config=append_config.replace("product {id}", "product")
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 1
+        assert s.MSG_QUERY_PARAMS_NAME_ERROR in result.output
+
+
+def test_query_timeout(runner: CliRunner, monkeypatch: Any) -> None:
+    """A runaway query is stopped at its timeout, with progress shown until then."""
+    s = Settings()
+    monkeypatch.setattr(Settings, "QUERY_PROGRESS_SECONDS", 0.05)
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: runaway
+    sql: |
+      WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+      SELECT count(*) FROM c;
+
+timeout: 0.3
+"""
+    for jobs in ["1", "2"]:
+        with runner.isolated_filesystem():
+            prep_test_config(test_dir, append_config=append_config)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-j", jobs])
+            assert result.exit_code == 1
+            assert s.MSG_QUERY_RUN_ERROR in result.output
+            assert s.MSG_QUERY_TIMED_OUT in result.output
+            assert s.MSG_QUERY_PROGRESS in result.output
+
+    # A query's own timeout overrides the global one.
+    append_config = append_config.replace("    sql: |", "    timeout: 60\n    sql: |")
+    append_config = append_config.replace("FROM c)", "FROM c WHERE x < 2000000)")
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f"])
+        assert result.exit_code == 0
+
+
+def test_temp_tables(runner: CliRunner) -> None:
+    """Temp tables are shared by queries, then dropped and never exported."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: product names
+    sql: SELECT DISTINCT name FROM order_products ORDER BY name;
+  - name: order sizes
+    sql: SELECT * FROM order_counts ORDER BY order_id;
+
+temp_tables:
+  order_products:
+    sql: |
+      SELECT od.order_id, p.id, p.name
+      FROM order_details AS od JOIN products AS p ON od.product_id = p.id;
+    index:
+      - order_id
+      - order_id, id
+  order_counts:
+    sql: SELECT order_id, count(*) AS n FROM order_products GROUP BY order_id;
+  unused:
+    sql: SELECT 1;
+"""
+    for jobs in ["1", "2"]:
+        with runner.isolated_filesystem():
+            prep_test_config(test_dir, append_config=append_config)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv", "-d", "-j", jobs])
+            assert result.exit_code == 0
+            assert s.MSG_TEMP_TABLE_UNUSED in result.output
+            assert f"{s.MSG_TEMP_TABLE_DROPPED}: order_products" in result.output
+            sheets = pd.read_excel("output/test.xlsx", sheet_name=None)
+            assert list(sheets) == ["Order Information", "product names", "order sizes"]
+            assert list(sheets["order sizes"]["n"]) == [2, 2]
+            with sqlite3.connect("output/test.db") as conn:
+                tables = [
+                    row[0]
+                    for row in conn.execute("SELECT name FROM sqlite_master")
+                ]
+            assert "order_products" not in tables
+            assert "order_counts" not in tables
+
+
+def test_release_query_tables(runner: CliRunner, monkeypatch) -> None:
+    """A query's table is dropped once it is exported and no later query needs it."""
+    s = Settings()
+    remaining: List[int] = []
+    export_queries = yarm.queries.export_queries
+
+    def spy(config, df_list):
+        export_queries(config, df_list)
+        remaining.append(len(df_list))
+
+    monkeypatch.setattr(yarm.queries, "export_queries", spy)
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: step one
+    sql: SELECT * FROM products;
+  - name: step two
+    sql: SELECT count(*) AS n FROM "step one";
+"""
+    for jobs in ["1", "2"]:
+        with runner.isolated_filesystem():
+            prep_test_config(test_dir, append_config=append_config)
+            result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv", "-j", jobs])
+            assert result.exit_code == 0
+            assert f"{s.MSG_QUERY_TABLE_DROPPED}: step one" in result.output
+            df = pd.read_excel("output/test.xlsx", sheet_name="step two")
+            assert list(df["n"]) == [3]
+            # Each DataFrame is released once it has been exported.
+            assert remaining.pop() == 0
+
+    # With --database, every query is kept.
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "-vv", "-d"])
+        assert result.exit_code == 0
+        assert s.MSG_QUERY_TABLE_DROPPED not in result.output
+        with sqlite3.connect("output/test.db") as conn:
+            tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master")]
+        assert "step one" in tables
+        assert "step two" in tables
+
+
+def test_explain_rerun(runner: CliRunner) -> None:
+    """Each query says why it runs again, or that it reuses the last results."""
+    s = Settings()
+    test_dir: str = "test_queries_options"
+    append_config: str = """
+  - name: all products
+    sql: SELECT * FROM products;
+
+cache:
+  dir: cache
+"""
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir, append_config=append_config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "--explain-rerun"])
+        assert result.exit_code == 0
+        assert f"Order Information ({s.MSG_RERUN_NEW})" in result.output
+        assert os.path.isfile(os.path.join("cache", s.FILE_RUN_STATE))
+
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "--explain-rerun"])
+        assert result.exit_code == 0
+        assert f"{s.MSG_RERUN_REUSED}: Order Information" in result.output
+        assert f"{s.MSG_RERUN_REUSED}: all products" in result.output
+
+        with open("products.csv", "a") as f:
+            f.write("1,note,changed\n")
+        with open(s.DEFAULT_CONFIG_FILE) as f:
+            config = f.read()
+        with open(s.DEFAULT_CONFIG_FILE, "w") as f:
+            f.write(config.replace("postprocess: test", "postprocess: other_type"))
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "--explain-rerun"])
+        # other_type() returns the wrong type, so this run fails.
+        assert result.exit_code == 1
+        assert s.RERUN_PARTS["postprocess"] in result.output
+        assert f"{s.MSG_RERUN_TABLE_CHANGED}: products" in result.output
+
+        # A failed run does not replace the state of the last successful run.
+        with open(s.DEFAULT_CONFIG_FILE, "w") as f:
+            f.write(config)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "--explain-rerun"])
+        assert result.exit_code == 0
+        assert f"all products ({s.MSG_RERUN_TABLE_CHANGED}: products)" in result.output
+
+    with runner.isolated_filesystem():
+        prep_test_config(test_dir)
+        result = runner.invoke(cli, [s.CMD_RUN, "-f", "--explain-rerun"])
+        assert result.exit_code == 0
+        assert s.MSG_RERUN_NO_CACHE in result.output
+
+
+def test_hash_df_extension_dtypes() -> None:
+    """Nullable and string columns can be fingerprinted, and values matter."""
+    df = pd.DataFrame(
+        {
+            "n": pd.array([1, None], dtype="Int64"),
+            "s": pd.array(["x", None], dtype="string"),
+        }
+    )
+    changed = df.copy()
+    changed.loc[0, "n"] = 2
+    assert yarm.cache.hash_df(df) == yarm.cache.hash_df(df.copy())
+    assert yarm.cache.hash_df(df) != yarm.cache.hash_df(changed)
@@ -1,6 +1,8 @@
 """Test cases for tables.py."""
 # pylint: disable=redefined-outer-name
 
+import os
+
 import pytest
 from click.testing import CliRunner
 
@@ -337,3 +339,184 @@ def test_df_empty(runner: CliRunner) -> None:
         assert s.MSG_EMPTY_DF_ORIGINAL in result.output
         # Warning, not error.
         assert result.exit_code == 0
+
+
+def test_where(runner: CliRunner) -> None:
+    """Rows are filtered with a where: expression."""
+    s = Settings()
+    test_dir: str = "test_df_tables_config_options"
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  products:
+    - path: products.csv
+      where: key == 'name' and id > 1
+  orders:
+    - path: orders.xlsx
+      sheet: Orders
+      where: id > 1000
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vvv"])
+        assert result.exit_code == 0
+        assert s.MSG_APPLYING_WHERE in result.output
+        with open("output/products.csv") as f:
+            products = f.read()
+        assert "Replacement Crystals" in products
+        assert "Retro Time Machine" not in products
+        assert "discount" not in products
+        with open("output/orders.csv") as f:
+            orders = f.read()
+        assert "1001" in orders
+        assert "1000" not in orders
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  products:
+    - path: products.csv
+      where: missing_column > 1
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vvv"])
+        assert result.exit_code == 1
+        assert s.MSG_WHERE_ERROR in result.output
+    # pandas would read index as the row numbers, not a column.
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  products:
+    - path: products.csv
+      where: index > 0
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vvv"])
+        assert result.exit_code == 1
+        assert s.MSG_WHERE_ERROR in result.output
+        assert s.MSG_WHERE_NOT_COLUMN in result.output
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  products:
+    - path: products.csv
+      where: (id * 2 - 1) % 4 == 1 and key == 'name'
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vvv"])
+        assert result.exit_code == 0
+        with open("output/products.csv") as f:
+            products = f.read()
+        assert "Retro Time Machine" in products
+        assert "Replacement Crystals" not in products
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  products:
+    - path: products.csv
+      where: id == @input_file and key != '@ is fine in a string'
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vvv"])
+        assert result.exit_code == 1
+        assert s.MSG_WHERE_UNSAFE in result.output
+    # Method calls are rejected before any data is read.
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  products:
+    - path: products.csv
+      where: id.to_csv('pwned.csv') == id
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vvv"])
+        assert result.exit_code == 1
+        assert s.MSG_WHERE_UNSAFE in result.output
+        assert "Call" in result.output
+        assert not os.path.exists("pwned.csv")
+
+
+def test_deduplicate(runner: CliRunner) -> None:
+    """Duplicate rows are removed across sources with deduplicate:."""
+    s = Settings()
+    test_dir: str = "test_df_tables_config_options"
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  snapshots:
+    - path: snapshot_a.csv
+      deduplicate: true
+    - path: snapshot_b.csv
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vv"])
+        assert result.exit_code == 0
+        assert s.MSG_DEDUPLICATE_TABLE in result.output
+        with open("output/snapshots.csv") as f:
+            rows = f.read().splitlines()
+        assert rows == [
+            "id,name,price",
+            "1,Widget,10",
+            "2,Gadget,20",
+            "3,Gizmo,30",
+            "1,Widget,11",
+        ]
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  snapshots:
+    - path: snapshot_a.csv
+    - path: snapshot_b.csv
+      deduplicate:
+        - id
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vv"])
+        assert result.exit_code == 0
+        assert s.MSG_DEDUPLICATE_TABLE_COLUMNS in result.output
+        with open("output/snapshots.csv") as f:
+            rows = f.read().splitlines()
+        assert rows == ["id,name,price", "1,Widget,10", "2,Gadget,20", "3,Gizmo,30"]
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  snapshots:
+    - path: snapshot_a.csv
+      deduplicate:
+        - missing
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vv"])
+        assert result.exit_code == 1
+        assert s.MSG_DEDUPLICATE_KEY_ERROR in result.output
+    with runner.isolated_filesystem():
+        append_config = """
+tables_config:
+  snapshots:
+    - path: snapshot_a.csv
+      deduplicate: true
+    - path: snapshot_b.csv
+      deduplicate: true
+"""
+        prep_test_config(
+            test_dir, config_file_override="minimum.yaml", append_config=append_config
+        )
+        result = runner.invoke(cli, [s.CMD_RUN, "-vv"])
+        assert result.exit_code == 1
+        assert s.MSG_DEDUPLICATE_TABLE_CONFLICT in result.output